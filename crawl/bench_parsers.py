@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Offline parser benchmarks over the cached corpus (no network)
+
+Benchmarks:
+- parse_cbck_monastery        : male detail pages (gubn=6) from the cache
+- parse_cbck_detail           : female detail pages (gubn=7) from the cache
+- extract_links_convent       : debug_pages/list_*.html       (crawl_convent_links)
+- extract_links_monastery     : debug_pages_male/list_*.html  (crawl_monastery_links)
+- reparse_monastery/_convent  : end-to-end cache read + decode + parse, as a --offline run does it
+
+Each benchmark runs --repeat times over the whole corpus; the best run gives pages/sec and the
+per-page latencies of that run give p50/p95/max. Results are compared with the stored baseline and
+the script exits 1 when a benchmark's pages/sec drops more than --threshold below it.
+Baselines are machine-specific: re-record them (--save-baseline) when the hardware changes.
+
+Usage:
+  python bench_parsers.py                       # compare with bench_baseline.json
+  python bench_parsers.py --save-baseline       # record a new baseline
+  python bench_parsers.py --only parse_cbck_monastery --repeat 5 --threshold 0.1
+  python bench_parsers.py --output bench_result.json
+"""
+from __future__ import annotations
+import argparse
+import gzip
+import json
+import os
+import pathlib
+import platform
+import re
+import statistics
+import sys
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import crawl_convent_info as convent_info
+import crawl_convent_links as convent_links
+import crawl_monastery_info as monastery_info
+import crawl_monastery_links as monastery_links
+from crawl_common import ALL_GYOGU, atomic_write, decode_body, md5, read_cache_meta
+
+HERE = pathlib.Path(__file__).resolve().parent
+DEFAULT_BASELINE = HERE / "bench_baseline.json"
+LIST_START_RE = re.compile(r"^list_start_(\d+)\.html(\.gz)?$")
+
+# ---------------------- Corpus ----------------------
+
+def load_detail_corpus(cache_dir: pathlib.Path, links_path: pathlib.Path) -> List[Tuple[str, bytes, Optional[str], Optional[str]]]:
+    """(url, raw body, content-encoding, charset) of every cached page listed in links_path."""
+    with open(links_path, "r", encoding="utf-8") as f:
+        links = json.load(f)
+    corpus = []
+    for item in links:
+        url = item["detail_url"]
+        key = md5(url)
+        body_path, legacy_path = cache_dir / f"{key}.body", cache_dir / f"{key}.html"
+        if body_path.exists():
+            meta = read_cache_meta(str(cache_dir), url)
+            corpus.append((url, body_path.read_bytes(), meta.get("content_encoding"), meta.get("charset")))
+        elif legacy_path.exists():
+            corpus.append((url, legacy_path.read_bytes(), None, "utf-8"))
+    return corpus
+
+def load_list_corpus(dump_dir: pathlib.Path, list_tmpl: str) -> List[Tuple[str, str]]:
+    """(list_url, html) of every full-list page dump (list_start_N.html, or .html.gz from --dump-all)."""
+    pages = []
+    for path in sorted(dump_dir.glob("list_start_*.html*")):
+        m = LIST_START_RE.match(path.name)
+        if m:
+            raw = gzip.decompress(path.read_bytes()) if m.group(2) else path.read_bytes()
+            pages.append((list_tmpl.format(gyogu=ALL_GYOGU, paged=10, start=int(m.group(1))), raw.decode("utf-8")))
+    return pages
+
+# ---------------------- Runner ----------------------
+
+def run_bench(fn: Callable[[Any], Any], corpus: List[Any], repeat: int) -> Dict[str, Any]:
+    best: Optional[Tuple[float, List[float]]] = None
+    for _ in range(repeat):
+        latencies = []
+        t_run = time.perf_counter()
+        for item in corpus:
+            t0 = time.perf_counter()
+            fn(item)
+            latencies.append(time.perf_counter() - t0)
+        elapsed = time.perf_counter() - t_run
+        if best is None or elapsed < best[0]:
+            best = (elapsed, latencies)
+    elapsed, latencies = best
+    latencies.sort()
+    return {
+        "pages": len(corpus),
+        "seconds": round(elapsed, 4),
+        "pages_per_sec": round(len(corpus) / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(statistics.median(latencies) * 1000, 3),
+        "p95_ms": round(latencies[int(0.95 * (len(latencies) - 1))] * 1000, 3),
+        "max_ms": round(latencies[-1] * 1000, 3),
+    }
+
+def build_benchmarks(args) -> Dict[str, Tuple[Callable[[Any], Any], List[Any]]]:
+    cache_dir = pathlib.Path(args.cache_dir)
+    male = load_detail_corpus(cache_dir, pathlib.Path(args.monastery_links))
+    female = load_detail_corpus(cache_dir, pathlib.Path(args.convent_links))
+    female_lists = load_list_corpus(pathlib.Path(args.convent_list_dir), convent_links.LIST_TMPL)
+    male_lists = load_list_corpus(pathlib.Path(args.monastery_list_dir), monastery_links.LIST_TMPL)
+
+    male_html = [(url, decode_body(body, enc, cs)) for url, body, enc, cs in male]
+    female_html = [(url, decode_body(body, enc, cs)) for url, body, enc, cs in female]
+
+    def reparse(module, parse):
+        def run(item):
+            url = item[0]
+            res = module.fetch_with_retries(url, session=None, max_retries=0, base_delay=0.0, timeout=1.0,
+                                            cache_dir=args.cache_dir, logger=module.logging.getLogger("bench"),
+                                            offline=True)
+            return parse(res.text, url)
+        return run
+
+    return {
+        "parse_cbck_monastery": (lambda it: monastery_info.parse_cbck_monastery(it[1], it[0]), male_html),
+        "parse_cbck_detail": (lambda it: convent_info.parse_cbck_detail(it[1], it[0]), female_html),
+        "extract_links_convent": (lambda it: convent_links.extract_links_from_list_page(it[1], it[0]), female_lists),
+        "extract_links_monastery": (lambda it: monastery_links.extract_links_from_list_page(it[1], it[0]), male_lists),
+        "reparse_monastery": (reparse(monastery_info, monastery_info.parse_cbck_monastery), male),
+        "reparse_convent": (reparse(convent_info, convent_info.parse_cbck_detail), female),
+    }
+
+def compare(results: Dict[str, Dict[str, Any]], baseline: Dict[str, Any], threshold: float) -> List[str]:
+    regressions = []
+    for name, res in results.items():
+        base = baseline.get("benchmarks", {}).get(name)
+        if not base or not base.get("pages_per_sec"):
+            continue
+        ratio = res["pages_per_sec"] / base["pages_per_sec"]
+        res["vs_baseline"] = round(ratio, 3)
+        if ratio < 1.0 - threshold:
+            regressions.append(f"{name}: {res['pages_per_sec']} pages/s vs baseline {base['pages_per_sec']} "
+                               f"({(1 - ratio) * 100:.1f}% slower, threshold {threshold * 100:.0f}%)")
+    return regressions
+
+# ---------------------- Main ----------------------
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Offline benchmarks for the CBCK parsers")
+    ap.add_argument("--cache-dir", default=str(HERE / "data" / "cache"), help="Cached detail pages")
+    ap.add_argument("--monastery-links", default=str(HERE / "data" / "cbck_monastery_links_all.json"))
+    ap.add_argument("--convent-links", default=str(HERE / "data" / "cbck_convent_links_all.json"))
+    ap.add_argument("--convent-list-dir", default=str(HERE / "debug_pages"), help="Female list page dumps")
+    ap.add_argument("--monastery-list-dir", default=str(HERE / "debug_pages_male"), help="Male list page dumps")
+    ap.add_argument("--repeat", type=int, default=3, help="Runs per benchmark (best run is reported)")
+    ap.add_argument("--only", nargs="+", default=None, help="Run only these benchmarks")
+    ap.add_argument("--baseline", default=str(DEFAULT_BASELINE), help="Baseline JSON path")
+    ap.add_argument("--save-baseline", action="store_true", help="Write the results as the new baseline")
+    ap.add_argument("--threshold", type=float, default=0.2,
+                    help="Allowed pages/sec drop vs baseline before failing (0.2 = 20%%)")
+    ap.add_argument("--output", default=None, help="Also write the results JSON here")
+    args = ap.parse_args()
+
+    benches = build_benchmarks(args)
+    if args.only:
+        unknown = set(args.only) - set(benches)
+        if unknown:
+            print(f"Unknown benchmarks: {sorted(unknown)} (choose from {sorted(benches)})", file=sys.stderr)
+            return 2
+        benches = {k: v for k, v in benches.items() if k in args.only}
+
+    results: Dict[str, Dict[str, Any]] = {}
+    for name, (fn, corpus) in benches.items():
+        if not corpus:
+            print(f"[SKIP] {name}: empty corpus")
+            continue
+        fn(corpus[0])  # warm-up (imports, regex compilation, caches)
+        results[name] = run_bench(fn, corpus, args.repeat)
+        r = results[name]
+        print(f"[BENCH] {name:<24} pages={r['pages']:<4} {r['pages_per_sec']:>8.1f} pages/s  "
+              f"p50={r['p50_ms']:.2f}ms p95={r['p95_ms']:.2f}ms max={r['max_ms']:.2f}ms")
+
+    report = {
+        "recorded_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "machine": f"{platform.system()} {platform.machine()} cpus={os.cpu_count()}",
+        "repeat": args.repeat,
+        "benchmarks": results,
+    }
+
+    status = 0
+    if args.save_baseline:
+        with atomic_write(args.baseline) as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"Baseline saved -> {args.baseline}")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        for line in regressions:
+            print(f"[REGRESSION] {line}")
+        if regressions:
+            status = 1
+        else:
+            print(f"No regressions beyond {args.threshold * 100:.0f}% vs {args.baseline} ({baseline.get('machine')})")
+    else:
+        print(f"No baseline at {args.baseline}; run with --save-baseline to record one")
+
+    if args.output:
+        with atomic_write(args.output) as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    return status
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,1967 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Shared helpers for the CBCK crawlers (crawl_*_links.py / crawl_*_info.py).
+
+- Queue-based logging (QueueHandler/QueueListener), --log-level / --log-json
+- Per-stage timing histograms + counters → metrics.json / metrics.prom
+- --profile cpu|mem: per-stage cProfile dumps / tracemalloc snapshots + summary
+- Per-diocese (gyogu) counts of a SearchList page, for partitioned link discovery
+- SearchList page-size (paged=) negotiation, cached per category
+- Tree-free scan of a SearchList page's '#Category_SearchList' anchors (link extraction fast path)
+- Hedged requests (duplicate after the observed p95, capped by a budget) for tail latency
+- Detail page fetch with retries and a disk cache (raw bytes + meta sidecar, lazy decode), negative cache,
+  cache warming (--mode prefetch) and coverage (--mode coverage)
+- Compressed ring buffer of recent list pages, written out only on anomalies (or --dump-all)
+- URL key normalization + stable sharding (--shard i/N), site slug of a detail page
+- Deterministic merge of per-shard / per-worker outputs (--mode merge)
+- Incremental reads of success/delta jsonl (byte offsets) for the index/export stages
+- SQLite-backed durable work queue with leases (--frontier)
+- Streaming field coverage / provenance statistics per run, with alerts against the previous run
+- Staleness-priority ordering of refresh runs from per-URL fetch history (--refresh, --budget, --deadline)
+- Bounded submission window + in-flight body byte budget; success.json streamed from jsonl
+- Background batched jsonl writer (fsync checkpoints) and atomic temp-file + rename outputs
+"""
+from __future__ import annotations
+import argparse
+import atexit
+import bisect
+import collections
+import concurrent.futures as cf
+import cProfile
+import email.utils
+import html as htmllib
+import glob
+import gzip
+import hashlib
+import io
+import json
+import logging
+import logging.handlers
+import math
+import os
+import pstats
+import queue
+import random
+import re
+import sqlite3
+import threading
+import time
+import tracemalloc
+import zlib
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+from urllib.parse import parse_qs, parse_qsl, urlencode, urlparse, urlunparse
+
+import requests
+import urllib3
+from bs4 import BeautifulSoup
+from requests.compat import chardet
+
+try:  # optional: lets the server send brotli-compressed pages
+    import brotli
+except ImportError:
+    brotli = None
+
+try:  # optional: faster record serialization in JsonlWriter
+    import orjson
+except ImportError:
+    orjson = None
+
+# ---------------------- Logging ----------------------
+
+LOG_LEVELS = ("DEBUG", "INFO", "WARNING", "ERROR")
+
+class JsonLogFormatter(logging.Formatter):
+    """One JSON object per line: ts, level, logger, msg (+ exc)."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        out = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "thread": record.threadName,
+            "msg": record.getMessage(),
+        }
+        if record.exc_info:
+            out["exc"] = self.formatException(record.exc_info)
+        return json.dumps(out, ensure_ascii=False)
+
+class LazyFileHandler(logging.FileHandler):
+    """FileHandler that creates its directory and file on the first record, so an import that sets one up leaves nothing behind."""
+
+    def __init__(self, filename: Union[str, "os.PathLike[str]"], encoding: str = "utf-8"):
+        super().__init__(filename, encoding=encoding, delay=True)
+
+    def _open(self):
+        os.makedirs(os.path.dirname(self.baseFilename), exist_ok=True)
+        return super()._open()
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """Enqueue the record as is; message formatting happens on the listener thread."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+def attach_queue_logging(logger: logging.Logger, handlers: List[logging.Handler],
+                         level: str = "INFO") -> logging.handlers.QueueListener:
+    """
+    Replace logger's handlers with a single queue handler; `handlers` run on a QueueListener thread
+    (stopped and drained at exit). Records below `level` are dropped before any formatting.
+    Log calls must pass %-style args, not f-strings, for the deferral to pay off.
+    """
+    logger.handlers.clear()
+    logger.setLevel(level)
+    logger.propagate = False
+    q: "queue.Queue[logging.LogRecord]" = queue.Queue()
+    listener = logging.handlers.QueueListener(q, *handlers, respect_handler_level=True)
+    logger.addHandler(_DeferredQueueHandler(q))
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
+
+def detach_queue_logging(listener: logging.handlers.QueueListener) -> None:
+    """Drain and stop a listener from attach_queue_logging() and close its handlers (before attaching new ones)."""
+    atexit.unregister(listener.stop)
+    listener.stop()
+    for h in listener.handlers:
+        h.close()
+
+def use_json_file_logs(listener: logging.handlers.QueueListener) -> None:
+    """Switch the file handlers behind a queue listener to JSON lines (console stays human-readable)."""
+    for h in listener.handlers:
+        if isinstance(h, logging.FileHandler):
+            h.setFormatter(JsonLogFormatter())
+
+# ---------------------- Metrics ----------------------
+
+# Histogram bucket upper bounds in seconds: 10 µs × 1.25^i (… ~150 s); quantiles are read off these
+# bounds, so p50/p95/p99 are accurate to one bucket (≤ 25%) while memory stays constant per stage.
+METRIC_BUCKETS = tuple(0.00001 * 1.25 ** i for i in range(74))
+PROM_BUCKETS = METRIC_BUCKETS[::4]
+
+class _Histogram:
+    __slots__ = ("counts", "count", "sum", "max")
+
+    def __init__(self) -> None:
+        self.counts = [0] * (len(METRIC_BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(METRIC_BUCKETS, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> float:
+        target = q * self.count
+        cum = 0
+        for i, c in enumerate(self.counts):
+            cum += c
+            if c and cum >= target:
+                return min(METRIC_BUCKETS[i], self.max) if i < len(METRIC_BUCKETS) else self.max
+        return 0.0
+
+    def cumulative(self, bound: float) -> int:
+        return sum(self.counts[: bisect.bisect_right(METRIC_BUCKETS, bound)])
+
+class Metrics:
+    """
+    Thread-safe per-stage timings (histograms) and counters for one run.
+    Stages used by the info parsers: queue_wait, rate_limit_wait, backoff_wait, cache_read, fetch,
+    fetch_ttfb, fetch_body, cache_write, decode, parse, write.
+    """
+
+    def __init__(self) -> None:
+        self.started = time.time()
+        self._hists: Dict[str, _Histogram] = {}
+        self._counters: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            h = self._hists.get(stage)
+            if h is None:
+                h = self._hists[stage] = _Histogram()
+            h.observe(seconds)
+
+    def add(self, counter: str, n: float = 1) -> None:
+        with self._lock:
+            self._counters[counter] = self._counters.get(counter, 0) + n
+
+    @contextmanager
+    def timer(self, stage: str) -> Iterator[None]:
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - t0)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            stages = {
+                name: {
+                    "count": h.count,
+                    "sum": round(h.sum, 6),
+                    "mean": round(h.sum / h.count, 6) if h.count else 0.0,
+                    "p50": round(h.quantile(0.50), 6),
+                    "p95": round(h.quantile(0.95), 6),
+                    "p99": round(h.quantile(0.99), 6),
+                    "max": round(h.max, 6),
+                }
+                for name, h in sorted(self._hists.items())
+            }
+            counters = dict(sorted(self._counters.items()))
+        hits = counters.get("cache_hits", 0)
+        lookups = hits + counters.get("network_fetches", 0)
+        return {
+            "started_at": self.started,
+            "elapsed_seconds": round(time.time() - self.started, 3),
+            "stages": stages,
+            "counters": counters,
+            "cache_hit_ratio": round(hits / lookups, 4) if lookups else None,
+        }
+
+    def to_prometheus(self, namespace: str = "cbck") -> str:
+        lines = [
+            f"# HELP {namespace}_stage_seconds Time spent per crawl stage.",
+            f"# TYPE {namespace}_stage_seconds histogram",
+        ]
+        with self._lock:
+            for name, h in sorted(self._hists.items()):
+                for bound in PROM_BUCKETS:
+                    lines.append(f'{namespace}_stage_seconds_bucket{{stage="{name}",le="{bound:.6g}"}} {h.cumulative(bound)}')
+                lines.append(f'{namespace}_stage_seconds_bucket{{stage="{name}",le="+Inf"}} {h.count}')
+                lines.append(f'{namespace}_stage_seconds_sum{{stage="{name}"}} {h.sum:.6f}')
+                lines.append(f'{namespace}_stage_seconds_count{{stage="{name}"}} {h.count}')
+            for name, value in sorted(self._counters.items()):
+                metric = f"{namespace}_{re.sub(r'[^a-zA-Z0-9_]', '_', name)}_total"
+                lines.append(f"# TYPE {metric} counter")
+                lines.append(f"{metric} {int(value) if float(value).is_integer() else value}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, out_dir: str) -> Tuple[str, str]:
+        """Write <out_dir>/metrics.json and <out_dir>/metrics.prom (Prometheus text format)."""
+        json_path = os.path.join(out_dir, "metrics.json")
+        prom_path = os.path.join(out_dir, "metrics.prom")
+        with atomic_write(json_path) as f:
+            json.dump(self.snapshot(), f, ensure_ascii=False, indent=2)
+        with atomic_write(prom_path) as f:
+            f.write(self.to_prometheus())
+        return json_path, prom_path
+
+    def summary(self, stages: Iterable[str] = ("queue_wait", "fetch", "decode", "parse", "write")) -> str:
+        snap = self.snapshot()["stages"]
+        parts = [f"{s} p50={snap[s]['p50'] * 1000:.1f}ms p95={snap[s]['p95'] * 1000:.1f}ms"
+                 for s in stages if s in snap]
+        return " | ".join(parts)
+
+class _NullMetrics(Metrics):
+    """Drop-in no-op used when a caller passes metrics=None."""
+
+    def observe(self, stage: str, seconds: float) -> None:
+        pass
+
+    def add(self, counter: str, n: float = 1) -> None:
+        pass
+
+NULL_METRICS = _NullMetrics()
+
+# ---------------------- Profiling (--profile cpu|mem) ----------------------
+
+class Profiler:
+    """
+    --profile cpu: one cProfile.Profile per (thread, stage), merged per stage at the end into
+                   <out_dir>/profile/cpu_<stage>.pstats (open with `python -m pstats`).
+    --profile mem: tracemalloc from start() to finish(); writes the end snapshot, the growth vs the
+                   start snapshot and the top allocation sites inside `focus` modules (the parsers).
+    Both modes write <out_dir>/profile/summary.txt and return its text. mode=None: every call is a no-op.
+    """
+
+    def __init__(self, mode: Optional[str], out_dir: str, top: int = 25, focus: Iterable[str] = ()):
+        self.mode = mode
+        self.dir = os.path.join(out_dir, "profile")
+        self.top = top
+        self.focus = tuple(focus)
+        self._local = threading.local()
+        self._profiles: Dict[str, List[cProfile.Profile]] = {}
+        self._lock = threading.Lock()
+        self._mem_start: Optional[tracemalloc.Snapshot] = None
+
+    def start(self) -> None:
+        if self.mode == "mem":
+            tracemalloc.start(25)
+            self._mem_start = tracemalloc.take_snapshot()
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        if self.mode != "cpu":
+            yield
+            return
+        profiles = getattr(self._local, "profiles", None)
+        if profiles is None:
+            profiles = self._local.profiles = {}
+        prof = profiles.get(name)
+        if prof is None:
+            prof = profiles[name] = cProfile.Profile()
+            with self._lock:
+                self._profiles.setdefault(name, []).append(prof)
+        prof.enable()
+        try:
+            yield
+        finally:
+            prof.disable()
+
+    def finish(self) -> str:
+        if not self.mode:
+            return ""
+        os.makedirs(self.dir, exist_ok=True)
+        text = self._finish_cpu() if self.mode == "cpu" else self._finish_mem()
+        with atomic_write(os.path.join(self.dir, "summary.txt")) as f:
+            f.write(text)
+        return text
+
+    def _finish_cpu(self) -> str:
+        out = []
+        for name, profiles in sorted(self._profiles.items()):
+            stats = pstats.Stats(profiles[0])
+            for p in profiles[1:]:
+                stats.add(p)
+            path = os.path.join(self.dir, f"cpu_{name}.pstats")
+            stats.dump_stats(path)
+            buf = io.StringIO()
+            stats.stream = buf
+            stats.sort_stats("cumulative").print_stats(self.top)
+            out.append(f"===== stage={name} threads={len(profiles)} -> {path}\n{buf.getvalue()}")
+        return "\n".join(out)
+
+    def _finish_mem(self) -> str:
+        current, peak = tracemalloc.get_traced_memory()
+        end = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+        end.dump(os.path.join(self.dir, "mem_end.tracemalloc"))
+        noise = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, "<frozen importlib._bootstrap*>")]
+        end = end.filter_traces(noise)
+        out = [f"traced memory: current={current / 1e6:.1f} MB peak={peak / 1e6:.1f} MB", "",
+               f"== top {self.top} allocation sites (innermost frame)"]
+        out += [str(s) for s in end.statistics("lineno")[: self.top]]
+        if self._mem_start is not None:
+            out += ["", f"== top {self.top} growth since start"]
+            out += [str(s) for s in end.compare_to(self._mem_start.filter_traces(noise), "lineno")[: self.top]]
+        if self.focus:
+            # attribute each allocation to the innermost frame inside the focus modules (e.g. the parser line
+            # that built the soup), so bs4/re internals show up under the parser code that triggered them
+            sites: Dict[str, List[int]] = {}
+            for trace in end.traces:
+                for frame in trace.traceback:
+                    if frame.filename.endswith(self.focus):
+                        key = f"{os.path.basename(frame.filename)}:{frame.lineno}"
+                        acc = sites.setdefault(key, [0, 0])
+                        acc[0] += trace.size
+                        acc[1] += 1
+                        break
+            out += ["", f"== top {self.top} allocations attributed to {', '.join(self.focus)}"]
+            for key, (size, count) in sorted(sites.items(), key=lambda kv: -kv[1][0])[: self.top]:
+                out.append(f"{key}: size={size / 1024:.1f} KiB, count={count}")
+        return "\n".join(out) + "\n"
+
+NULL_PROFILER = Profiler(None, "")
+
+# ---------------------- Diocese partitions ----------------------
+
+ALL_GYOGU = "all"
+OTHER_GYOGU = "999999999"  # '기타': detail URLs of these items carry an empty gyogu
+COUNT_RE = re.compile(r"\[(\d+)\]")
+
+def parse_diocese_counts(html: str) -> List[Dict[str, Any]]:
+    """
+    Read the '#Category_LeftCategory' block of a SearchList page:
+    '전체 [504]', '서울대교구 [65]', …, '기타 [2]' → [{"gyogu", "name", "count"}, …] (전체 = gyogu 'all').
+    """
+    soup = BeautifulSoup(html, "html.parser")
+    out: List[Dict[str, Any]] = []
+    for div in soup.select("#Category_LeftCategory div.today1"):
+        a = div.find("a", href=True)
+        m = COUNT_RE.search(div.get_text(" ", strip=True))
+        if not a or not m:
+            continue
+        gyogu = (parse_qs(urlparse(a["href"]).query).get("gyogu", [""])[0] or "").strip()
+        out.append({"gyogu": gyogu, "name": a.get_text(strip=True), "count": int(m.group(1))})
+    return out
+
+def partition_of(detail_url: str) -> str:
+    """gyogu partition a detail URL belongs to (empty gyogu → '기타')."""
+    gyogu = parse_qs(urlparse(detail_url).query).get("gyogu", [""])[0]
+    return gyogu or OTHER_GYOGU
+
+def partition_counts(items: List[Dict[str, Any]]) -> Dict[str, int]:
+    counts: Dict[str, int] = {}
+    for it in items:
+        g = partition_of(it["detail_url"])
+        counts[g] = counts.get(g, 0) + 1
+    return counts
+
+def link_diff(previous: List[Dict[str, Any]], current: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Link-level diff keyed by normalized detail URL."""
+    prev = {normalize_url_key(it["detail_url"]): it for it in previous}
+    cur = {normalize_url_key(it["detail_url"]): it for it in current}
+    return {
+        "previous_total": len(prev),
+        "current_total": len(cur),
+        "added": [cur[k] for k in cur if k not in prev],
+        "removed": [prev[k] for k in prev if k not in cur],
+        "unchanged": sum(1 for k in cur if k in prev),
+    }
+
+# ---------------------- List page size ----------------------
+
+DEFAULT_PAGE_SIZE = 10  # what the site's own pager uses
+PAGE_SIZE_CANDIDATES = (100, 50, 20)
+PAGE_SIZE_MAX_AGE = 7 * 24 * 3600
+
+def probe_page_size(fetch_links: Callable[[int, int], List[str]], total: Optional[int],
+                    candidates: Iterable[int] = PAGE_SIZE_CANDIDATES,
+                    logger: Optional[logging.Logger] = None) -> Dict[str, Any]:
+    """
+    Largest `paged` the server honours. fetch_links(paged, start) → detail URLs of that list page.
+    A candidate P passes when its first page holds exactly min(P, total) links and starts with the
+    paged=10 first page (same links, same order), and — when there is a second page — its page at
+    start=P+1 starts with the paged=10 page at the same offset (start is an item offset).
+    Any error rejects the candidate; the result falls back to DEFAULT_PAGE_SIZE.
+    → {"paged", "requests", "tried": [{"paged", "ok"}, …]}
+    """
+    logger = logger or logging.getLogger(__name__)
+    result: Dict[str, Any] = {"paged": DEFAULT_PAGE_SIZE, "requests": 1, "tried": []}
+    base = fetch_links(DEFAULT_PAGE_SIZE, 1)
+    if not base or total is None:
+        return result
+    for size in sorted((c for c in candidates if c > DEFAULT_PAGE_SIZE), reverse=True):
+        try:
+            first = fetch_links(size, 1)
+            result["requests"] += 1
+            ok = len(first) == min(size, total) and first[:len(base)] == base
+            if ok and total > size:
+                ref, second = fetch_links(DEFAULT_PAGE_SIZE, size + 1), fetch_links(size, size + 1)
+                result["requests"] += 2
+                ok = bool(ref) and second[:len(ref)] == ref
+        except Exception as e:
+            logger.warning("page size probe paged=%s failed: %s", size, e)
+            ok = False
+        result["tried"].append({"paged": size, "ok": ok})
+        if ok:
+            result["paged"] = size
+            break
+    return result
+
+def cached_page_size(cache_path: str, category: str, max_age: float = PAGE_SIZE_MAX_AGE) -> Optional[int]:
+    """Negotiated page size of `category` from the cache file, unless missing or older than max_age."""
+    try:
+        with open(cache_path, "r", encoding="utf-8") as f:
+            entry = json.load(f).get(category)
+    except (OSError, ValueError):
+        return None
+    if not entry or time.time() - entry.get("probed_at", 0) > max_age:
+        return None
+    return int(entry["paged"])
+
+def store_page_size(cache_path: str, category: str, probe: Dict[str, Any]) -> None:
+    try:
+        with open(cache_path, "r", encoding="utf-8") as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        cache = {}
+    cache[category] = {"paged": probe["paged"], "tried": probe["tried"], "probed_at": int(time.time())}
+    with atomic_write(cache_path) as f:
+        json.dump(cache, f, ensure_ascii=False, indent=2)
+
+def list_requests(count: int, paged: int) -> int:
+    """List pages needed for `count` items at `paged` per page (at least one)."""
+    return max(1, math.ceil(count / paged))
+
+# ---------------------- List pages (fast path) ----------------------
+
+DIV_TAG_RE = re.compile(r"<(/?)div\b[^>]*>", re.I)
+ANCHOR_RE = re.compile(r"<a\b([^>]*)>(.*?)</a\s*>", re.I | re.S)
+ATTR_RE = re.compile(r"""([^\s=/>]+)\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s>]+))""")
+TAG_RE = re.compile(r"<[^>]*>")
+
+def scoped_html(html: str, element_id: str) -> Optional[str]:
+    """
+    Inner HTML of the <div id=element_id> block, found by a forward scan of div open/close tags
+    (no tree is built). None when the id is absent or the block is never closed.
+    """
+    m = re.search(r"<div\b[^>]*\bid\s*=\s*[\"']?%s[\"'\s>]" % re.escape(element_id), html, re.I)
+    if not m:
+        return None
+    start = html.index(">", m.start()) + 1
+    depth = 1
+    for tag in DIV_TAG_RE.finditer(html, start):
+        depth += -1 if tag.group(1) else 1
+        if depth == 0:
+            return html[start:tag.start()]
+    return None
+
+def iter_anchors(fragment: str) -> Iterator[Tuple[str, Dict[str, str]]]:
+    """
+    (text, attrs) of every <a> in an HTML fragment. text matches soup's get_text(" ", strip=True);
+    attribute names are lower-cased and values entity-decoded, as html.parser does.
+    """
+    for m in ANCHOR_RE.finditer(fragment):
+        attrs = {}
+        for name, dq, sq, bare in ATTR_RE.findall(m.group(1)):
+            attrs.setdefault(name.lower(), htmllib.unescape(dq or sq or bare))
+        pieces = (htmllib.unescape(p).strip() for p in TAG_RE.split(m.group(2)))
+        yield " ".join(p for p in pieces if p), attrs
+
+# ---------------------- Debug capture ----------------------
+
+ELEMENT_ID_RE = re.compile(r"""\bid\s*=\s*["']([^"']+)["']""", re.I)
+
+def page_structure(html: str) -> str:
+    """Structure signature of a page: hash of its sorted element ids (content-independent)."""
+    ids = sorted(set(ELEMENT_ID_RE.findall(html)))
+    return hashlib.sha1("\n".join(ids).encode("utf-8")).hexdigest()[:12]
+
+class DebugCapture:
+    """
+    Keeps the last `keep` pages gzip-compressed in memory instead of dumping every page.
+    anomaly() writes the ring (the pages that led up to it) to <dump_dir>/<key>.html.gz and appends
+    a line to <dump_dir>/anomalies.jsonl. record() raises one itself when a page's structure signature
+    differs from the first page of the run. dump_all=True writes every page as it is recorded.
+    Thread-safe (partitions record from several threads).
+    """
+
+    def __init__(self, dump_dir: str, keep: int = 8, dump_all: bool = False,
+                 logger: Optional[logging.Logger] = None):
+        self.dump_dir = dump_dir
+        self.dump_all = dump_all
+        self.logger = logger or logging.getLogger(__name__)
+        self.anomalies = 0
+        self._ring: "collections.deque[Tuple[str, str, bytes]]" = collections.deque(maxlen=max(1, keep))
+        self._structure: Optional[str] = None
+        self._lock = threading.Lock()
+
+    def record(self, key: str, url: str, html: str) -> None:
+        blob = gzip.compress(html.encode("utf-8"), compresslevel=6)
+        structure = page_structure(html)
+        with self._lock:
+            self._ring.append((key, url, blob))
+            baseline, self._structure = self._structure, self._structure or structure
+            if self.dump_all:
+                self._persist([(key, url, blob)])
+        if baseline and structure != baseline:
+            self.anomaly("structure_changed", key, url, detail=f"{baseline} -> {structure}")
+
+    def anomaly(self, reason: str, key: str, url: str, html: Optional[str] = None, detail: str = "") -> None:
+        """Persist the ring (plus `html`, e.g. an error body, when given) and log the anomaly."""
+        with self._lock:
+            pages = list(self._ring)
+            if html is not None:
+                pages.append((f"{key}_{reason}", url, gzip.compress(html.encode("utf-8"), compresslevel=6)))
+            files = self._persist(pages)
+            self.anomalies += 1
+            with open(os.path.join(self.dump_dir, "anomalies.jsonl"), "a", encoding="utf-8") as f:
+                f.write(json.dumps({"time": time.strftime("%Y-%m-%dT%H:%M:%S"), "reason": reason, "key": key,
+                                    "url": url, "detail": detail, "files": files}, ensure_ascii=False) + "\n")
+        self.logger.warning("debug capture: %s at %s (%s) -> %s pages in %s", reason, key, detail or url,
+                            len(files), self.dump_dir)
+
+    def _persist(self, pages: List[Tuple[str, str, bytes]]) -> List[str]:
+        os.makedirs(self.dump_dir, exist_ok=True)
+        files = []
+        for key, _url, blob in pages:
+            name = f"{key}.html.gz"
+            with open(os.path.join(self.dump_dir, name), "wb") as f:
+                f.write(blob)
+            files.append(name)
+        return files
+
+# ---------------------- HTTP helpers ----------------------
+
+def parse_retry_after(value: Optional[str], cap: float = 300.0) -> float:
+    """Seconds from a Retry-After header (delta-seconds or HTTP-date); 0 when absent/invalid, capped at `cap`."""
+    if not value:
+        return 0.0
+    value = value.strip()
+    if value.isdigit():
+        return min(float(value), cap)
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return 0.0
+    return min(max(0.0, when.timestamp() - time.time()), cap)
+
+RETRYABLE_STATUSES = frozenset({408, 429, 500, 502, 503, 504})
+
+def backoff_delay(attempt: int, base_delay: float, retry_after: float = 0.0) -> float:
+    """Sleep before retry `attempt` (0-based): exponential with jitter, never shorter than Retry-After."""
+    return max(base_delay * (2 ** attempt) + random.uniform(0, 0.5), retry_after)
+
+# ---------------------- Hedged requests ----------------------
+
+class HedgeCancelled(Exception):
+    """Raised in an attempt that lost the race (its response was closed under it)."""
+
+class HedgeAttempt:
+    """Per-attempt handle: register cleanup with on_cancel() (e.g. resp.close), call check() after blocking I/O."""
+
+    def __init__(self, hedge: bool = False):
+        self.hedge = hedge
+        self.cancelled = False
+        self._callbacks: List[Callable[[], Any]] = []
+        self._lock = threading.Lock()
+
+    def on_cancel(self, callback: Callable[[], Any]) -> None:
+        with self._lock:
+            if not self.cancelled:
+                self._callbacks.append(callback)
+                return
+        callback()  # lost while connecting: clean up right away
+
+    def check(self) -> None:
+        if self.cancelled:
+            raise HedgeCancelled()
+
+    def cancel(self) -> None:
+        with self._lock:
+            self.cancelled = True
+            callbacks, self._callbacks = self._callbacks, []
+        for cb in callbacks:
+            try:
+                cb()
+            except Exception:
+                pass
+
+class HedgePolicy:
+    """
+    Hedged requests. call(fn) runs fn(attempt); if it has not finished after the observed `quantile`
+    latency, one duplicate starts and the first to succeed wins. The loser is cancelled: its response
+    is closed, and one still connecting runs out its connect timeout in the background.
+    Duplicates are capped at `budget` x calls so far. There is no hedging until `min_samples`
+    latencies are in. The latencies recorded are what callers saw, so the trigger follows the hedged
+    distribution.
+    """
+
+    def __init__(self, budget: float = 0.05, quantile: float = 0.95, min_samples: int = 20, max_workers: int = 8,
+                 metrics: Optional[Metrics] = None):
+        self.budget = budget
+        self.quantile = quantile
+        self.min_samples = min_samples
+        self.metrics = metrics or NULL_METRICS
+        self.calls = 0
+        self.hedges = 0
+        self._hist = _Histogram()
+        self._lock = threading.Lock()
+        self._executor = cf.ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="hedge")
+
+    def delay(self) -> Optional[float]:
+        """Current hedge trigger (seconds), None while warming up."""
+        with self._lock:
+            if self._hist.count < self.min_samples:
+                return None
+            return self._hist.quantile(self.quantile)
+
+    def call(self, fn: Callable[[HedgeAttempt], Any]) -> Any:
+        t0 = time.perf_counter()
+        with self._lock:
+            self.calls += 1
+        delay = self.delay()
+        if delay is None:
+            result = fn(HedgeAttempt())
+            self._observe(time.perf_counter() - t0)
+            return result
+
+        primary = HedgeAttempt()
+        attempts = {self._executor.submit(fn, primary): primary}
+        done, _ = cf.wait(attempts, timeout=delay)
+        if not done:
+            if self._take_budget():
+                hedge = HedgeAttempt(hedge=True)
+                attempts[self._executor.submit(fn, hedge)] = hedge
+                self.metrics.add("hedges_sent")
+            else:
+                self.metrics.add("hedges_over_budget")
+
+        pending, error = set(attempts), None
+        while pending:
+            done, pending = cf.wait(pending, return_when=cf.FIRST_COMPLETED)
+            for fut in done:
+                if fut.exception() is None:
+                    for other in pending:
+                        attempts[other].cancel()
+                    if attempts[fut].hedge:
+                        self.metrics.add("hedge_wins")
+                    self._observe(time.perf_counter() - t0)
+                    return fut.result()
+                if error is None or not attempts[fut].hedge:
+                    error = fut.exception()  # the primary's error wins when both fail
+        raise error
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False)
+
+    def _take_budget(self) -> bool:
+        with self._lock:
+            if self.hedges + 1 > self.budget * self.calls:
+                return False
+            self.hedges += 1
+            return True
+
+    def _observe(self, seconds: float) -> None:
+        with self._lock:
+            self._hist.observe(seconds)
+
+# ---------------------- Detail pages: fetch + disk cache ----------------------
+#
+# <cache_dir>/<md5(url)>.body       raw response bytes as sent (possibly gzip/br compressed)
+# <cache_dir>/<md5(url)>.meta.json  status, headers, content-encoding, charset
+# <cache_dir>/<md5(url)>.html       legacy decoded UTF-8 entries, still read on cache hits
+# <cache_dir>/<md5(url)>.neg.json   negative cache of permanent fetch/parse failures
+
+def md5(s: str) -> str:
+    return hashlib.md5(s.encode("utf-8")).hexdigest()
+
+def extract_ids_from_url(url: str) -> Dict[str, str]:
+    """Extract interesting query params like 'code' and 'gyogu' (best-effort)."""
+    try:
+        q = parse_qs(urlparse(url).query)
+        return {
+            "code": (q.get("code", [None])[0] or ""),
+            "gyogu": (q.get("gyogu", [None])[0] or ""),
+            "gubn": (q.get("gubn", [None])[0] or ""),
+            "cgubn": (q.get("cgubn", [None])[0] or ""),
+        }
+    except Exception:
+        return {"code": "", "gyogu": "", "gubn": "", "cgubn": ""}
+
+def clean_text(s: str) -> str:
+    return " ".join(s.split()) if s else ""
+
+@dataclass
+class FetchResult:
+    url: str
+    ok: bool
+    status: int
+    body: Optional[bytes]
+    error: Optional[str]
+    cached: bool = False
+    negative_cached: bool = False
+    content_encoding: Optional[str] = None
+    charset: Optional[str] = None
+    _text: Optional[str] = field(default=None, repr=False)
+
+    @property
+    def text(self) -> Optional[str]:
+        """Decoded HTML, computed on first access only."""
+        if self._text is None and self.body is not None:
+            self._text = decode_body(self.body, self.content_encoding, self.charset)
+        return self._text
+
+ACCEPT_ENCODING = "gzip, br" if brotli else "gzip"
+FETCH_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (compatible; CBCKBatchParser/1.0; +https://example.com)",
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+    "Accept-Language": "ko,en;q=0.8",
+    "Accept-Encoding": ACCEPT_ENCODING,
+    "Connection": "close",
+}
+CHARSET_RE = re.compile(r"charset\s*=\s*[\"']?([A-Za-z0-9_\-]+)", re.I)
+META_CHARSET_RE = re.compile(rb"<meta[^>]+charset\s*=\s*[\"']?\s*([A-Za-z0-9_\-]+)", re.I)
+
+def charset_from_content_type(content_type: Optional[str]) -> Optional[str]:
+    m = CHARSET_RE.search(content_type or "")
+    return m.group(1).lower() if m else None
+
+def decompress_body(body: bytes, content_encoding: Optional[str]) -> bytes:
+    enc = (content_encoding or "identity").strip().lower()
+    if enc == "gzip":
+        return gzip.decompress(body)
+    if enc == "deflate":
+        try:
+            return zlib.decompress(body)
+        except zlib.error:
+            return zlib.decompress(body, -zlib.MAX_WBITS)
+    if enc == "br":
+        if brotli is None:
+            raise ValueError("brotli-compressed body but the brotli package is not installed")
+        return brotli.decompress(body)
+    return body
+
+def decode_body(body: bytes, content_encoding: Optional[str], charset: Optional[str]) -> str:
+    """Decompress and decode: declared charset → <meta> charset → chardet fallback."""
+    raw = decompress_body(body, content_encoding)
+    enc = charset
+    if not enc:
+        m = META_CHARSET_RE.search(raw[:4096])
+        enc = m.group(1).decode("ascii").lower() if m else None
+    if not enc:
+        enc = chardet.detect(raw).get("encoding") or "utf-8"
+    try:
+        return raw.decode(enc, errors="replace")
+    except LookupError:
+        return raw.decode("utf-8", errors="replace")
+
+# Statuses that mean the page is gone; anything else (403, 408, …) may be transient and is not remembered
+PERMANENT_STATUSES = frozenset({404, 410})
+
+def source_fingerprint(path: str) -> str:
+    """Short hash of a source file: the parser version that parse-failure entries are tied to."""
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()[:12]
+
+def negative_cache_path(cache_dir: str, url: str) -> str:
+    return f"{cache_dir}/{md5(url)}.neg.json"
+
+def read_negative_cache(cache_dir: str, url: str, ttl: float, parser: Optional[str] = None,
+                        skip_parse: bool = False) -> Optional[Dict[str, Any]]:
+    """
+    Return the negative-cache entry for url if it is younger than ttl seconds.
+    Parse failures only count for the parser version that recorded them (`parser`), and not at all
+    with skip_parse (refresh runs): a fixed parser gets the page again.
+    """
+    if ttl <= 0:
+        return None
+    path = negative_cache_path(cache_dir, url)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            entry = json.load(f)
+    except Exception:
+        return None
+    if time.time() - float(entry.get("ts", 0)) > ttl:
+        return None
+    if entry.get("kind") == "parse" and (skip_parse or parser is None or entry.get("parser") != parser):
+        return None
+    return entry
+
+def write_negative_cache(cache_dir: str, url: str, status: int, error: str, kind: str,
+                         parser: Optional[str] = None) -> None:
+    """Remember a permanent failure (kind='fetch' or 'parse', the latter with its parser version) for url."""
+    entry = {"url": url, "status": status, "error": error, "kind": kind, "ts": time.time()}
+    if parser:
+        entry["parser"] = parser
+    with open(negative_cache_path(cache_dir, url), "w", encoding="utf-8") as f:
+        json.dump(entry, f, ensure_ascii=False)
+
+def clear_negative_cache(cache_dir: str, url: str) -> None:
+    try:
+        os.remove(negative_cache_path(cache_dir, url))
+    except FileNotFoundError:
+        pass
+
+def cache_meta_path(cache_dir: str, url: str) -> str:
+    return f"{cache_dir}/{md5(url)}.meta.json"
+
+def write_cache_meta(cache_dir: str, url: str, status: int, headers: Dict[str, str],
+                     content_encoding: Optional[str] = None, charset: Optional[str] = None) -> None:
+    meta = {
+        "url": url, "status": status, "headers": dict(headers), "fetched_at": time.time(),
+        "content_encoding": content_encoding, "charset": charset,
+    }
+    with open(cache_meta_path(cache_dir, url), "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False)
+
+def read_cache_meta(cache_dir: str, url: str) -> Dict[str, Any]:
+    try:
+        with open(cache_meta_path(cache_dir, url), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception:
+        return {}
+
+def is_cached(cache_dir: str, url: str) -> bool:
+    return os.path.exists(f"{cache_dir}/{md5(url)}.body") or os.path.exists(f"{cache_dir}/{md5(url)}.html")
+
+def fetch_with_retries(
+    url: str,
+    session: Optional[requests.Session],
+    max_retries: int = 3,
+    base_delay: float = 1.0,
+    timeout: Union[float, Tuple[float, float]] = (5.0, 15.0),
+    cache_dir: Optional[str] = None,
+    logger: Optional[logging.Logger] = None,
+    negative_ttl: float = 0.0,
+    offline: bool = False,
+    metrics: Optional[Metrics] = None,
+    hedge: Optional[HedgePolicy] = None,
+    refresh: bool = False,
+    parser_version: Optional[str] = None,
+) -> FetchResult:
+    """
+    Fetch URL with exponential backoff + jitter.
+    Uses simple disk cache if cache_dir is provided.
+    URLs with a fresh negative-cache entry (younger than negative_ttl) are not fetched again; parse-failure
+    entries only count for the same parser_version and are ignored by refresh runs.
+    With offline=True a cache miss is returned as a failure instead of hitting the network.
+    Stage timings and cache/byte counters go to `metrics` when given.
+    timeout is (connect, read) seconds or one value for both; with `hedge`, slow requests get a duplicate.
+    refresh=True skips cached bodies (the fresh response still updates the cache).
+    """
+    metrics = metrics or NULL_METRICS
+    cache_key = md5(url)
+    if cache_dir:
+        os.makedirs(cache_dir, exist_ok=True)
+        neg = read_negative_cache(cache_dir, url, negative_ttl, parser_version, skip_parse=refresh)
+        if neg:
+            if logger:
+                logger.debug("[NEGATIVE CACHE HIT] %s (%s: %s)", url, neg.get('kind'), neg.get('error'))
+            metrics.add("negative_cache_hits")
+            return FetchResult(url=url, ok=False, status=int(neg.get("status", -1)), body=None,
+                               error=neg.get("error") or "negative_cached", negative_cached=True)
+        body_path = f"{cache_dir}/{cache_key}.body"
+        legacy_path = f"{cache_dir}/{cache_key}.html"
+        if not refresh and (os.path.exists(body_path) or os.path.exists(legacy_path)):
+            try:
+                t0 = time.perf_counter()
+                if os.path.exists(body_path):
+                    meta = read_cache_meta(cache_dir, url)
+                    with open(body_path, "rb") as f:
+                        body = f.read()
+                    enc, charset = meta.get("content_encoding"), meta.get("charset")
+                else:
+                    # Legacy cache entries were written as decoded UTF-8 text
+                    meta = {}
+                    with open(legacy_path, "rb") as f:
+                        body = f.read()
+                    enc, charset = None, "utf-8"
+                if logger:
+                    logger.debug("[CACHE HIT] %s", url)
+                metrics.observe("cache_read", time.perf_counter() - t0)
+                metrics.add("cache_hits")
+                metrics.add("bytes_from_cache", len(body))
+                return FetchResult(url=url, ok=True, status=int(meta.get("status", 200)), body=body, error=None,
+                                   cached=True, content_encoding=enc, charset=charset)
+            except Exception as e:
+                if logger:
+                    logger.warning("[CACHE ERROR] %s : %s", url, e)
+
+    if offline:
+        metrics.add("offline_misses")
+        return FetchResult(url=url, ok=False, status=-1, body=None, error="offline_cache_miss")
+    metrics.add("network_fetches")
+
+    headers = dict(FETCH_HEADERS)
+    sess = session or requests.Session()
+
+    def get(attempt: HedgeAttempt) -> Tuple[requests.Response, Optional[bytes]]:
+        # Keep the raw (compressed) bytes; decoding happens lazily in FetchResult.text
+        # requests does not expose connect time: measure TTFB (connect + headers) and body separately
+        # While hedging each attempt gets its own session (a losing attempt may still be finishing)
+        s = requests.Session() if hedge else sess
+        try:
+            t0 = time.perf_counter()
+            resp = s.get(url, headers=headers, timeout=timeout, stream=True)
+            attempt.on_cancel(resp.close)
+            metrics.observe("fetch_ttfb", time.perf_counter() - t0)
+            body = None
+            t0 = time.perf_counter()
+            try:
+                if 200 <= resp.status_code < 300:
+                    body = resp.raw.read(decode_content=False)
+            finally:
+                resp.close()
+            attempt.check()
+            if body is not None:
+                metrics.observe("fetch_body", time.perf_counter() - t0)
+            return resp, body
+        finally:
+            if s is not sess:
+                s.close()
+
+    last_err = None
+    for attempt in range(0, max_retries + 1):
+        retry_after = 0.0
+        try:
+            # Gentle pacing
+            with metrics.timer("rate_limit_wait"):
+                time.sleep(random.uniform(0.25, 0.6))
+            resp, body = hedge.call(get) if hedge else get(HedgeAttempt())
+            status = resp.status_code
+            metrics.add(f"http_{status}")
+            if 200 <= status < 300:
+                metrics.add("bytes_downloaded", len(body))
+                enc = resp.headers.get("Content-Encoding")
+                charset = charset_from_content_type(resp.headers.get("Content-Type"))
+                if cache_dir:
+                    t0 = time.perf_counter()
+                    try:
+                        with open(f"{cache_dir}/{cache_key}.body", "wb") as f:
+                            f.write(body)
+                        write_cache_meta(cache_dir, url, status, resp.headers, enc, charset)
+                    except Exception as e:
+                        if logger:
+                            logger.warning("[CACHE WRITE ERROR] %s : %s", url, e)
+                    clear_negative_cache(cache_dir, url)
+                    metrics.observe("cache_write", time.perf_counter() - t0)
+                return FetchResult(url=url, ok=True, status=status, body=body, error=None, cached=False,
+                                   content_encoding=enc, charset=charset)
+            if status in RETRYABLE_STATUSES:
+                # Retry on common transient statuses (honouring Retry-After)
+                last_err = f"HTTP {status}"
+                retry_after = parse_retry_after(resp.headers.get("Retry-After"))
+                if logger:
+                    logger.warning("[RETRYABLE %s] %s (attempt %s/%s)", status, url, attempt, max_retries)
+            else:
+                # Page gone (404/410): remember it so later runs skip this URL; other statuses are not cached
+                if cache_dir and status in PERMANENT_STATUSES:
+                    try:
+                        write_negative_cache(cache_dir, url, status, f"HTTP {status}", "fetch")
+                    except Exception as e:
+                        if logger:
+                            logger.warning("[NEGATIVE CACHE WRITE ERROR] %s : %s", url, e)
+                return FetchResult(url=url, ok=False, status=status, body=None, error=f"HTTP {status}")
+        except (requests.RequestException, urllib3.exceptions.HTTPError) as e:
+            last_err = f"RequestException: {e}"
+            metrics.add("network_errors")
+            if logger:
+                logger.warning("[NETWORK ERROR] %s : %s (attempt %s/%s)", url, e, attempt, max_retries)
+
+        # Backoff
+        if attempt < max_retries:
+            delay = backoff_delay(attempt, base_delay, retry_after)
+            if logger:
+                logger.debug("[BACKOFF] %s sleeping %.2fs", url, delay)
+            metrics.add("retries")
+            with metrics.timer("backoff_wait"):
+                time.sleep(delay)
+
+    return FetchResult(url=url, ok=False, status=-1, body=None, error=last_err or "Unknown error")
+
+# ---------------------- Prefetch (cache warming) ----------------------
+
+def prefetch_worker(task: Any, session: requests.Session, args, logger: logging.Logger,
+                    metrics: Optional[Metrics] = None,
+                    hedge: Optional[HedgePolicy] = None) -> Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]:
+    """Fetch a page into the cache without parsing it. Return (record, failure_obj)."""
+    res = fetch_with_retries(
+        task.url,
+        session=session,
+        max_retries=args.max_retries,
+        base_delay=args.base_delay,
+        timeout=(args.connect_timeout, args.read_timeout),
+        cache_dir=f"{args.output_dir}/cache",
+        logger=logger,
+        negative_ttl=args.negative_ttl,
+        metrics=metrics,
+        hedge=hedge,
+    )
+    if not res.ok:
+        fail = {
+            "index": task.idx,
+            "name": task.name,
+            "url": task.url,
+            "status": res.status,
+            "error": res.error or "fetch_failed",
+            "negative_cached": res.negative_cached,
+            "stage": "prefetch",
+        }
+        logger.error("[FAIL PREFETCH] #%s %s : %s (status=%s)", task.idx, task.url, fail['error'], res.status)
+        return None, fail
+    return {"index": task.idx, "url": task.url, "status": res.status, "cached": res.cached}, None
+
+def cache_coverage(tasks: List[Any], cache_dir: str, negative_ttl: float) -> Dict[str, int]:
+    """Count how many task URLs are cached, negatively cached or still missing."""
+    cov = {"total": len(tasks), "cached": 0, "negative": 0, "missing": 0}
+    for t in tasks:
+        if is_cached(cache_dir, t.url):
+            cov["cached"] += 1
+        elif os.path.isdir(cache_dir) and read_negative_cache(cache_dir, t.url, negative_ttl):
+            cov["negative"] += 1
+        else:
+            cov["missing"] += 1
+    return cov
+
+def log_cache_coverage(label: str, cov: Dict[str, int], logger: logging.Logger) -> None:
+    pct = 100.0 * cov["cached"] / cov["total"] if cov["total"] else 0.0
+    logger.info("[COVERAGE %s] cached=%s/%s (%.1f%%) negative=%s missing=%s",
+                label, cov['cached'], cov['total'], pct, cov['negative'], cov['missing'])
+
+def run_prefetch(tasks: List[Any], session: requests.Session, args, logger: logging.Logger, failed_f,
+                 metrics: Optional[Metrics] = None, hedge: Optional[HedgePolicy] = None) -> Tuple[int, int]:
+    """Warm the cache for all tasks, logging progress roughly every 5%."""
+    cache_dir = f"{args.output_dir}/cache"
+    log_cache_coverage("before", cache_coverage(tasks, cache_dir, args.negative_ttl), logger)
+    ok_cnt = 0
+    fail_cnt = 0
+    fetched = 0
+    step = max(1, len(tasks) // 20)
+    with cf.ThreadPoolExecutor(max_workers=args.workers) as ex:
+        results = bounded_results(ex, lambda t: prefetch_worker(t, session, args, logger, metrics, hedge), tasks,
+                                  args.max_inflight, metrics)
+        for done, (rec, fail) in enumerate(results, start=1):
+            if rec:
+                ok_cnt += 1
+                if not rec["cached"]:
+                    fetched += 1
+            if fail:
+                failed_f.write(fail)
+                fail_cnt += 1
+            if done % step == 0 or done == len(tasks):
+                logger.info("[PREFETCH] %s/%s fetched=%s already_cached=%s failed=%s",
+                            done, len(tasks), fetched, ok_cnt - fetched, fail_cnt)
+    log_cache_coverage("after", cache_coverage(tasks, cache_dir, args.negative_ttl), logger)
+    return ok_cnt, fail_cnt
+
+# ---------------------- URL keys & sharding ----------------------
+
+def normalize_url_key(url: str) -> str:
+    """Canonical form of a URL: lower-case scheme/host/path, sorted query, no fragment."""
+    u = urlparse((url or "").strip())
+    query = urlencode(sorted(parse_qsl(u.query, keep_blank_values=True)))
+    return urlunparse((u.scheme.lower(), u.netloc.lower(), u.path.lower(), "", query, ""))
+
+def url_hash(url: str) -> int:
+    """Stable (process- and machine-independent) hash of the normalized URL key."""
+    return int(hashlib.md5(normalize_url_key(url).encode("utf-8")).hexdigest(), 16)
+
+def parse_shard(spec: str) -> Tuple[int, int]:
+    """argparse type for '--shard i/N' (0-based: 0/4 … 3/4)."""
+    try:
+        i_str, n_str = spec.split("/", 1)
+        i, n = int(i_str), int(n_str)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected i/N, got {spec!r}")
+    if n < 1 or not 0 <= i < n:
+        raise argparse.ArgumentTypeError(f"shard index must satisfy 0 <= i < N, got {spec!r}")
+    return i, n
+
+def in_shard(url: str, shard: Optional[Tuple[int, int]]) -> bool:
+    if not shard:
+        return True
+    i, n = shard
+    return url_hash(url) % n == i
+
+def shard_dir_name(shard: Tuple[int, int]) -> str:
+    return f"shard-{shard[0]}-of-{shard[1]}"
+
+def institution_slug(url: str) -> str:
+    """Site slug (/institutions/<slug>) of a CBCK detail page: cbck-<code>; code= is unique across gubn 6/7."""
+    code = parse_qs(urlparse(url).query).get("code", [""])[0].strip()
+    return f"cbck-{code}" if code else f"cbck-{url_hash(url):032x}"[:21]
+
+# ---------------------- Merge ----------------------
+
+RUN_DIR_PATTERNS = ("shard-*", "worker-*")
+
+def find_run_dirs(output_dir: str) -> List[str]:
+    dirs = set()
+    for pat in RUN_DIR_PATTERNS:
+        dirs.update(d for d in glob.glob(os.path.join(output_dir, pat)) if os.path.isdir(d))
+    return sorted(dirs)
+
+def iter_jsonl(path: str) -> Iterable[Dict[str, Any]]:
+    if not os.path.exists(path):
+        return
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                continue  # a crashed writer may leave a torn last line
+
+def tail_jsonl(path: str, offset: int = 0) -> Iterator[Tuple[Dict[str, Any], int]]:
+    """
+    (record, byte offset after its line) for the complete lines of a jsonl file from `offset` on.
+    A last line without its newline (writer still running or crashed) is left for the next call;
+    undecodable complete lines are skipped.
+    """
+    with open(path, "rb") as f:
+        f.seek(offset)
+        for line in f:
+            if not line.endswith(b"\n"):
+                return
+            offset += len(line)
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line), offset
+            except json.JSONDecodeError:
+                continue
+
+def record_change(line: Dict[str, Any]) -> Tuple[str, str, Optional[Dict[str, Any]]]:
+    """
+    ("upsert" | "delete", slug, record or None) of one line of crawl_*_info success.jsonl or of
+    crawl_refresh_daemon delta.jsonl, for stages that are updated incrementally from either.
+    """
+    if "op" in line:
+        return line["op"], line["slug"], line.get("record")
+    return "upsert", institution_slug(line.get("source_url", "")), line
+
+def _index_jsonl(path: str, url_field: str, index: Dict[str, Tuple[str, int]]) -> None:
+    """Record (path, line offset) of every decodable line of a jsonl file under its normalized URL key; later lines win."""
+    if not os.path.exists(path):
+        return
+    offset = 0
+    with open(path, "rb") as f:
+        for line in f:
+            start, offset = offset, offset + len(line)
+            if not line.strip():
+                continue
+            try:
+                rec = json.loads(line)
+            except ValueError:
+                continue  # a crashed writer may leave a torn last line
+            index[normalize_url_key(rec.get(url_field, ""))] = (path, start)
+
+def _copy_indexed_lines(keys: List[str], index: Dict[str, Tuple[str, int]], out: Any) -> None:
+    """Copy the indexed line of each key to out (binary), one open handle per source file."""
+    handles: Dict[str, Any] = {}
+    try:
+        for k in keys:
+            path, start = index[k]
+            f = handles.get(path)
+            if f is None:
+                f = handles[path] = open(path, "rb")
+            f.seek(start)
+            line = f.readline()
+            out.write(line if line.endswith(b"\n") else line + b"\n")
+    finally:
+        for f in handles.values():
+            f.close()
+
+def merge_run_outputs(output_dir: str, entries: List[Dict[str, Any]], logger: logging.Logger) -> Dict[str, int]:
+    """
+    Combine success/failed jsonl of every shard/worker directory under output_dir into output_dir/merged/.
+    - duplicates (same normalized URL) collapse to the last record seen
+    - failures are dropped for URLs that succeeded somewhere
+    - order follows the input file; URLs not in the input come last, sorted by key
+    Two passes: the first indexes URL key -> (file, offset) of its last line, the second copies those
+    lines in output order, so only the index is held in memory. Outputs are replaced atomically.
+    """
+    run_dirs = find_run_dirs(output_dir)
+    successes: Dict[str, Tuple[str, int]] = {}
+    failures: Dict[str, Tuple[str, int]] = {}
+    for d in run_dirs:
+        _index_jsonl(os.path.join(d, "success.jsonl"), "source_url", successes)
+        _index_jsonl(os.path.join(d, "failed.jsonl"), "url", failures)
+    for key in successes:
+        failures.pop(key, None)
+
+    order = {}
+    for i, e in enumerate(entries):
+        order.setdefault(normalize_url_key(e.get("detail_url", "")), i)
+
+    def sort_key(key: str):
+        return (0, order[key], "") if key in order else (1, 0, key)
+
+    merged_dir = os.path.join(output_dir, "merged")
+    os.makedirs(merged_dir, exist_ok=True)
+    with atomic_write(os.path.join(merged_dir, "success.jsonl"), binary=True) as f:
+        _copy_indexed_lines(sorted(successes, key=sort_key), successes, f)
+    with atomic_write(os.path.join(merged_dir, "failed.jsonl"), binary=True) as f:
+        _copy_indexed_lines(sorted(failures, key=sort_key), failures, f)
+    write_json_array_from_jsonl(os.path.join(merged_dir, "success.jsonl"), os.path.join(merged_dir, "success.json"))
+
+    logger.info("[MERGE] run_dirs=%s ok=%s failed=%s -> %s", len(run_dirs), len(successes), len(failures), merged_dir)
+    return {"run_dirs": len(run_dirs), "ok": len(successes), "failed": len(failures)}
+
+def write_json_array_from_jsonl(jsonl_path: str, out_path: str, start_offset: int = 0) -> int:
+    """
+    Stream the records of jsonl_path (from byte start_offset on) into a JSON array at out_path,
+    byte-for-byte what json.dump(records, indent=2, ensure_ascii=False) would produce,
+    holding one record at a time. Returns the number of records written.
+    """
+    n = 0
+    with atomic_write(out_path) as out:
+        if os.path.exists(jsonl_path):
+            with open(jsonl_path, "rb") as f:
+                f.seek(start_offset)
+                for raw in f:
+                    try:
+                        rec = json.loads(raw)
+                    except ValueError:
+                        continue  # blank or torn line
+                    body = json.dumps(rec, ensure_ascii=False, indent=2).replace("\n", "\n  ")
+                    out.write(("[\n  " if n == 0 else ",\n  ") + body)
+                    n += 1
+        out.write("\n]" if n else "[]")
+    return n
+
+# ---------------------- Output writers ----------------------
+
+@contextmanager
+def atomic_write(path: str, binary: bool = False) -> Iterator[Any]:
+    """Write to <path>.tmp, fsync, then rename over path: readers see the old file or the complete new one."""
+    tmp = f"{path}.tmp"
+    try:
+        with (open(tmp, "wb") if binary else open(tmp, "w", encoding="utf-8")) as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+def dumps_record(rec: Dict[str, Any]) -> bytes:
+    """One jsonl line (UTF-8, non-ASCII kept as is); compact separators so both paths emit the same bytes."""
+    if orjson is not None:
+        return orjson.dumps(rec, option=orjson.OPT_APPEND_NEWLINE)
+    return (json.dumps(rec, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+
+class JsonlWriter:
+    """
+    Appends records to a jsonl file from a background thread.
+    write() only enqueues; the thread serializes in batches and flushes when `batch_size` records
+    are pending or `flush_interval` seconds have passed. Every `fsync_every` records (and on close)
+    the file is fsynced, so a crash loses at most the records after the last checkpoint and leaves
+    at worst one torn line (iter_jsonl skips it).
+    """
+
+    _STOP = object()
+
+    def __init__(self, path: str, batch_size: int = 256, flush_interval: float = 1.0, fsync_every: int = 1000,
+                 metrics: Optional[Metrics] = None):
+        self.path = path
+        self.metrics = metrics or NULL_METRICS
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.fsync_every = fsync_every
+        self.written = 0
+        self._queue: "queue.Queue[Any]" = queue.Queue()
+        self._error: Optional[BaseException] = None
+        self._f = open(path, "ab")
+        self._thread = threading.Thread(target=self._run, name=f"jsonl-writer:{os.path.basename(path)}", daemon=True)
+        self._thread.start()
+
+    def write(self, rec: Dict[str, Any]) -> None:
+        if self._error is not None:
+            raise RuntimeError(f"writer for {self.path} failed") from self._error
+        self._queue.put(rec)
+
+    def close(self) -> None:
+        self._queue.put(self._STOP)
+        self._thread.join()
+        self._f.close()
+        if self._error is not None:
+            raise RuntimeError(f"writer for {self.path} failed") from self._error
+
+    def __enter__(self) -> "JsonlWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def _run(self) -> None:
+        batch: List[bytes] = []
+        since_sync = 0
+        deadline = time.monotonic() + self.flush_interval
+        stop = False
+        while not stop:
+            try:
+                item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                if item is self._STOP:
+                    stop = True
+                else:
+                    batch.append(dumps_record(item))
+            except queue.Empty:
+                pass
+            if batch and (stop or len(batch) >= self.batch_size or time.monotonic() >= deadline):
+                try:
+                    t0 = time.perf_counter()
+                    self._f.write(b"".join(batch))
+                    self._f.flush()
+                    since_sync += len(batch)
+                    self.written += len(batch)
+                    if stop or since_sync >= self.fsync_every:
+                        os.fsync(self._f.fileno())
+                        since_sync = 0
+                    self.metrics.observe("write", time.perf_counter() - t0)
+                    self.metrics.add("records_written", len(batch))
+                except BaseException as e:
+                    self._error = e
+                    return
+                batch = []
+            if time.monotonic() >= deadline:
+                deadline = time.monotonic() + self.flush_interval
+
+# ---------------------- Backpressure ----------------------
+
+def bounded_results(
+    ex: cf.Executor,
+    fn: Callable[..., Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]],
+    items: Iterable[Any],
+    window: int,
+    metrics: Optional[Metrics] = None,
+) -> Iterator[Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]]:
+    """
+    Submit fn(item) for each item but keep at most `window` futures pending; yield results in
+    completion order. Unlike [ex.submit(...) for t in tasks] nothing is queued ahead of the workers.
+    Time between submit and start is recorded as the "queue_wait" stage.
+    """
+    pending: set = set()
+    for item in items:
+        pending.add(ex.submit(_timed_call, fn, item, time.perf_counter(), metrics or NULL_METRICS))
+        if len(pending) >= window:
+            done, pending = cf.wait(pending, return_when=cf.FIRST_COMPLETED)
+            for fut in done:
+                yield fut.result()
+    while pending:
+        done, pending = cf.wait(pending, return_when=cf.FIRST_COMPLETED)
+        for fut in done:
+            yield fut.result()
+
+def _timed_call(fn: Callable[[Any], Any], item: Any, submitted: float, metrics: Metrics) -> Any:
+    metrics.observe("queue_wait", time.perf_counter() - submitted)
+    return fn(item)
+
+class ByteBudget:
+    """
+    Caps the response bytes held by worker threads between fetch and end of parsing.
+    A task reserves the running average body size before fetching and settles to the real size
+    once the body is in hand; a task that would exceed the cap waits (unless nothing is held).
+    limit <= 0 disables the cap.
+    """
+
+    def __init__(self, limit: int, initial_estimate: int = 64 * 1024):
+        self.limit = limit
+        self.used = 0
+        self.peak = 0
+        self._avg = float(initial_estimate)
+        self._cond = threading.Condition()
+
+    @contextmanager
+    def hold(self) -> Iterator[Callable[[int], None]]:
+        held = [0]
+        with self._cond:
+            want = int(self._avg)
+            while self.limit > 0 and self.used and self.used + want > self.limit:
+                self._cond.wait()
+            self.used += want
+            held[0] = want
+
+        def settle(actual: int) -> None:
+            with self._cond:
+                self.used += actual - held[0]
+                held[0] = actual
+                self.peak = max(self.peak, self.used)
+                self._avg = 0.9 * self._avg + 0.1 * actual
+
+        try:
+            yield settle
+        finally:
+            with self._cond:
+                self.used -= held[0]
+                self._cond.notify_all()
+
+# ---------------------- Durable frontier (SQLite) ----------------------
+
+FRONTIER_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    key           TEXT PRIMARY KEY,
+    idx           INTEGER NOT NULL,
+    name          TEXT NOT NULL,
+    url           TEXT NOT NULL,
+    state         TEXT NOT NULL DEFAULT 'pending',  -- pending | leased | done | failed
+    lease_owner   TEXT,
+    lease_expires REAL,
+    attempts      INTEGER NOT NULL DEFAULT 0,
+    next_due      REAL NOT NULL DEFAULT 0,
+    last_error    TEXT,
+    updated_at    REAL NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS tasks_state_due_idx ON tasks (state, next_due, idx);
+"""
+
+class Frontier:
+    """
+    Task queue persisted in SQLite so that a crash loses at most the current leases,
+    and several crawler processes on one machine can pull from the same file.
+
+    Leases are taken inside BEGIN IMMEDIATE, so two processes never get the same task;
+    an expired lease (the holder died) makes the task leasable again. attempts counts leases,
+    so a task that keeps killing its worker is failed once its lease has expired max_attempts times.
+    """
+
+    def __init__(self, path: str, lease_seconds: float = 300.0, max_attempts: int = 3,
+                 retry_delay: float = 300.0):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(FRONTIER_SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    def seed(self, tasks: Iterable[Tuple[int, str, str]]) -> int:
+        """Insert (idx, name, url) tasks that are not known yet. Returns the number added."""
+        now = time.time()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            before = conn.total_changes
+            conn.executemany(
+                "INSERT OR IGNORE INTO tasks (key, idx, name, url, updated_at) VALUES (?, ?, ?, ?, ?)",
+                ((normalize_url_key(url), idx, name, url, now) for idx, name, url in tasks),
+            )
+            added = conn.total_changes - before
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return added
+
+    def lease(self, owner: str, limit: int) -> List[sqlite3.Row]:
+        if limit <= 0:
+            return []
+        now = time.time()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # the holder never reached fail(): give up on tasks whose leases ran out too often
+            conn.execute(
+                "UPDATE tasks SET state = 'failed', lease_owner = NULL, lease_expires = NULL, "
+                "last_error = 'lease expired', updated_at = ? "
+                "WHERE state = 'leased' AND lease_expires <= ? AND attempts >= ?",
+                (now, now, self.max_attempts),
+            )
+            rows = conn.execute(
+                "SELECT key, idx, name, url, attempts FROM tasks "
+                "WHERE (state = 'pending' AND next_due <= ?) OR (state = 'leased' AND lease_expires <= ?) "
+                "ORDER BY next_due, idx LIMIT ?",
+                (now, now, limit),
+            ).fetchall()
+            conn.executemany(
+                "UPDATE tasks SET state = 'leased', lease_owner = ?, lease_expires = ?, "
+                "attempts = attempts + 1, updated_at = ? WHERE key = ?",
+                ((owner, now + self.lease_seconds, now, r["key"]) for r in rows),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return rows
+
+    def complete(self, key: str, owner: str) -> None:
+        self._conn().execute(
+            "UPDATE tasks SET state = 'done', lease_owner = NULL, lease_expires = NULL, "
+            "last_error = NULL, updated_at = ? WHERE key = ? AND lease_owner = ?",
+            (time.time(), key, owner),
+        )
+
+    def fail(self, key: str, owner: str, error: str, permanent: bool = False) -> str:
+        """Record a failed attempt. Returns the new state ('pending' = retry later, or 'failed')."""
+        conn = self._conn()
+        row = conn.execute("SELECT attempts FROM tasks WHERE key = ?", (key,)).fetchone()
+        attempts = row["attempts"] if row else self.max_attempts
+        now = time.time()
+        if permanent or attempts >= self.max_attempts:
+            state, next_due = "failed", now
+        else:
+            state, next_due = "pending", now + self.retry_delay * (2 ** max(0, attempts - 1))
+        conn.execute(
+            "UPDATE tasks SET state = ?, next_due = ?, lease_owner = NULL, lease_expires = NULL, "
+            "last_error = ?, updated_at = ? WHERE key = ? AND lease_owner = ?",
+            (state, next_due, error, now, key, owner),
+        )
+        return state
+
+    def counts(self) -> Dict[str, int]:
+        out = {"pending": 0, "leased": 0, "done": 0, "failed": 0}
+        for r in self._conn().execute("SELECT state, COUNT(*) AS n FROM tasks GROUP BY state"):
+            out[r["state"]] = r["n"]
+        return out
+
+    def active_leases(self, exclude_owner: str) -> int:
+        row = self._conn().execute(
+            "SELECT COUNT(*) AS n FROM tasks WHERE state = 'leased' AND lease_expires > ? AND lease_owner != ?",
+            (time.time(), exclude_owner),
+        ).fetchone()
+        return row["n"]
+
+def drain_frontier(
+    ex: cf.Executor,
+    frontier: Frontier,
+    owner: str,
+    run_task: Callable[[sqlite3.Row], Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]],
+    window: int,
+    poll: float = 2.0,
+    metrics: Optional[Metrics] = None,
+) -> Iterator[Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]]:
+    """
+    Lease up to `window` tasks at a time, run them on ex and yield (success_obj, failure_obj).
+    Stops when nothing is leasable and no other worker holds a live lease;
+    retries scheduled for later stay pending for the next run.
+    """
+    in_flight: Dict[cf.Future, sqlite3.Row] = {}
+    while True:
+        if len(in_flight) < window:
+            for row in frontier.lease(owner, window - len(in_flight)):
+                in_flight[ex.submit(_timed_call, run_task, row, time.perf_counter(), metrics or NULL_METRICS)] = row
+        if not in_flight:
+            if frontier.active_leases(owner) == 0:
+                break
+            time.sleep(poll)  # another worker may die and its leases expire
+            continue
+        done, _ = cf.wait(in_flight, timeout=poll, return_when=cf.FIRST_COMPLETED)
+        for fut in done:
+            row = in_flight.pop(fut)
+            succ, fail = fut.result()
+            if succ:
+                frontier.complete(row["key"], owner)
+            if fail:
+                # status -1 = network error / retry budget exhausted → worth another lease later
+                permanent = fail.get("status", -1) != -1
+                fail["frontier_state"] = frontier.fail(row["key"], owner, fail.get("error", ""), permanent=permanent)
+            yield succ, fail
+
+# ---------------------- Parsed records ----------------------
+
+# Keys of crawl_*_info records that are not roles. Everything else is a role: a {role?, name_ko, name_en?}
+# dict or a list of them (monastery parser, 성사담당), or "label": "text" as the convent tables give it.
+RECORD_FIELDS = frozenset({
+    "source_url", "code", "gyogu", "gubn", "cgubn", "title", "input_name", "cached", "slug",
+    "name_ko", "name_en", "subunit", "diocese", "affiliation", "founded", "entered_korea",
+    "address", "phone", "fax", "website", "email", "비고",
+})
+ROLE_TEXT_RE = re.compile(r"[가-힣A-Za-z]")  # convent "label": "text" rows that are phone numbers are not roles
+
+def record_roles(rec: Dict[str, Any]) -> List[Dict[str, str]]:
+    """[{role, name_ko, name_en?}] of a parsed record, whichever shape the parser gave each role."""
+    roles = []
+    for key, value in rec.items():
+        if key in RECORD_FIELDS:
+            continue
+        for v in value if isinstance(value, list) else [value]:
+            if isinstance(v, dict) and (v.get("name_ko") or v.get("name_en")):
+                role = {"role": v.get("role") or key, "name_ko": v.get("name_ko") or ""}
+                if v.get("name_en"):
+                    role["name_en"] = v["name_en"]
+                roles.append(role)
+            elif isinstance(v, str) and ROLE_TEXT_RE.search(v):
+                roles.append({"role": key, "name_ko": v})
+    return roles
+
+# Category of a parsed record by the directory's gubn (the list it was crawled from)
+INSTITUTION_CATEGORIES = {"6": "monastery", "7": "convent"}
+
+def institution_category(rec: Dict[str, Any]) -> Optional[str]:
+    """Category of a parsed record from its gubn ("monastery"/"convent"); None when unknown."""
+    return INSTITUTION_CATEGORIES.get(rec.get("gubn") or "")
+
+def institution_label(rec: Dict[str, Any]) -> str:
+    """Display name of a parsed record: "name_ko (subunit)"."""
+    name, sub = rec.get("name_ko") or rec.get("input_name") or "", rec.get("subunit") or ""
+    return f"{name} ({sub})" if sub else name
+
+# ---------------------- Field coverage ----------------------
+
+# Value length buckets (characters; list fields: items): 0, 1, 2, 4 … 4096, then "more"
+LENGTH_BUCKETS = (0,) + tuple(2 ** i for i in range(13))
+OTHER_FIELDS = "<other>"
+
+class _FieldCounter:
+    __slots__ = ("present", "filled", "lengths", "max_length", "sources", "top")
+
+    def __init__(self) -> None:
+        self.present = 0
+        self.filled = 0
+        self.lengths = [0] * (len(LENGTH_BUCKETS) + 1)
+        self.max_length = 0
+        self.sources: Dict[str, int] = {}
+        self.top: Dict[str, int] = {}  # Misra-Gries counters over value hashes
+
+def value_length(value: Any) -> int:
+    if isinstance(value, str):
+        return len(value.strip())
+    if isinstance(value, list):
+        return len(value)
+    if isinstance(value, dict):
+        return len(str(value.get("name_ko") or value.get("text") or value.get("href") or ""))
+    return 0 if value is None else 1
+
+class FieldStats:
+    """
+    Streaming parse-quality statistics of one run, fed from the results loop:
+    per field, how many records have it (present) and non-empty (filled), a value-length histogram, which
+    parser path produced it (provenance: structured table vs plaintext fallback, title source, …) and the
+    share of its most frequent value (a field stuck on page chrome, like title = the diocese sidebar,
+    shows as top_share near 1). Roles are counted per label and per record.
+    Memory is constant: at most `max_fields` fields and role labels are tracked by name (the rest are
+    pooled under "<other>"), and the frequent-value estimate keeps `top_k` counters per field.
+    """
+
+    def __init__(self, max_fields: int = 128, top_k: int = 8):
+        self.max_fields = max_fields
+        self.top_k = top_k
+        self.records = 0
+        self.fields: Dict[str, _FieldCounter] = {}
+        self.roles: Dict[str, int] = {}
+        self.roles_per_record = [0] * (len(LENGTH_BUCKETS) + 1)
+
+    def _field(self, key: str) -> _FieldCounter:
+        fc = self.fields.get(key)
+        if fc is None:
+            key = key if len(self.fields) < self.max_fields else OTHER_FIELDS
+            fc = self.fields.get(key) or self.fields.setdefault(key, _FieldCounter())
+        return fc
+
+    def _top(self, fc: _FieldCounter, value: Any) -> None:
+        h = hashlib.blake2b(json.dumps(value, ensure_ascii=False, sort_keys=True).encode("utf-8"),
+                            digest_size=8).hexdigest()
+        if h in fc.top or len(fc.top) < self.top_k:
+            fc.top[h] = fc.top.get(h, 0) + 1
+            return
+        for k in list(fc.top):
+            fc.top[k] -= 1
+            if not fc.top[k]:
+                del fc.top[k]
+
+    def add(self, rec: Dict[str, Any], provenance: Optional[Dict[str, str]] = None) -> None:
+        self.records += 1
+        for key, value in rec.items():
+            if key in ("cached", "input_name"):  # run bookkeeping, not parsed
+                continue
+            fc = self._field(key)
+            fc.present += 1
+            n = value_length(value)
+            if n:
+                fc.filled += 1
+                self._top(fc, value)
+            fc.lengths[bisect.bisect_left(LENGTH_BUCKETS, n)] += 1
+            fc.max_length = max(fc.max_length, n)
+            src = (provenance or {}).get(key, "unknown")
+            fc.sources[src] = fc.sources.get(src, 0) + 1
+        roles = record_roles(rec)
+        self.roles_per_record[bisect.bisect_left(LENGTH_BUCKETS, len(roles))] += 1
+        for r in roles:
+            label = r["role"] if r["role"] in self.roles or len(self.roles) < self.max_fields else OTHER_FIELDS
+            self.roles[label] = self.roles.get(label, 0) + 1
+
+    @staticmethod
+    def _hist(counts: List[int]) -> Dict[str, int]:
+        labels = [f"<={b}" for b in LENGTH_BUCKETS] + [f">{LENGTH_BUCKETS[-1]}"]
+        return {labels[i]: c for i, c in enumerate(counts) if c}
+
+    @staticmethod
+    def _quantile(counts: List[int], q: float) -> int:
+        target, cum = q * sum(counts), 0
+        for i, c in enumerate(counts):
+            cum += c
+            if c and cum >= target:
+                return LENGTH_BUCKETS[i] if i < len(LENGTH_BUCKETS) else LENGTH_BUCKETS[-1] + 1
+        return 0
+
+    def snapshot(self) -> Dict[str, Any]:
+        n = self.records or 1
+        fields = {}
+        for key, fc in sorted(self.fields.items(), key=lambda kv: -kv[1].present):
+            fields[key] = {
+                "present": fc.present,
+                "filled": fc.filled,
+                "fill_rate": round(fc.filled / n, 4),
+                "length_p50": self._quantile(fc.lengths, 0.5),
+                "length_p95": self._quantile(fc.lengths, 0.95),
+                "length_max": fc.max_length,
+                "lengths": self._hist(fc.lengths),
+                "provenance": dict(sorted(fc.sources.items(), key=lambda kv: -kv[1])),
+                "top_share": round(max(fc.top.values(), default=0) / fc.filled, 4) if fc.filled else 0.0,
+            }
+        return {
+            "records": self.records,
+            "fields": fields,
+            "roles": dict(sorted(self.roles.items(), key=lambda kv: -kv[1])),
+            "roles_per_record": self._hist(self.roles_per_record),
+        }
+
+    def summary(self, limit: int = 8) -> str:
+        """One line: record count, then the `limit` least-filled common fields (on half the records or more)."""
+        snap = self.snapshot()
+        common = [kv for kv in snap["fields"].items() if kv[1]["present"] * 2 >= snap["records"]]
+        low = sorted(common, key=lambda kv: kv[1]["fill_rate"])[:limit]
+        parts = [f"{k}={f['fill_rate']:.0%}" + (f"(plaintext {plaintext_share(f):.0%})" if plaintext_share(f) else "")
+                 for k, f in low]
+        return f"records={snap['records']} fields={len(snap['fields'])} roles={sum(snap['roles'].values())} " \
+               f"least filled: {' '.join(parts)}"
+
+    def write(self, out_dir: str, previous_path: Optional[str] = None, drop: float = 0.05,
+              min_records: int = 20, logger: Optional[logging.Logger] = None) -> Tuple[str, List[str]]:
+        """
+        Write <out_dir>/field_stats.json with the alerts against the previous run's file (default: the
+        one being replaced; it is kept as field_stats.prev.json). An unreadable previous file (torn by a
+        crash, hand-edited) is logged and skipped: no alerts, the new stats are still written.
+        Returns (path, alerts).
+        """
+        path = os.path.join(out_dir, "field_stats.json")
+        previous_path = previous_path or path
+        previous = None
+        if os.path.exists(previous_path):
+            try:
+                with open(previous_path, "r", encoding="utf-8") as f:
+                    previous = json.load(f)
+            except (ValueError, OSError) as e:
+                (logger or logging.getLogger(__name__)).warning(
+                    "[FIELDS] previous stats %s unreadable, not comparing: %s", previous_path, e)
+                previous = None
+            if previous_path == path:
+                os.replace(path, os.path.join(out_dir, "field_stats.prev.json"))
+        snap = self.snapshot()
+        snap["alerts"] = coverage_alerts(snap, previous, drop, min_records) if previous else []
+        with atomic_write(path) as f:
+            json.dump(snap, f, ensure_ascii=False, indent=2)
+        return path, snap["alerts"]
+
+def plaintext_share(field: Dict[str, Any]) -> float:
+    total = sum(field.get("provenance", {}).values())
+    return field.get("provenance", {}).get("plaintext", 0) / total if total else 0.0
+
+def coverage_alerts(current: Dict[str, Any], previous: Dict[str, Any], drop: float = 0.05,
+                    min_records: int = 20) -> List[str]:
+    """
+    Fields whose fill rate fell by more than `drop` (absolute) since the previous run, fields that moved
+    to the plaintext fallback by more than `drop`, and fields that became dominated by one value.
+    Runs with fewer than `min_records` records on either side are not compared.
+    """
+    if current.get("records", 0) < min_records or previous.get("records", 0) < min_records:
+        return []
+    alerts = []
+    cur_fields, prev_fields = current.get("fields", {}), previous.get("fields", {})
+    for key, prev in prev_fields.items():
+        cur = cur_fields.get(key, {"fill_rate": 0.0})
+        if prev["fill_rate"] - cur["fill_rate"] > drop:
+            alerts.append(f"{key}: fill rate {prev['fill_rate']:.1%} -> {cur['fill_rate']:.1%}")
+        if key in cur_fields and plaintext_share(cur) - plaintext_share(prev) > drop:
+            alerts.append(f"{key}: plaintext fallback {plaintext_share(prev):.1%} -> {plaintext_share(cur):.1%}")
+        if key in cur_fields and cur.get("top_share", 0) >= 0.5 and cur["top_share"] - prev.get("top_share", 0) > drop:
+            alerts.append(f"{key}: one value in {cur['top_share']:.1%} of records (was {prev.get('top_share', 0):.1%})")
+    return alerts
+
+# ---------------------- Refresh scheduling (SQLite) ----------------------
+
+REFRESH_SCHEMA = """
+CREATE TABLE IF NOT EXISTS history (
+    key          TEXT PRIMARY KEY,
+    url          TEXT NOT NULL,
+    first_seen   REAL NOT NULL,
+    last_fetched REAL,              -- last successful fetch + parse
+    last_attempt REAL,
+    last_status  INTEGER,
+    fingerprint  TEXT,              -- record_fingerprint() of the last parsed record
+    fetches      INTEGER NOT NULL DEFAULT 0,
+    changes      INTEGER NOT NULL DEFAULT 0,
+    failures     INTEGER NOT NULL DEFAULT 0,  -- consecutive
+    last_error   TEXT
+);
+"""
+
+# Parsed fields that change without the institution changing (run flags, the category counts in the page title)
+VOLATILE_FIELDS = frozenset({"cached", "input_name", "title"})
+
+def record_fingerprint(rec: Dict[str, Any]) -> str:
+    stable = {k: v for k, v in rec.items() if k not in VOLATILE_FIELDS}
+    return hashlib.sha1(json.dumps(stable, ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest()
+
+class RefreshHistory:
+    """
+    Per-URL fetch history of refresh runs, and the staleness priority derived from it:
+
+        priority = age_days x change_rate x (1 + failure_boost)
+
+    change_rate is (changes + 1) / (fetches + 2): the Laplace-smoothed share of fetches that found a
+    changed record. failure_boost is 1, 0.5, 0.25, ... after 1, 2, 3, ... consecutive transient failures,
+    so a failed URL is retried soon but one that keeps failing cannot take over the budget.
+    URLs never fetched come first. A permanent failure (HTTP 4xx, parse error) goes last and the
+    negative cache decides when it is tried again.
+    Written from the thread that consumes results only.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.conn = sqlite3.connect(path, timeout=60, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(REFRESH_SCHEMA)
+
+    @staticmethod
+    def _priority(row: Optional[sqlite3.Row], now: float) -> float:
+        if row is None or row["last_fetched"] is None and not row["failures"]:
+            return math.inf
+        if row["failures"] and row["last_status"] not in (None, -1):
+            return 0.0
+        age_days = (now - (row["last_fetched"] or row["first_seen"])) / 86400.0
+        change_rate = (row["changes"] + 1) / (row["fetches"] + 2)
+        boost = 2.0 ** (1 - row["failures"]) if row["failures"] else 0.0
+        return age_days * change_rate * (1.0 + boost)
+
+    def order(self, tasks: List[Any], url_of: Callable[[Any], str] = lambda t: t.url) -> List[Tuple[Any, float]]:
+        """(task, priority) by descending priority; ties keep input order."""
+        rows = {r["key"]: r for r in self.conn.execute("SELECT * FROM history")}
+        now = time.time()
+        scored = [(t, self._priority(rows.get(normalize_url_key(url_of(t))), now)) for t in tasks]
+        return sorted(scored, key=lambda ts: -ts[1])
+
+    def known(self, url: str) -> bool:
+        """True once a record of url has been stored (record_success can then report changes)."""
+        row = self.conn.execute("SELECT fingerprint FROM history WHERE key = ?", (normalize_url_key(url),)).fetchone()
+        return bool(row and row["fingerprint"])
+
+    def record_success(self, url: str, rec: Dict[str, Any]) -> bool:
+        """Store a fetched record; True when it differs from the previous fetch."""
+        key, now, fp = normalize_url_key(url), time.time(), record_fingerprint(rec)
+        row = self.conn.execute("SELECT fingerprint FROM history WHERE key = ?", (key,)).fetchone()
+        changed = bool(row and row["fingerprint"] and row["fingerprint"] != fp)
+        self.conn.execute(
+            "INSERT INTO history (key, url, first_seen, last_fetched, last_attempt, last_status, fingerprint, fetches) "
+            "VALUES (?, ?, ?, ?, ?, 200, ?, 1) "
+            "ON CONFLICT(key) DO UPDATE SET url = excluded.url, last_fetched = excluded.last_fetched, "
+            "last_attempt = excluded.last_attempt, last_status = 200, fingerprint = excluded.fingerprint, "
+            "fetches = fetches + 1, changes = changes + ?, failures = 0, last_error = NULL",
+            (key, url, now, now, now, fp, int(changed)),
+        )
+        return changed
+
+    def record_failure(self, url: str, status: int, error: str) -> None:
+        key, now = normalize_url_key(url), time.time()
+        self.conn.execute(
+            "INSERT INTO history (key, url, first_seen, last_attempt, last_status, failures, last_error) "
+            "VALUES (?, ?, ?, ?, ?, 1, ?) "
+            "ON CONFLICT(key) DO UPDATE SET last_attempt = excluded.last_attempt, "
+            "last_status = excluded.last_status, failures = failures + 1, last_error = excluded.last_error",
+            (key, url, now, now, status, error),
+        )
+
+    def close(self) -> None:
+        self.conn.close()
+
+def parse_deadline(spec: str, now: Optional[float] = None) -> float:
+    """
+    --deadline value → epoch seconds. Accepts a duration ("3600", "90s", "45m", "2h"), a clock time
+    ("05:30", the next occurrence in local time) or an ISO timestamp ("2025-01-31T05:30").
+    """
+    now = time.time() if now is None else now
+    spec = spec.strip()
+    m = re.fullmatch(r"(\d+(?:\.\d+)?)([smh]?)", spec)
+    if m:
+        return now + float(m.group(1)) * {"": 1, "s": 1, "m": 60, "h": 3600}[m.group(2)]
+    m = re.fullmatch(r"(\d{1,2}):(\d{2})", spec)
+    if m:
+        t = time.localtime(now)
+        target = time.mktime((t.tm_year, t.tm_mon, t.tm_mday, int(m.group(1)), int(m.group(2)), 0, 0, 0, -1))
+        return target if target > now else target + 86400
+    try:
+        return time.mktime(time.strptime(spec, "%Y-%m-%dT%H:%M"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"bad deadline {spec!r} (use 45m, 2h, HH:MM or YYYY-MM-DDTHH:MM)")
+
+def until_deadline(items: Iterable[Any], deadline: Optional[float]) -> Iterator[Any]:
+    """Yield items until the wall clock passes `deadline` (checked as each item is submitted)."""
+    for item in items:
+        if deadline is not None and time.time() >= deadline:
+            return
+        yield item
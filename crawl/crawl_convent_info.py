@@ -6,6 +6,14 @@ CBCK Sisters Detail Pages → JSON batch parser
 Usage:
   python cbck_batch_parser.py --input input.json --mode test --output-dir out
   python cbck_batch_parser.py --input input.json --mode full --output-dir out --workers 8 --cache
+  python cbck_batch_parser.py --input input.json --mode prefetch --output-dir out --workers 8
+  python cbck_batch_parser.py --input input.json --mode coverage --output-dir out
+  python cbck_batch_parser.py --input input.json --mode full --output-dir out --offline
+  python cbck_batch_parser.py --input input.json --mode full --output-dir out --cache --shard 0/4   # … 3/4 on other cores/boxes
+  python cbck_batch_parser.py --input input.json --mode merge --output-dir out
+  python cbck_batch_parser.py --input input.json --mode full --output-dir out --cache --frontier out/frontier.sqlite   # run N of these
+  python cbck_batch_parser.py --input input.json --mode full --output-dir out --offline --profile cpu   # or mem
+  python cbck_batch_parser.py --input input.json --mode full --output-dir out --cache --hedge --connect-timeout 3 --read-timeout 15
 
 Input JSON format:
 [
@@ -16,160 +24,74 @@ Input JSON format:
 Outputs (in --output-dir, default=out/):
 - success.jsonl   : one JSON object per successfully parsed page
 - failed.jsonl    : one JSON object per failed URL (with error/message)
-- success.json    : aggregated list of all success objects (written at the end)
+- success.json    : aggregated list of all success objects (this run, streamed from success.jsonl at the end)
 - logs/run.log    : detailed logs
-- cache/*.html    : cached HTML of each fetched page (if --cache)
+- metrics.json    : per-stage timings (p50/p95/p99), bytes, cache hit ratio of this run
+- metrics.prom    : the same in Prometheus text format (node_exporter textfile collector)
+- field_stats.json: per-field fill rate, value lengths, provenance, role counts; alerts vs the previous run (field_stats.prev.json)
+- profile/        : cpu_<stage>.pstats / mem_end.tracemalloc + summary.txt (if --profile)
+- cache/*.body    : raw (possibly gzip/br compressed) response bytes of each fetched page (if --cache)
+- cache/*.meta.json: status/headers/content-encoding/charset of each cached response (if --cache)
+- cache/*.html    : legacy UTF-8 HTML cache, still read on cache hits
+- cache/*.neg.json: negative cache of permanent fetch/parse failures (if --cache)
 """
 from __future__ import annotations
 import argparse
 import concurrent.futures as cf
-import hashlib
 import json
 import logging
-import random
+import os
+import socket
 import sys
 import time
 import traceback
+from contextlib import nullcontext
 from dataclasses import dataclass
-from typing import Any, Dict, List, Optional, Tuple
-from urllib.parse import urlparse, parse_qs
+from typing import Any, Dict, Optional, Tuple
 
 import requests
 from bs4 import BeautifulSoup
 
+from crawl_common import (
+    LOG_LEVELS, NULL_METRICS, NULL_PROFILER, ByteBudget, FieldStats, Frontier, HedgePolicy, JsonLogFormatter,
+    JsonlWriter, Metrics, Profiler, RefreshHistory, attach_queue_logging, bounded_results, cache_coverage,
+    clean_text, drain_frontier, extract_ids_from_url, fetch_with_retries, in_shard, log_cache_coverage,
+    merge_run_outputs, parse_deadline, parse_shard, run_prefetch, shard_dir_name, source_fingerprint,
+    until_deadline, write_json_array_from_jsonl, write_negative_cache,
+)
+
 # ---------------------- Logging Setup ----------------------
 
-def setup_logging(out_dir: str) -> logging.Logger:
+def setup_logging(out_dir: str, level: str = "INFO", json_lines: bool = False) -> logging.Logger:
     log_dir = f"{out_dir}/logs"
     os.makedirs(log_dir, exist_ok=True)
     logger = logging.getLogger("cbck")
-    logger.setLevel(logging.DEBUG)
-    logger.handlers.clear()
 
     # Console handler (INFO)
     ch = logging.StreamHandler(sys.stdout)
     ch.setLevel(logging.INFO)
     ch.setFormatter(logging.Formatter("[%(levelname)s] %(message)s"))
-    logger.addHandler(ch)
 
-    # File handler (DEBUG)
+    # File handler (everything that passes --log-level; optionally JSON lines)
     fh = logging.FileHandler(f"{log_dir}/run.log", encoding="utf-8")
     fh.setLevel(logging.DEBUG)
-    fh.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s %(message)s"))
-    logger.addHandler(fh)
+    fh.setFormatter(JsonLogFormatter() if json_lines else
+                    logging.Formatter("%(asctime)s %(levelname)s %(name)s %(message)s"))
 
+    # Handlers run on a listener thread; workers only enqueue records
+    attach_queue_logging(logger, [ch, fh], level)
     return logger
 
 # ---------------------- Utilities ----------------------
 
-def md5(s: str) -> str:
-    return hashlib.md5(s.encode("utf-8")).hexdigest()
-
 def ensure_dir(path: str) -> None:
     os.makedirs(path, exist_ok=True)
 
-def extract_ids_from_url(url: str) -> Dict[str, str]:
-    """Extract interesting query params like 'code' and 'gyogu' (best-effort)."""
-    try:
-        q = parse_qs(urlparse(url).query)
-        return {
-            "code": (q.get("code", [None])[0] or ""),
-            "gyogu": (q.get("gyogu", [None])[0] or ""),
-            "gubn": (q.get("gubn", [None])[0] or ""),
-            "cgubn": (q.get("cgubn", [None])[0] or ""),
-        }
-    except Exception:
-        return {"code": "", "gyogu": "", "gubn": "", "cgubn": ""}
-
-# ---------------------- Networking (with retries) ----------------------
-
-@dataclass
-class FetchResult:
-    url: str
-    ok: bool
-    status: int
-    text: Optional[str]
-    error: Optional[str]
-    cached: bool = False
-
-def fetch_with_retries(
-    url: str,
-    session: Optional[requests.Session],
-    max_retries: int = 3,
-    base_delay: float = 1.0,
-    timeout: float = 15.0,
-    cache_dir: Optional[str] = None,
-    logger: Optional[logging.Logger] = None,
-) -> FetchResult:
-    """
-    Fetch URL with exponential backoff + jitter.
-    Uses simple disk cache if cache_dir is provided.
-    """
-    cache_key = md5(url)
-    if cache_dir:
-        ensure_dir(cache_dir)
-        cache_path = f"{cache_dir}/{cache_key}.html"
-        if os.path.exists(cache_path):
-            try:
-                with open(cache_path, "r", encoding="utf-8") as f:
-                    html = f.read()
-                if logger:
-                    logger.debug(f"[CACHE HIT] {url}")
-                return FetchResult(url=url, ok=True, status=200, text=html, error=None, cached=True)
-            except Exception as e:
-                if logger:
-                    logger.warning(f"[CACHE ERROR] {url} : {e}")
-
-    headers = {
-        "User-Agent": "Mozilla/5.0 (compatible; CBCKBatchParser/1.0; +https://example.com)",
-        "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
-        "Accept-Language": "ko,en;q=0.8",
-        "Connection": "close",
-    }
-    sess = session or requests.Session()
-
-    last_err = None
-    for attempt in range(0, max_retries + 1):
-        try:
-            # Gentle pacing
-            time.sleep(random.uniform(0.25, 0.6))
-            resp = sess.get(url, headers=headers, timeout=timeout)
-            status = resp.status_code
-            if 200 <= status < 300:
-                resp.encoding = resp.apparent_encoding or "utf-8"
-                html = resp.text
-                if cache_dir:
-                    try:
-                        with open(f"{cache_dir}/{cache_key}.html", "w", encoding="utf-8") as f:
-                            f.write(html)
-                    except Exception as e:
-                        if logger:
-                            logger.warning(f"[CACHE WRITE ERROR] {url} : {e}")
-                return FetchResult(url=url, ok=True, status=status, text=html, error=None, cached=False)
-            elif status in (429, 500, 502, 503, 504):
-                # Retry on common transient statuses
-                last_err = f"HTTP {status}"
-                if logger:
-                    logger.warning(f"[RETRYABLE {status}] {url} (attempt {attempt}/{max_retries})")
-            else:
-                # Non-retryable status
-                return FetchResult(url=url, ok=False, status=status, text=None, error=f"HTTP {status}")
-        except requests.RequestException as e:
-            last_err = f"RequestException: {e}"
-            if logger:
-                logger.warning(f"[NETWORK ERROR] {url} : {e} (attempt {attempt}/{max_retries})")
-
-        # Backoff
-        if attempt < max_retries:
-            delay = base_delay * (2 ** attempt) + random.uniform(0, 0.5)
-            if logger:
-                logger.debug(f"[BACKOFF] {url} sleeping {delay:.2f}s")
-            time.sleep(delay)
-
-    return FetchResult(url=url, ok=False, status=-1, text=None, error=last_err or "Unknown error")
-
 # ---------------------- HTML Parsing ----------------------
 
+# Parse failures are negative-cached per version of this file: editing the parser retries them
+PARSER_VERSION = source_fingerprint(__file__)
+
 LABEL_MAP = {
     "소속": "affiliation",
     "한글명칭": "name_ko",
@@ -186,10 +108,8 @@ LABEL_MAP = {
     "성사담당": "sacrament_officer",
 }
 
-def clean_text(s: str) -> str:
-    return " ".join(s.split()) if s else ""
-
-def extract_title(soup: BeautifulSoup) -> Optional[str]:
+def extract_title(soup: BeautifulSoup, provenance: Optional[Dict[str, str]] = None) -> Optional[str]:
+    provenance = provenance if provenance is not None else {}
     t = soup.select_one(".today1")
     if not t:
         # Fallback: try bold nodes near "세부정보"
@@ -197,8 +117,10 @@ def extract_title(soup: BeautifulSoup) -> Optional[str]:
         for st in strongs:
             txt = clean_text(st.get_text(strip=True))
             if txt and "세부정보" not in txt and len(txt) <= 64:
+                provenance["title"] = "strong"
                 return txt.strip().strip('"“”')
         return None
+    provenance["title"] = "today1"
     raw = t.get_text(strip=True)
     cleaned = raw.strip().strip('"“”').strip()
     return cleaned
@@ -241,21 +163,25 @@ def parse_small_tables(soup: BeautifulSoup) -> Dict[str, Any]:
                 data[key] = val
     return data
 
-def parse_cbck_detail(html: str, url: str) -> Dict[str, Any]:
+def parse_cbck_detail(html: str, url: str, provenance: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
     """
     Parse a CBCK detail page HTML into a structured dict.
+    provenance (optional) is filled with key → source ("structured", "url", title source).
     """
     soup = BeautifulSoup(html, "html.parser")
     item: Dict[str, Any] = {"source_url": url}
     ids = extract_ids_from_url(url)
     item.update(ids)
+    prov = provenance if provenance is not None else {}
+    prov.update(dict.fromkeys(item, "url"))
 
-    title = extract_title(soup)
+    title = extract_title(soup, prov)
     if title:
         item["title"] = title
 
     payload = parse_small_tables(soup)
     item.update(payload)
+    prov.update(dict.fromkeys(payload, "structured"))
 
     # Normalize phone/fax parentheses (keep if present)
     for k in ("phone", "fax"):
@@ -272,48 +198,81 @@ class Task:
     name: str
     url: str
 
-def worker(task: Task, session: requests.Session, args, logger: logging.Logger) -> Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]:
+def worker(task: Task, session: requests.Session, args, logger: logging.Logger,
+           budget: Optional[ByteBudget] = None, metrics: Optional[Metrics] = None,
+           profiler: Optional[Profiler] = None,
+           hedge: Optional[HedgePolicy] = None) -> Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]:
     """Return (success_obj, failure_obj)."""
-    logger.debug(f"[START] #{task.idx} {task.name} | {task.url}")
-    res = fetch_with_retries(
-        task.url,
-        session=session,
-        max_retries=args.max_retries,
-        base_delay=args.base_delay,
-        timeout=args.timeout,
-        cache_dir=(f"{args.output_dir}/cache" if args.cache else None),
-        logger=logger,
-    )
-    if not res.ok or not res.text:
-        fail = {
-            "index": task.idx,
-            "name": task.name,
-            "url": task.url,
-            "status": res.status,
-            "error": res.error or "fetch_failed",
-        }
-        logger.error(f"[FAIL FETCH] #{task.idx} {task.url} : {fail['error']} (status={res.status})")
-        return None, fail
+    logger.debug("[START] #%s %s | %s", task.idx, task.name, task.url)
+    cache_dir = f"{args.output_dir}/cache" if args.cache else None
+    metrics = metrics or NULL_METRICS
+    profiler = profiler or NULL_PROFILER
+    # Body bytes count against --max-inflight-mb until parsing is done
+    with (budget.hold() if budget else nullcontext(lambda n: None)) as settle:
+        t0 = time.perf_counter()
+        with profiler.stage("fetch"):
+            res = fetch_with_retries(
+                task.url,
+                session=session,
+                max_retries=args.max_retries,
+                base_delay=args.base_delay,
+                timeout=(args.connect_timeout, args.read_timeout),
+                cache_dir=cache_dir,
+                logger=logger,
+                negative_ttl=args.negative_ttl,
+                offline=args.offline,
+                metrics=metrics,
+                hedge=hedge,
+                refresh=args.refresh,
+                parser_version=PARSER_VERSION,
+            )
+        metrics.observe("fetch", time.perf_counter() - t0)
+        settle(len(res.body or b""))
+        if not res.ok or not res.body:
+            fail = {
+                "index": task.idx,
+                "name": task.name,
+                "url": task.url,
+                "status": res.status,
+                "error": res.error or "fetch_failed",
+                "negative_cached": res.negative_cached,
+            }
+            metrics.add("pages_failed")
+            logger.error("[FAIL FETCH] #%s %s : %s (status=%s)", task.idx, task.url, fail['error'], res.status)
+            return None, fail
 
-    try:
-        parsed = parse_cbck_detail(res.text, task.url)
-        parsed["input_name"] = task.name
-        parsed["cached"] = res.cached
-        logger.info(f"[OK] #{task.idx} {task.name}")
-        logger.debug(f"[PARSED] #{task.idx} keys={list(parsed.keys())}")
-        return parsed, None
-    except Exception as e:
-        tb = traceback.format_exc(limit=2)
-        fail = {
-            "index": task.idx,
-            "name": task.name,
-            "url": task.url,
-            "status": res.status,
-            "error": f"parse_error: {e}",
-            "traceback": tb,
-        }
-        logger.error(f"[FAIL PARSE] #{task.idx} {task.url} : {e}")
-        return None, fail
+        try:
+            with metrics.timer("decode"), profiler.stage("decode"):
+                text = res.text
+            with metrics.timer("parse"), profiler.stage("parse"):
+                provenance: Dict[str, str] = {}
+                parsed = parse_cbck_detail(text, task.url, provenance)
+            parsed["input_name"] = task.name
+            parsed["_provenance"] = provenance  # popped by the results loop into FieldStats, never written
+            parsed["cached"] = res.cached
+            metrics.add("pages_ok")
+            logger.info("[OK] #%s %s", task.idx, task.name)
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("[PARSED] #%s keys=%s", task.idx, list(parsed.keys()))
+            return parsed, None
+        except Exception as e:
+            tb = traceback.format_exc(limit=2)
+            fail = {
+                "index": task.idx,
+                "name": task.name,
+                "url": task.url,
+                "status": res.status,
+                "error": f"parse_error: {e}",
+                "traceback": tb,
+            }
+            if cache_dir:
+                try:
+                    write_negative_cache(cache_dir, task.url, res.status, fail["error"], "parse", PARSER_VERSION)
+                except Exception as ce:
+                    logger.warning("[NEGATIVE CACHE WRITE ERROR] %s : %s", task.url, ce)
+            metrics.add("pages_failed")
+            logger.error("[FAIL PARSE] #%s %s : %s", task.idx, task.url, e)
+            return None, fail
 
 # ---------------------- Main ----------------------
 
@@ -321,16 +280,72 @@ def main() -> int:
     ap = argparse.ArgumentParser(description="CBCK Sisters detail pages batch parser")
     ap.add_argument("--input", required=True, help="Path to input JSON file (array of {name, detail_url})")
     ap.add_argument("--output-dir", default="out", help="Directory to write outputs")
-    ap.add_argument("--mode", choices=["full", "test"], default="test", help="Processing mode")
+    ap.add_argument("--mode", choices=["full", "test", "prefetch", "coverage", "merge"], default="test",
+                    help="Processing mode (prefetch: fetch into cache only, coverage: report cache coverage, "
+                         "merge: combine shard outputs)")
     ap.add_argument("--workers", type=int, default=6, help="Number of worker threads")
     ap.add_argument("--max-retries", type=int, default=3, help="Max HTTP retries per URL")
     ap.add_argument("--base-delay", type=float, default=1.0, help="Base delay for exponential backoff")
-    ap.add_argument("--timeout", type=float, default=20.0, help="Per-request timeout (seconds)")
+    ap.add_argument("--connect-timeout", type=float, default=5.0, help="TCP connect timeout (seconds)")
+    ap.add_argument("--read-timeout", "--timeout", type=float, default=20.0,
+                    help="Max seconds between bytes of a response (--timeout: old name)")
+    ap.add_argument("--refresh", action="store_true",
+                    help="Refresh run: re-fetch past the cache, most-likely-changed first "
+                         "(history in <output-dir>/refresh_history.sqlite)")
+    ap.add_argument("--budget", type=int, default=None, help="With --refresh: fetch at most N pages")
+    ap.add_argument("--deadline", type=parse_deadline, default=None,
+                    help="With --refresh: submit no new pages after this (45m, 2h, HH:MM or YYYY-MM-DDTHH:MM)")
+    ap.add_argument("--hedge", action="store_true",
+                    help="Send one duplicate of a request still unanswered after the observed p95 latency")
+    ap.add_argument("--hedge-budget", type=float, default=0.05, help="Max duplicates as a share of requests")
+    ap.add_argument("--hedge-quantile", type=float, default=0.95, help="Latency quantile that triggers a duplicate")
     ap.add_argument("--cache", action="store_true", help="Enable HTML caching to disk")
+    ap.add_argument("--negative-ttl", type=float, default=7 * 24 * 3600,
+                    help="Seconds to remember permanent fetch/parse failures (0 disables; needs --cache)")
+    ap.add_argument("--offline", action="store_true", help="Never hit the network; cache misses become failures")
+    ap.add_argument("--log-level", choices=LOG_LEVELS, default="INFO", help="Lowest level recorded (console shows INFO+)")
+    ap.add_argument("--profile", choices=["cpu", "mem"], default=None,
+                    help="cpu: per-stage cProfile dumps, mem: tracemalloc snapshots; written to <run dir>/profile/")
+    ap.add_argument("--log-json", action="store_true", help="Write logs/run.log as JSON lines")
+    ap.add_argument("--shard", type=parse_shard, default=None,
+                    help="Only process shard i of N (0-based, e.g. 0/4); outputs go to <output-dir>/shard-i-of-N/")
+    ap.add_argument("--frontier", default=None,
+                    help="SQLite work-queue file shared by several worker processes (seeded from --input)")
+    ap.add_argument("--worker-id", default=f"{socket.gethostname()}-{os.getpid()}",
+                    help="Lease owner name; with --frontier outputs go to <output-dir>/worker-<id>/")
+    ap.add_argument("--lease-seconds", type=float, default=300.0, help="Frontier lease duration")
+    ap.add_argument("--frontier-max-attempts", type=int, default=3, help="Frontier attempts before a task is failed")
+    ap.add_argument("--frontier-retry-delay", type=float, default=300.0,
+                    help="Seconds before a transiently failed frontier task is due again (doubles per attempt)")
+    ap.add_argument("--max-inflight", type=int, default=None,
+                    help="Max tasks submitted but not yet collected (default: 2 x workers)")
+    ap.add_argument("--max-inflight-mb", type=float, default=64.0,
+                    help="Cap on response bytes held between fetch and parse across workers (0 disables)")
+    ap.add_argument("--write-batch", type=int, default=256, help="Records per jsonl write batch")
+    ap.add_argument("--flush-interval", type=float, default=1.0, help="Max seconds before buffered records are written")
+    ap.add_argument("--coverage-drop", type=float, default=0.05,
+                    help="Warn when a field's fill rate falls (or its plaintext-fallback share rises) by more than "
+                         "this since the previous run's field_stats.json")
     args = ap.parse_args()
-
-    ensure_dir(args.output_dir)
-    logger = setup_logging(args.output_dir)
+    args.max_inflight = args.max_inflight or args.workers * 2
+    if args.refresh and (args.offline or args.frontier):
+        ap.error("--refresh fetches from the network in its own order; it cannot be combined with --offline/--frontier")
+    if not args.refresh and (args.budget is not None or args.deadline is not None):
+        ap.error("--budget/--deadline require --refresh")
+    # prefetch/coverage/offline only make sense with the disk cache
+    if args.mode in ("prefetch", "coverage") or args.offline:
+        args.cache = True
+
+    # Shard outputs go to their own sub-directory; the cache stays shared in output_dir/cache
+    # With --frontier every worker process writes to its own worker-<id> directory
+    if args.shard:
+        run_dir = f"{args.output_dir}/{shard_dir_name(args.shard)}"
+    elif args.frontier:
+        run_dir = f"{args.output_dir}/worker-{args.worker_id}"
+    else:
+        run_dir = args.output_dir
+    ensure_dir(run_dir)
+    logger = setup_logging(run_dir, args.log_level, args.log_json)
 
     # Load inputs
     try:
@@ -344,59 +359,137 @@ def main() -> int:
         return 2
 
     total = len(entries)
-    logger.info(f"Loaded {total} entries from {args.input}")
+    logger.info("Loaded %s entries from %s", total, args.input)
+    if args.mode == "merge":
+        merge_run_outputs(args.output_dir, entries, logger)
+        return 0
     if args.mode == "test" and total > 5:
         entries = entries[:5]
         logger.info("TEST mode: processing only the first 5 entries")
 
-    success_path = f"{args.output_dir}/success.jsonl"
-    failed_path = f"{args.output_dir}/failed.jsonl"
-    ensure_dir(args.output_dir)
+    tasks = [Task(idx=i, name=e.get("name", f"item_{i}"), url=e.get("detail_url", "")) for i, e in enumerate(entries, start=1)]
+    # Validate URLs
+    tasks = [t for t in tasks if t.url.startswith("http")]
+    if args.shard:
+        tasks = [t for t in tasks if in_shard(t.url, args.shard)]
+        logger.info("Shard %s/%s: %s tasks", args.shard[0], args.shard[1], len(tasks))
+    if not tasks:
+        logger.error("No valid URLs to process.")
+        return 3
+
+    if args.mode == "coverage":
+        log_cache_coverage(args.input, cache_coverage(tasks, f"{args.output_dir}/cache", args.negative_ttl), logger)
+        return 0
+
+    # Refresh runs: stalest / most change-prone (or recently failed) institutions first, up to --budget
+    history = None
+    if args.refresh:
+        history = RefreshHistory(os.path.join(args.output_dir, "refresh_history.sqlite"))
+        scored = history.order(tasks)
+        tasks = [t for t, _ in scored][:args.budget]
+        logger.info("[REFRESH] %s of %s tasks by staleness priority (budget=%s deadline=%s) top=%s",
+                    len(tasks), len(scored), args.budget,
+                    time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(args.deadline)) if args.deadline else None,
+                    [(t.name, round(pr, 3)) for t, pr in scored[:5]])
+
+    success_path = f"{run_dir}/success.jsonl"
+    failed_path = f"{run_dir}/failed.jsonl"
 
     ok_cnt = 0
     fail_cnt = 0
-    success_items: List[Dict[str, Any]] = []
+    changed = 0
+
+    # Prefetch: only warm the cache, parsing can run later with --offline
+    metrics = Metrics()
+    field_stats = FieldStats()
+    profiler = Profiler(args.profile, run_dir, focus=(os.path.basename(__file__),))
+    profiler.start()
+    hedge = HedgePolicy(args.hedge_budget, args.hedge_quantile, max_workers=2 * args.workers,
+                        metrics=metrics) if args.hedge else None
+    if args.mode == "prefetch":
+        with JsonlWriter(failed_path, metrics=metrics) as failed_f:
+            ok_cnt, fail_cnt = run_prefetch(tasks, requests.Session(), args, logger, failed_f, metrics, hedge)
+        metrics.write(run_dir)
+        profiler.finish()
+        logger.info("Prefetch done. OK=%s FAIL=%s -> %s/cache", ok_cnt, fail_cnt, args.output_dir)
+        return 0
 
     # Open output files in append-safe mode
-    success_f = open(success_path, "a", encoding="utf-8")
-    failed_f = open(failed_path, "a", encoding="utf-8")
+    frontier = None
+    if args.frontier:
+        frontier = Frontier(args.frontier, lease_seconds=args.lease_seconds,
+                            max_attempts=args.frontier_max_attempts, retry_delay=args.frontier_retry_delay)
+        added = frontier.seed((t.idx, t.name, t.url) for t in tasks)
+        logger.info("[FRONTIER] %s seeded=%s state=%s worker=%s",
+                    args.frontier, added, frontier.counts(), args.worker_id)
+
+    # success.json covers this run only: stream it from where success.jsonl ended at start
+    success_offset = os.path.getsize(success_path) if os.path.exists(success_path) else 0
+    budget = ByteBudget(int(args.max_inflight_mb * 1024 * 1024))
+    success_f = JsonlWriter(success_path, batch_size=args.write_batch, flush_interval=args.flush_interval, metrics=metrics)
+    failed_f = JsonlWriter(failed_path, batch_size=args.write_batch, flush_interval=args.flush_interval, metrics=metrics)
 
     try:
         session = requests.Session()
-        tasks = [Task(idx=i, name=e.get("name", f"item_{i}"), url=e.get("detail_url", "")) for i, e in enumerate(entries, start=1)]
-        # Validate URLs
-        tasks = [t for t in tasks if t.url.startswith("http")]
-        if not tasks:
-            logger.error("No valid URLs to process.")
-            return 3
-
         with cf.ThreadPoolExecutor(max_workers=args.workers) as ex:
-            futures = [ex.submit(worker, t, session, args, logger) for t in tasks]
-            for fut in cf.as_completed(futures):
-                succ, fail = fut.result()
+            if frontier:
+                def run_row(row):
+                    return worker(Task(idx=row["idx"], name=row["name"], url=row["url"]), session, args, logger,
+                                  budget, metrics, profiler, hedge)
+                results = drain_frontier(ex, frontier, args.worker_id, run_row, window=args.max_inflight,
+                                         metrics=metrics)
+            else:
+                def run_task(t):
+                    return worker(t, session, args, logger, budget, metrics, profiler, hedge)
+                results = bounded_results(ex, run_task, until_deadline(tasks, args.deadline), args.max_inflight,
+                                          metrics)
+            for succ, fail in results:
                 if succ:
-                    success_items.append(succ)
-                    success_f.write(json.dumps(succ, ensure_ascii=False) + "\n")
-                    success_f.flush()
+                    field_stats.add(succ, succ.pop("_provenance", None))
+                if history and succ:
+                    changed += history.record_success(succ["source_url"], succ)
+                if history and fail and not fail.get("negative_cached"):
+                    history.record_failure(fail["url"], fail.get("status", -1), fail.get("error", ""))
+                if succ:
+                    success_f.write(succ)
                     ok_cnt += 1
                 if fail:
-                    failed_f.write(json.dumps(fail, ensure_ascii=False) + "\n")
-                    failed_f.flush()
+                    failed_f.write(fail)
                     fail_cnt += 1
     finally:
         success_f.close()
         failed_f.close()
 
-    # Write aggregated success.json
-    with open(f"{args.output_dir}/success.json", "w", encoding="utf-8") as f:
-        json.dump(success_items, f, ensure_ascii=False, indent=2)
-
-    logger.info(f"Done. OK={ok_cnt} FAIL={fail_cnt} (total attempted={ok_cnt+fail_cnt})")
-    logger.info(f"Outputs:\n  {success_path}\n  {failed_path}\n  {args.output_dir}/success.json")
+    # Write aggregated success.json (streamed, one record in memory at a time)
+    write_json_array_from_jsonl(success_path, f"{run_dir}/success.json", success_offset)
+
+    metrics_json, metrics_prom = metrics.write(run_dir)
+    stats_json, coverage_alerts = field_stats.write(run_dir, drop=args.coverage_drop, logger=logger)
+    if args.profile:
+        summary = profiler.finish()
+        logger.info("[PROFILE %s] %s\n%s", args.profile, os.path.join(run_dir, "profile"),
+                    "\n".join(summary.splitlines()[:40]))
+    logger.info("Done. OK=%s FAIL=%s (total attempted=%s) peak_inflight_bytes=%s",
+                ok_cnt, fail_cnt, ok_cnt+fail_cnt, budget.peak)
+    logger.info("[METRICS] %s cache_hit_ratio=%s", metrics.summary(), metrics.snapshot()["cache_hit_ratio"])
+    logger.info("[FIELDS] %s", field_stats.summary())
+    for alert in coverage_alerts:
+        logger.warning("[COVERAGE ALERT] %s", alert)
+    if history:
+        logger.info("[REFRESH] fetched=%s changed=%s failed=%s not_reached=%s (deadline/budget)",
+                    ok_cnt, changed, fail_cnt, len(tasks) - ok_cnt - fail_cnt)
+        history.close()
+    if hedge:
+        logger.info("[HEDGE] requests=%s duplicates=%s (budget %.0f%%) trigger=%.3fs",
+                    hedge.calls, hedge.hedges, args.hedge_budget * 100, hedge.delay() or 0.0)
+        hedge.shutdown()
+    if frontier:
+        logger.info("[FRONTIER] state=%s", frontier.counts())
+    logger.info("Outputs:\n  %s\n  %s\n  %s/success.json\n  %s\n  %s\n  %s",
+                success_path, failed_path, run_dir, metrics_json, metrics_prom, stats_json)
     return 0
 
 # ---------------------- Entrypoint ----------------------
 
 if __name__ == "__main__":
-    import os
     main()
@@ -6,6 +6,14 @@ CBCK Monastery Detail Pages → JSON batch parser (남자 수도원/수도회 
 Usage:
   python cbck_monastery_batch_parser.py --input monasteries.json --mode test --output-dir out_m --cache
   python cbck_monastery_batch_parser.py --input monasteries.json --mode full --output-dir out_m --workers 8 --cache
+  python cbck_monastery_batch_parser.py --input monasteries.json --mode prefetch --output-dir out_m --workers 8
+  python cbck_monastery_batch_parser.py --input monasteries.json --mode coverage --output-dir out_m
+  python cbck_monastery_batch_parser.py --input monasteries.json --mode full --output-dir out_m --cache --offline
+  python cbck_monastery_batch_parser.py --input monasteries.json --mode full --output-dir out_m --cache --shard 0/4   # … 3/4 on other cores/boxes
+  python cbck_monastery_batch_parser.py --input monasteries.json --mode merge --output-dir out_m
+  python cbck_monastery_batch_parser.py --input monasteries.json --mode full --output-dir out_m --cache --frontier out_m/frontier.sqlite   # run N of these
+  python cbck_monastery_batch_parser.py --input monasteries.json --mode full --output-dir out_m --offline --profile cpu   # or mem
+  python cbck_monastery_batch_parser.py --input monasteries.json --mode full --output-dir out_m --cache --hedge --read-timeout 15
 
 Input JSON format:
 [
@@ -17,141 +25,63 @@ Outputs:
 - success.jsonl / success.json  : parsed results
 - failed.jsonl                  : fetch/parse failures
 - logs/run.log                  : detailed logs
-- cache/*.html                  : (optional) cached HTML by md5(url)
+- metrics.json / metrics.prom  : per-stage timings (p50/p95/p99), bytes, cache hit ratio (JSON / Prometheus text)
+- field_stats.json              : per-field fill rate, value lengths, provenance (structured/plaintext), roles; alerts vs the previous run
+- profile/                      : (--profile) cpu_<stage>.pstats or mem_end.tracemalloc, plus summary.txt
+- cache/*.body                  : (optional) raw (possibly gzip/br compressed) response bytes by md5(url)
+- cache/*.meta.json             : (optional) status/headers/content-encoding/charset of each cached response
+- cache/*.html                  : (legacy) cached UTF-8 HTML, still read on cache hits
+- cache/*.neg.json              : (optional) negative cache of permanent fetch/parse failures
 """
 from __future__ import annotations
 import argparse
 import concurrent.futures as cf
-import hashlib
 import json
 import logging
 import os
-import random
+import socket
 import sys
 import time
 import traceback
+from contextlib import nullcontext
 from dataclasses import dataclass
 from typing import Any, Dict, List, Optional, Tuple
-from urllib.parse import urlparse, parse_qs
 
 import requests
 from bs4 import BeautifulSoup
 
+from crawl_common import (
+    LOG_LEVELS, NULL_METRICS, NULL_PROFILER, ByteBudget, FieldStats, Frontier, HedgePolicy, JsonLogFormatter,
+    JsonlWriter, Metrics, Profiler, RefreshHistory, attach_queue_logging, bounded_results, cache_coverage,
+    clean_text, drain_frontier, extract_ids_from_url, fetch_with_retries, in_shard, log_cache_coverage,
+    merge_run_outputs, parse_deadline, parse_shard, run_prefetch, shard_dir_name, source_fingerprint,
+    until_deadline, write_json_array_from_jsonl, write_negative_cache,
+)
+
 # ---------------------- Logging ----------------------
 
-def setup_logging(out_dir: str) -> logging.Logger:
+def setup_logging(out_dir: str, level: str = "INFO", json_lines: bool = False) -> logging.Logger:
     os.makedirs(os.path.join(out_dir, "logs"), exist_ok=True)
     logger = logging.getLogger("cbck_monastery")
-    logger.setLevel(logging.DEBUG)
-    logger.handlers.clear()
 
     ch = logging.StreamHandler(sys.stdout)
     ch.setLevel(logging.INFO)
     ch.setFormatter(logging.Formatter("[%(levelname)s] %(message)s"))
-    logger.addHandler(ch)
 
     fh = logging.FileHandler(os.path.join(out_dir, "logs", "run.log"), encoding="utf-8")
     fh.setLevel(logging.DEBUG)
-    fh.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s %(message)s"))
-    logger.addHandler(fh)
+    fh.setFormatter(JsonLogFormatter() if json_lines else
+                    logging.Formatter("%(asctime)s %(levelname)s %(name)s %(message)s"))
 
+    # 핸들러 I/O 와 메시지 포매팅은 리스너 스레드에서 (워커 스레드는 큐에 넣기만 함)
+    attach_queue_logging(logger, [ch, fh], level)
     return logger
 
-# ---------------------- Utils ----------------------
-
-def md5(s: str) -> str:
-    return hashlib.md5(s.encode("utf-8")).hexdigest()
-
-def ensure_dir(path: str) -> None:
-    os.makedirs(path, exist_ok=True)
-
-def extract_ids_from_url(url: str) -> Dict[str, str]:
-    try:
-        q = parse_qs(urlparse(url).query)
-        return {
-            "code": (q.get("code", [None])[0] or ""),
-            "gyogu": (q.get("gyogu", [None])[0] or ""),
-            "gubn": (q.get("gubn", [None])[0] or ""),
-            "cgubn": (q.get("cgubn", [None])[0] or ""),
-        }
-    except Exception:
-        return {"code": "", "gyogu": "", "gubn": "", "cgubn": ""}
-
-# ---------------------- Networking (with cache/retries) ----------------------
-
-@dataclass
-class FetchResult:
-    url: str
-    ok: bool
-    status: int
-    text: Optional[str]
-    error: Optional[str]
-    cached: bool = False
-
-def fetch_with_retries(
-    url: str,
-    session: Optional[requests.Session],
-    max_retries: int,
-    base_delay: float,
-    timeout: float,
-    cache_dir: Optional[str],
-    logger: logging.Logger,
-) -> FetchResult:
-    cache_key = md5(url)
-    if cache_dir:
-        ensure_dir(cache_dir)
-        cache_path = os.path.join(cache_dir, f"{cache_key}.html")
-        if os.path.exists(cache_path):
-            try:
-                with open(cache_path, "r", encoding="utf-8") as f:
-                    html = f.read()
-                logger.debug(f"[CACHE HIT] {url}")
-                return FetchResult(url=url, ok=True, status=200, text=html, error=None, cached=True)
-            except Exception as e:
-                logger.warning(f"[CACHE READ ERROR] {url} : {e}")
-
-    headers = {
-        "User-Agent": "Mozilla/5.0 (compatible; CBCKMonasteryBatch/1.0)",
-        "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
-        "Accept-Language": "ko,en;q=0.8",
-        "Connection": "close",
-    }
-    sess = session or requests.Session()
-    last_err = None
-
-    for attempt in range(0, max_retries + 1):
-        try:
-            time.sleep(random.uniform(0.25, 0.6))
-            resp = sess.get(url, headers=headers, timeout=timeout)
-            status = resp.status_code
-            if 200 <= status < 300:
-                resp.encoding = resp.apparent_encoding or "utf-8"
-                html = resp.text
-                if cache_dir:
-                    try:
-                        with open(os.path.join(cache_dir, f"{cache_key}.html"), "w", encoding="utf-8") as f:
-                            f.write(html)
-                    except Exception as e:
-                        logger.warning(f"[CACHE WRITE ERROR] {url} : {e}")
-                return FetchResult(url=url, ok=True, status=status, text=html, error=None, cached=False)
-            elif status in (429, 500, 502, 503, 504):
-                last_err = f"HTTP {status}"
-                logger.warning(f"[RETRYABLE {status}] {url} (attempt {attempt}/{max_retries})")
-            else:
-                return FetchResult(url=url, ok=False, status=status, text=None, error=f"HTTP {status}")
-        except requests.RequestException as e:
-            last_err = f"RequestException: {e}"
-            logger.warning(f"[NETWORK ERROR] {url} : {e} (attempt {attempt}/{max_retries})")
-
-        if attempt < max_retries:
-            delay = base_delay * (2 ** attempt) + random.uniform(0, 0.5)
-            logger.debug(f"[BACKOFF] {url} sleeping {delay:.2f}s")
-            time.sleep(delay)
-
-    return FetchResult(url=url, ok=False, status=-1, text=None, error=last_err or "Unknown error")
-
 # ---------------------- Parsing ----------------------
 
+# 파싱 실패의 네거티브 캐시는 이 파일의 버전별: 파서를 고치면 다시 시도
+PARSER_VERSION = source_fingerprint(__file__)
+
 # === 새/개선된 매핑 ===
 FIELD_MAP = {
     "소속": "diocese",
@@ -176,9 +106,6 @@ SINGLE_ROLE_MAP = {
 REPEAT_ROLE_LABELS = {"거주"}
 REPEAT_ROLE_KEY = "residents"
 
-def clean_text(s: str) -> str:
-    return " ".join(s.split()) if s else ""
-
 def parse_structured_fields_and_roles(soup: BeautifulSoup):
     """table.small_table에서 필드 + 역할을 직접 파싱"""
     import re
@@ -315,18 +242,22 @@ def strip_artifacts(s: str) -> str:
     s = re.sub(r"【\d+[^】]*】", "", s)
     return clean_text(s)
 
-def try_get_title(soup: BeautifulSoup) -> Optional[str]:
+def try_get_title(soup: BeautifulSoup, provenance: Optional[Dict[str, str]] = None) -> Optional[str]:
+    provenance = provenance if provenance is not None else {}
     t = soup.select_one(".today1")
     if t:
+        provenance["title"] = "today1"
         return clean_text(t.get_text()).strip('"“”')
     # fallback: look for a bold title near the top
     strongs = soup.find_all("strong")
     for st in strongs[:5]:
         txt = clean_text(st.get_text())
         if txt and "세부정보" not in txt and len(txt) <= 80:
+            provenance["title"] = "strong"
             return txt.strip('"“”')
     # last resort: document title
     if soup.title and soup.title.string:
+        provenance["title"] = "doc_title"
         return clean_text(soup.title.string).split("-")[0].strip('"“”')
     return None
 
@@ -427,13 +358,19 @@ def parse_fields_from_text(text: str) -> Dict[str, Any]:
                 break
     return data
 
-def parse_cbck_monastery(html: str, url: str) -> Dict[str, Any]:
+def parse_cbck_monastery(html: str, url: str, provenance: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    """
+    provenance (optional): filled with key → which path produced it
+    ("structured" table, "plaintext" fallback, "url", title source), for the run's field statistics.
+    """
     soup = BeautifulSoup(html, "html.parser")
     item: Dict[str, Any] = {"source_url": url}
     item.update(extract_ids_from_url(url))
+    prov = provenance if provenance is not None else {}
+    prov.update(dict.fromkeys(item, "url"))
 
     # 1) Title
-    title = try_get_title(soup)
+    title = try_get_title(soup, prov)
     if title:
         item["title"] = title
 
@@ -448,13 +385,18 @@ def parse_cbck_monastery(html: str, url: str) -> Dict[str, Any]:
     # Fields: structured 우선, 없으면 텍스트로 폴백
     if fields_struct:
         item.update(fields_struct)
+        prov.update(dict.fromkeys(fields_struct, "structured"))
     else:
-        item.update(parse_fields_from_text(text))
+        fields_text = parse_fields_from_text(text)
+        item.update(fields_text)
+        prov.update(dict.fromkeys(fields_text, "plaintext"))
 
     # Roles: 1) 텍스트 폴백으로 채우고  2) 구조화 결과로 최종 덮어쓰기(우선순위 ↑)
     fallback_roles = parse_plaintext_roles_with_lookahead(text)
     item.update(fallback_roles)   # 약한 신뢰
     item.update(roles_struct)     # 강한 신뢰(최종 승리)
+    prov.update(dict.fromkeys(fallback_roles, "plaintext"))
+    prov.update(dict.fromkeys(roles_struct, "structured"))
 
     # 4) Normalize phone/fax
     for k in ("phone", "fax"):
@@ -471,40 +413,73 @@ class Task:
     name: str
     url: str
 
-def worker(task: Task, session: requests.Session, args, logger: logging.Logger) -> Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]:
-    logger.debug(f"[START] #{task.idx} {task.name} | {task.url}")
-    res = fetch_with_retries(
-        task.url,
-        session=session,
-        max_retries=args.max_retries,
-        base_delay=args.base_delay,
-        timeout=args.timeout,
-        cache_dir=(os.path.join(args.output_dir, "cache") if args.cache else None),
-        logger=logger,
-    )
-    if not res.ok or not res.text:
-        fail = {
-            "index": task.idx, "name": task.name, "url": task.url,
-            "status": res.status, "error": res.error or "fetch_failed"
-        }
-        logger.error(f"[FAIL FETCH] #{task.idx} {task.url} : {fail['error']} (status={res.status})")
-        return None, fail
+def worker(task: Task, session: requests.Session, args, logger: logging.Logger,
+           budget: Optional[ByteBudget] = None, metrics: Optional[Metrics] = None,
+           profiler: Optional[Profiler] = None,
+           hedge: Optional[HedgePolicy] = None) -> Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]:
+    logger.debug("[START] #%s %s | %s", task.idx, task.name, task.url)
+    cache_dir = os.path.join(args.output_dir, "cache") if args.cache else None
+    metrics = metrics or NULL_METRICS
+    profiler = profiler or NULL_PROFILER
+    # 본문 바이트는 파싱이 끝날 때까지 예산(--max-inflight-mb)에 잡혀 있음
+    with (budget.hold() if budget else nullcontext(lambda n: None)) as settle:
+        t0 = time.perf_counter()
+        with profiler.stage("fetch"):
+            res = fetch_with_retries(
+                task.url,
+                session=session,
+                max_retries=args.max_retries,
+                base_delay=args.base_delay,
+                timeout=(args.connect_timeout, args.read_timeout),
+                cache_dir=cache_dir,
+                logger=logger,
+                negative_ttl=args.negative_ttl,
+                offline=args.offline,
+                metrics=metrics,
+                hedge=hedge,
+                refresh=args.refresh,
+                parser_version=PARSER_VERSION,
+            )
+        metrics.observe("fetch", time.perf_counter() - t0)
+        settle(len(res.body or b""))
+        if not res.ok or not res.body:
+            fail = {
+                "index": task.idx, "name": task.name, "url": task.url,
+                "status": res.status, "error": res.error or "fetch_failed",
+                "negative_cached": res.negative_cached,
+            }
+            metrics.add("pages_failed")
+            logger.error("[FAIL FETCH] #%s %s : %s (status=%s)", task.idx, task.url, fail['error'], res.status)
+            return None, fail
 
-    try:
-        parsed = parse_cbck_monastery(res.text, task.url)
-        parsed["input_name"] = task.name
-        parsed["cached"] = res.cached
-        logger.info(f"[OK] #{task.idx} {task.name}")
-        logger.debug(f"[PARSED] #{task.idx} keys={list(parsed.keys())}")
-        return parsed, None
-    except Exception as e:
-        fail = {
-            "index": task.idx, "name": task.name, "url": task.url,
-            "status": res.status, "error": f"parse_error: {e}",
-            "traceback": traceback.format_exc(limit=2),
-        }
-        logger.error(f"[FAIL PARSE] #{task.idx} {task.url} : {e}")
-        return None, fail
+        try:
+            with metrics.timer("decode"), profiler.stage("decode"):
+                text = res.text
+            with metrics.timer("parse"), profiler.stage("parse"):
+                provenance: Dict[str, str] = {}
+                parsed = parse_cbck_monastery(text, task.url, provenance)
+            parsed["input_name"] = task.name
+            parsed["_provenance"] = provenance  # 결과 루프에서 꺼내 FieldStats 로 (저장되지 않음)
+            parsed["cached"] = res.cached
+            metrics.add("pages_ok")
+            logger.info("[OK] #%s %s", task.idx, task.name)
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("[PARSED] #%s keys=%s", task.idx, list(parsed.keys()))
+            return parsed, None
+        except Exception as e:
+            fail = {
+                "index": task.idx, "name": task.name, "url": task.url,
+                "status": res.status, "error": f"parse_error: {e}",
+                "traceback": traceback.format_exc(limit=2),
+            }
+            if cache_dir:
+                try:
+                    write_negative_cache(cache_dir, task.url, res.status, fail["error"], "parse", PARSER_VERSION)
+                except Exception as ce:
+                    logger.warning("[NEGATIVE CACHE WRITE ERROR] %s : %s", task.url, ce)
+            metrics.add("pages_failed")
+            logger.error("[FAIL PARSE] #%s %s : %s", task.idx, task.url, e)
+            return None, fail
 
 # ---------------------- Main ----------------------
 
@@ -512,16 +487,70 @@ def main() -> int:
     ap = argparse.ArgumentParser(description="CBCK Monastery detail pages batch parser")
     ap.add_argument("--input", required=True, help="Path to input JSON file (array of {name, detail_url})")
     ap.add_argument("--output-dir", default="out_m", help="Directory to write outputs")
-    ap.add_argument("--mode", choices=["full", "test"], default="test", help="Processing mode")
+    ap.add_argument("--mode", choices=["full", "test", "prefetch", "coverage", "merge"], default="test",
+                    help="Processing mode (prefetch: fetch into cache only, coverage: report cache coverage, "
+                         "merge: combine shard outputs)")
     ap.add_argument("--workers", type=int, default=6, help="Number of worker threads")
     ap.add_argument("--max-retries", type=int, default=3, help="Max HTTP retries per URL")
     ap.add_argument("--base-delay", type=float, default=1.0, help="Base delay for exponential backoff")
-    ap.add_argument("--timeout", type=float, default=20.0, help="Per-request timeout (seconds)")
+    ap.add_argument("--connect-timeout", type=float, default=5.0, help="TCP connect timeout (seconds)")
+    ap.add_argument("--read-timeout", "--timeout", type=float, default=20.0,
+                    help="Max seconds between bytes of a response (--timeout: old name)")
+    ap.add_argument("--refresh", action="store_true",
+                    help="Refresh run: re-fetch past the cache, most-likely-changed first "
+                         "(history in <output-dir>/refresh_history.sqlite)")
+    ap.add_argument("--budget", type=int, default=None, help="With --refresh: fetch at most N pages")
+    ap.add_argument("--deadline", type=parse_deadline, default=None,
+                    help="With --refresh: submit no new pages after this (45m, 2h, HH:MM or YYYY-MM-DDTHH:MM)")
+    ap.add_argument("--hedge", action="store_true",
+                    help="Send one duplicate of a request still unanswered after the observed p95 latency")
+    ap.add_argument("--hedge-budget", type=float, default=0.05, help="Max duplicates as a share of requests")
+    ap.add_argument("--hedge-quantile", type=float, default=0.95, help="Latency quantile that triggers a duplicate")
     ap.add_argument("--cache", action="store_true", help="Enable HTML caching to disk")
+    ap.add_argument("--negative-ttl", type=float, default=7 * 24 * 3600,
+                    help="Seconds to remember permanent fetch/parse failures (0 disables; needs --cache)")
+    ap.add_argument("--offline", action="store_true", help="Never hit the network; cache misses become failures")
+    ap.add_argument("--log-level", choices=LOG_LEVELS, default="INFO", help="Lowest level recorded (console shows INFO+)")
+    ap.add_argument("--profile", choices=["cpu", "mem"], default=None,
+                    help="cpu: per-stage cProfile dumps, mem: tracemalloc snapshots; written to <run dir>/profile/")
+    ap.add_argument("--log-json", action="store_true", help="Write logs/run.log as JSON lines")
+    ap.add_argument("--shard", type=parse_shard, default=None,
+                    help="Only process shard i of N (0-based, e.g. 0/4); outputs go to <output-dir>/shard-i-of-N/")
+    ap.add_argument("--frontier", default=None,
+                    help="SQLite work-queue file shared by several worker processes (seeded from --input)")
+    ap.add_argument("--worker-id", default=f"{socket.gethostname()}-{os.getpid()}",
+                    help="Lease owner name; with --frontier outputs go to <output-dir>/worker-<id>/")
+    ap.add_argument("--lease-seconds", type=float, default=300.0, help="Frontier lease duration")
+    ap.add_argument("--frontier-max-attempts", type=int, default=3, help="Frontier attempts before a task is failed")
+    ap.add_argument("--frontier-retry-delay", type=float, default=300.0,
+                    help="Seconds before a transiently failed frontier task is due again (doubles per attempt)")
+    ap.add_argument("--max-inflight", type=int, default=None,
+                    help="Max tasks submitted but not yet collected (default: 2 x workers)")
+    ap.add_argument("--max-inflight-mb", type=float, default=64.0,
+                    help="Cap on response bytes held between fetch and parse across workers (0 disables)")
+    ap.add_argument("--write-batch", type=int, default=256, help="Records per jsonl write batch")
+    ap.add_argument("--flush-interval", type=float, default=1.0, help="Max seconds before buffered records are written")
+    ap.add_argument("--coverage-drop", type=float, default=0.05,
+                    help="Warn when a field's fill rate falls (or its plaintext-fallback share rises) by more than "
+                         "this since the previous run's field_stats.json")
     args = ap.parse_args()
-
-    os.makedirs(args.output_dir, exist_ok=True)
-    logger = setup_logging(args.output_dir)
+    args.max_inflight = args.max_inflight or args.workers * 2
+    if args.refresh and (args.offline or args.frontier):
+        ap.error("--refresh fetches from the network in its own order; it cannot be combined with --offline/--frontier")
+    if not args.refresh and (args.budget is not None or args.deadline is not None):
+        ap.error("--budget/--deadline require --refresh")
+    if args.mode in ("prefetch", "coverage") or args.offline:
+        args.cache = True
+
+    # 샤드별 산출물은 하위 디렉터리에, 캐시는 output-dir/cache 를 공유
+    if args.shard:
+        run_dir = os.path.join(args.output_dir, shard_dir_name(args.shard))
+    elif args.frontier:
+        run_dir = os.path.join(args.output_dir, f"worker-{args.worker_id}")
+    else:
+        run_dir = args.output_dir
+    os.makedirs(run_dir, exist_ok=True)
+    logger = setup_logging(run_dir, args.log_level, args.log_json)
 
     try:
         with open(args.input, "r", encoding="utf-8") as f:
@@ -534,50 +563,130 @@ def main() -> int:
         return 2
 
     total = len(entries)
-    logger.info(f"Loaded {total} entries from {args.input}")
+    logger.info("Loaded %s entries from %s", total, args.input)
+    if args.mode == "merge":
+        merge_run_outputs(args.output_dir, entries, logger)
+        return 0
     if args.mode == "test" and total > 5:
         entries = entries[:5]
         logger.info("TEST mode: processing only the first 5 entries")
 
-    success_path = os.path.join(args.output_dir, "success.jsonl")
-    failed_path  = os.path.join(args.output_dir, "failed.jsonl")
+    tasks = [Task(idx=i, name=e.get("name", f"item_{i}"), url=e.get("detail_url", "")) for i, e in enumerate(entries, start=1)]
+    tasks = [t for t in tasks if t.url.startswith("http")]
+    if args.shard:
+        tasks = [t for t in tasks if in_shard(t.url, args.shard)]
+        logger.info("Shard %s/%s: %s tasks", args.shard[0], args.shard[1], len(tasks))
+    if not tasks:
+        logger.error("No valid URLs to process.")
+        return 3
+
+    if args.mode == "coverage":
+        log_cache_coverage(args.input, cache_coverage(tasks, os.path.join(args.output_dir, "cache"), args.negative_ttl), logger)
+        return 0
+
+    # 갱신 실행: 오래됐고 자주 바뀌던(또는 최근 실패한) 기관부터, --budget 건까지
+    history = None
+    if args.refresh:
+        history = RefreshHistory(os.path.join(args.output_dir, "refresh_history.sqlite"))
+        scored = history.order(tasks)
+        tasks = [t for t, _ in scored][:args.budget]
+        logger.info("[REFRESH] %s of %s tasks by staleness priority (budget=%s deadline=%s) top=%s",
+                    len(tasks), len(scored), args.budget,
+                    time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(args.deadline)) if args.deadline else None,
+                    [(t.name, round(pr, 3)) for t, pr in scored[:5]])
+
+    success_path = os.path.join(run_dir, "success.jsonl")
+    failed_path  = os.path.join(run_dir, "failed.jsonl")
     ok_cnt = 0
     fail_cnt = 0
-    success_items: List[Dict[str, Any]] = []
-
-    sf = open(success_path, "a", encoding="utf-8")
-    ff = open(failed_path, "a", encoding="utf-8")
+    changed = 0
+
+    metrics = Metrics()
+    field_stats = FieldStats()
+    profiler = Profiler(args.profile, run_dir, focus=(os.path.basename(__file__),))
+    profiler.start()
+    hedge = HedgePolicy(args.hedge_budget, args.hedge_quantile, max_workers=2 * args.workers,
+                        metrics=metrics) if args.hedge else None
+    if args.mode == "prefetch":
+        with JsonlWriter(failed_path, metrics=metrics) as ff:
+            ok_cnt, fail_cnt = run_prefetch(tasks, requests.Session(), args, logger, ff, metrics, hedge)
+        metrics.write(run_dir)
+        profiler.finish()
+        logger.info("Prefetch done. OK=%s FAIL=%s -> %s", ok_cnt, fail_cnt, os.path.join(args.output_dir, 'cache'))
+        return 0
+
+    frontier = None
+    if args.frontier:
+        frontier = Frontier(args.frontier, lease_seconds=args.lease_seconds,
+                            max_attempts=args.frontier_max_attempts, retry_delay=args.frontier_retry_delay)
+        added = frontier.seed((t.idx, t.name, t.url) for t in tasks)
+        logger.info("[FRONTIER] %s seeded=%s state=%s worker=%s",
+                    args.frontier, added, frontier.counts(), args.worker_id)
+
+    # success.json 은 이번 실행분만: 시작 시점의 jsonl 끝 위치부터 스트리밍
+    success_offset = os.path.getsize(success_path) if os.path.exists(success_path) else 0
+    budget = ByteBudget(int(args.max_inflight_mb * 1024 * 1024))
+    sf = JsonlWriter(success_path, batch_size=args.write_batch, flush_interval=args.flush_interval, metrics=metrics)
+    ff = JsonlWriter(failed_path, batch_size=args.write_batch, flush_interval=args.flush_interval, metrics=metrics)
 
     try:
         session = requests.Session()
-        tasks = [Task(idx=i, name=e.get("name", f"item_{i}"), url=e.get("detail_url", "")) for i, e in enumerate(entries, start=1)]
-        tasks = [t for t in tasks if t.url.startswith("http")]
-        if not tasks:
-            logger.error("No valid URLs to process.")
-            return 3
-
         with cf.ThreadPoolExecutor(max_workers=args.workers) as ex:
-            futures = [ex.submit(worker, t, session, args, logger) for t in tasks]
-            for fut in cf.as_completed(futures):
-                succ, fail = fut.result()
+            if frontier:
+                def run_row(row):
+                    return worker(Task(idx=row["idx"], name=row["name"], url=row["url"]), session, args, logger,
+                                  budget, metrics, profiler, hedge)
+                results = drain_frontier(ex, frontier, args.worker_id, run_row, window=args.max_inflight,
+                                         metrics=metrics)
+            else:
+                def run_task(t):
+                    return worker(t, session, args, logger, budget, metrics, profiler, hedge)
+                results = bounded_results(ex, run_task, until_deadline(tasks, args.deadline), args.max_inflight,
+                                          metrics)
+            for succ, fail in results:
+                if succ:
+                    field_stats.add(succ, succ.pop("_provenance", None))
+                if history and succ:
+                    changed += history.record_success(succ["source_url"], succ)
+                if history and fail and not fail.get("negative_cached"):
+                    history.record_failure(fail["url"], fail.get("status", -1), fail.get("error", ""))
                 if succ:
-                    success_items.append(succ)
-                    sf.write(json.dumps(succ, ensure_ascii=False) + "\n")
-                    sf.flush()
+                    sf.write(succ)
                     ok_cnt += 1
                 if fail:
-                    ff.write(json.dumps(fail, ensure_ascii=False) + "\n")
-                    ff.flush()
+                    ff.write(fail)
                     fail_cnt += 1
     finally:
         sf.close()
         ff.close()
 
-    with open(os.path.join(args.output_dir, "success.json"), "w", encoding="utf-8") as f:
-        json.dump(success_items, f, ensure_ascii=False, indent=2)
-
-    logger.info(f"Done. OK={ok_cnt} FAIL={fail_cnt} (total attempted={ok_cnt+fail_cnt})")
-    logger.info(f"Outputs:\n  {success_path}\n  {failed_path}\n  {os.path.join(args.output_dir, 'success.json')}")
+    write_json_array_from_jsonl(success_path, os.path.join(run_dir, "success.json"), success_offset)
+
+    metrics_json, metrics_prom = metrics.write(run_dir)
+    stats_json, coverage_alerts = field_stats.write(run_dir, drop=args.coverage_drop, logger=logger)
+    if args.profile:
+        summary = profiler.finish()
+        logger.info("[PROFILE %s] %s\n%s", args.profile, os.path.join(run_dir, "profile"),
+                    "\n".join(summary.splitlines()[:40]))
+    logger.info("Done. OK=%s FAIL=%s (total attempted=%s) peak_inflight_bytes=%s",
+                ok_cnt, fail_cnt, ok_cnt+fail_cnt, budget.peak)
+    logger.info("[METRICS] %s cache_hit_ratio=%s", metrics.summary(), metrics.snapshot()["cache_hit_ratio"])
+    logger.info("[FIELDS] %s", field_stats.summary())
+    for alert in coverage_alerts:
+        logger.warning("[COVERAGE ALERT] %s", alert)
+    if history:
+        logger.info("[REFRESH] fetched=%s changed=%s failed=%s not_reached=%s (deadline/budget)",
+                    ok_cnt, changed, fail_cnt, len(tasks) - ok_cnt - fail_cnt)
+        history.close()
+    if hedge:
+        logger.info("[HEDGE] requests=%s duplicates=%s (budget %.0f%%) trigger=%.3fs",
+                    hedge.calls, hedge.hedges, args.hedge_budget * 100, hedge.delay() or 0.0)
+        hedge.shutdown()
+    if frontier:
+        logger.info("[FRONTIER] state=%s", frontier.counts())
+    logger.info("Outputs:\n  %s\n  %s\n  %s\n  %s\n  %s\n  %s",
+                success_path, failed_path, os.path.join(run_dir, 'success.json'), metrics_json, metrics_prom,
+                stats_json)
     return 0
 
 if __name__ == "__main__":
@@ -3,27 +3,56 @@
 """
 CBCK '축성생활회와 사도생활단(남자, gubn=6)' 전체 페이지 크롤러 (강화 로깅)
 - 상세 링크(DetailInfo.aspx)를 name + absolute URL 로 수집
-- 콘솔 + 파일 로그, HTML 덤프, JS openNewWindow() 처리
+- 콘솔 + 파일 로그, JS openNewWindow() 처리
+- 최근 목록 페이지는 압축 링버퍼에 보관, 이상(링크 0건·구조 변경·HTTP 오류) 시에만 덤프 (--dump-all: 전부)
 - 상대경로(./Catholic/DetailInfo.aspx) 및 대소문자 혼재 대응
+- 목록 요청은 429/503 등 일시 오류·연결 끊김에 백오프 재시도 (Retry-After 준수, --max-retries/--base-delay)
+- --metrics-dir DIR: 목록 요청 시간(p50/p95/p99)·상태 코드·재시도 횟수를 DIR/metrics.json(.prom)에 기록
 - 여성 버전과 결과/로그/덤프 파일명이 겹치지 않도록 분리
+- --partitioned: 교구(gyogu)별 병렬 수집, 교구별 건수로 빈 교구 스킵/완료 판정
+- --gyogu CODE : 한 교구만 다시 수집해 기존 결과(--output)에 병합 (광고 건수보다 적게 모이면 병합하지 않고 종료 코드 1)
+- --incremental: 이전 결과(--output)와 1페이지 건수를 비교해 바뀐 교구만 재수집, 링크 diff 출력
+  (목록 요청 실패 등으로 끝까지 못 모은 교구는 이전 항목 유지, 삭제로 보지 않고 종료 코드 1)
+
+Usage:
+  python crawl_monastery_links.py
+  python crawl_monastery_links.py --partitioned --workers 4
+  python crawl_monastery_links.py --gyogu 201000011
+  python crawl_monastery_links.py --incremental
+  python crawl_monastery_links.py --base-url http://127.0.0.1:8800 --delay 0   # mock_cbck_server.py
 """
 
+import os
 import re
+import sys
 import time
 import json
 import logging
 import pathlib
+import argparse
+import concurrent.futures as cf
 from typing import Optional
 from urllib.parse import urljoin, urlparse, parse_qs
 
 import requests
 from bs4 import BeautifulSoup
 
+from crawl_common import (
+    ALL_GYOGU, DEFAULT_PAGE_SIZE, LOG_LEVELS, RETRYABLE_STATUSES, DebugCapture, LazyFileHandler, Metrics,
+    attach_queue_logging, backoff_delay, cached_page_size, detach_queue_logging, iter_anchors, link_diff,
+    list_requests, parse_diocese_counts, parse_retry_after, partition_counts, partition_of, probe_page_size,
+    scoped_html, store_page_size, use_json_file_logs,
+)
+
 BASE = "https://directory.cbck.or.kr"
 LIST_TMPL = (
     "https://directory.cbck.or.kr/onlineAddress/SearchList.aspx"
-    "?cgubn=g&gubn=6&gyogu=all&tbxSearch=&char=all&paged=10&start={start}"
+    "?cgubn=g&gubn=6&gyogu={gyogu}&tbxSearch=&char=all&paged={paged}&start={start}"
 )
+PAGE_SIZE = DEFAULT_PAGE_SIZE  # main()에서 협상/캐시된 값으로 교체
+PAGE_SIZE_CACHE = "list_page_size.json"
+MAX_RETRIES = 3   # 목록 요청 재시도 횟수 (main()의 --max-retries)
+BASE_DELAY = 1.0  # 재시도 백오프 기준 초 (main()의 --base-delay)
 
 HEADERS = {
     "User-Agent": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 "
@@ -41,13 +70,10 @@ JS_OPEN_RE = re.compile(r"(?:openNewWindow|window\.open)\s*\(\s*['\"]([^'\"]+)['
 
 # -------- Logging setup (남자 전용 파일명) --------
 
-def setup_logger():
-    log_dir = pathlib.Path("logs_male")
-    log_dir.mkdir(parents=True, exist_ok=True)
-    log_file = log_dir / "crawl_male.log"
+def setup_logger(log_dir: str = "logs_male", level: str = "INFO"):
+    log_file = pathlib.Path(log_dir) / "crawl_male.log"
 
     logger = logging.getLogger("cbck_male")
-    logger.setLevel(logging.DEBUG)
 
     # 콘솔
     sh = logging.StreamHandler()
@@ -55,40 +81,84 @@ def setup_logger():
     sh.setFormatter(logging.Formatter("[%(levelname)s] %(message)s"))
 
     # 파일 (DEBUG 상세)
-    fh = logging.FileHandler(log_file, encoding="utf-8")
+    fh = LazyFileHandler(log_file)  # 첫 기록 때 디렉터리·파일 생성 (import 만으로는 아무것도 만들지 않음)
     fh.setLevel(logging.DEBUG)
     fh.setFormatter(logging.Formatter(
         "%(asctime)s %(levelname)s %(name)s %(funcName)s:%(lineno)d - %(message)s"
     ))
 
-    logger.handlers.clear()
-    logger.addHandler(sh)
-    logger.addHandler(fh)
-    return logger, log_file
+    # 핸들러는 리스너 스레드에서 처리 (레벨/JSON 여부는 main()에서 --log-level/--log-json 으로 조정)
+    listener = attach_queue_logging(logger, [sh, fh], level)
+    return logger, log_file, listener
 
 
-logger, log_file = setup_logger()
+def configure_logging(log_dir: str, level: str = "INFO", dump_dir: Optional[str] = None) -> None:
+    """
+    다른 프로그램이 이 모듈을 import 해서 쓸 때(예: crawl_refresh_daemon) 로그 파일 위치·레벨과
+    이상 페이지 덤프 디렉터리를 바꿈. import 시 만든 핸들러는 비우고 닫은 뒤 새로 붙임.
+    """
+    global logger, log_file, log_listener, DUMP_DIR, debug_capture
+    detach_queue_logging(log_listener)
+    logger, log_file, log_listener = setup_logger(log_dir, level)
+    DUMP_DIR = dump_dir or DUMP_DIR
+    debug_capture = DebugCapture(DUMP_DIR, logger=logger)
 
 
-# -------- HTTP fetch & dump --------
+logger, log_file, log_listener = setup_logger()
+DUMP_DIR = "debug_pages_male"
+debug_capture = DebugCapture(DUMP_DIR, logger=logger)
+metrics = Metrics()  # 목록 요청 시간(fetch: 재시도 포함 p50/p95/p99)·상태 코드·재시도 횟수 (--metrics-dir 로 기록)
 
-def fetch(session: requests.Session, url: str) -> str:
-    logger.info(f"GET {url}")
-    r = session.get(url, headers=HEADERS, timeout=20)
-    logger.debug(f"status={r.status_code} final_url={r.url} encoding={r.encoding} len={len(r.content)}")
-    r.raise_for_status()
-    # 인코딩 보정
-    if not r.encoding or r.encoding.lower() in ("iso-8859-1", "latin-1"):
-        r.encoding = r.apparent_encoding or "utf-8"
-    return r.text
 
+# -------- HTTP fetch & dump --------
 
-def dump_html(start: int, html: str):
-    dump_dir = pathlib.Path("debug_pages_male")
-    dump_dir.mkdir(parents=True, exist_ok=True)
-    path = dump_dir / f"list_start_{start}.html"
-    path.write_text(html, encoding="utf-8")
-    logger.info(f"Saved HTML dump: {path}")
+def fetch(session: requests.Session, url: str) -> str:
+    """
+    목록 페이지 한 장. 일시 오류(429/503 등)·연결 끊김은 MAX_RETRIES 회까지 지수 백오프 후 재시도
+    (Retry-After 가 더 길면 그만큼 대기). 재시도가 다 떨어지면 마지막 예외를 그대로 올림.
+    소요 시간(재시도·대기 포함)은 metrics 의 fetch 단계로 기록.
+    """
+    t0 = time.perf_counter()
+    try:
+        for attempt in range(MAX_RETRIES + 1):
+            retry_after = 0.0
+            logger.info("GET %s", url)
+            try:
+                r = session.get(url, headers=HEADERS, timeout=20)
+            except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError) as e:
+                metrics.add("network_errors")
+                if attempt >= MAX_RETRIES:
+                    raise
+                logger.warning("network error %s: %s (attempt %s/%s)", url, e, attempt + 1, MAX_RETRIES)
+            else:
+                metrics.add(f"http_{r.status_code}")
+                logger.debug("status=%s final_url=%s encoding=%s len=%s", r.status_code, r.url, r.encoding, len(r.content))
+                if r.status_code not in RETRYABLE_STATUSES or attempt >= MAX_RETRIES:
+                    r.raise_for_status()
+                    # 인코딩 보정
+                    if not r.encoding or r.encoding.lower() in ("iso-8859-1", "latin-1"):
+                        r.encoding = r.apparent_encoding or "utf-8"
+                    return r.text
+                retry_after = parse_retry_after(r.headers.get("Retry-After"))
+                logger.warning("HTTP %s %s (attempt %s/%s)", r.status_code, url, attempt + 1, MAX_RETRIES)
+            delay = backoff_delay(attempt, BASE_DELAY, retry_after)
+            logger.debug("backoff %.2fs before retrying %s", delay, url)
+            metrics.add("retries")
+            with metrics.timer("backoff_wait"):
+                time.sleep(delay)
+    finally:
+        metrics.observe("fetch", time.perf_counter() - t0)
+
+
+def page_key(start: int, gyogu: str = ALL_GYOGU) -> str:
+    prefix = "list" if gyogu == ALL_GYOGU else f"list_g{gyogu}"
+    return f"{prefix}_start_{start}"
+
+
+def capture_fetch_error(key: str, url: str, e: Exception):
+    """HTTP 오류 응답 본문(있으면)과 직전 페이지들을 덤프"""
+    resp = getattr(e, "response", None)
+    debug_capture.anomaly("fetch_error", key, url, html=resp.text if resp is not None else None, detail=str(e))
 
 
 # -------- Extractor --------
@@ -100,20 +170,50 @@ def is_male_detail(url: str) -> bool:
     return (cgubn == "g" and gubn == "6")
 
 
-def extract_links_from_list_page(html: str, list_url: str, logger: Optional[logging.Logger] = None):
+def fast_list_anchors(html: str) -> list:
+    """#Category_SearchList 구간만 정규식으로 훑어 (name, href, onclick) 목록 반환 (트리 생성 없음)."""
+    region = scoped_html(html, "Category_SearchList")
+    if region is None:
+        return []
+    return [(text, attrs["href"], attrs.get("onclick", "")) for text, attrs in iter_anchors(region) if "href" in attrs]
+
+
+def soup_list_anchors(html: str) -> list:
+    """BeautifulSoup 경로 (fast path 가 0건일 때의 폴백): (name, href, onclick) 목록."""
     soup = BeautifulSoup(html, "html.parser")
 
     # 목록 영역으로 범위를 좁혀 불필요한 a 태그를 배제
     scope = soup.select_one("#Category_SearchList") or soup
-    anchors = scope.find_all("a", href=True)
+    return [(a.get_text(" ", strip=True), a.get("href", "") or "", a.get("onclick", "") or "")
+            for a in scope.find_all("a", href=True)]
+
+
+def extract_links_from_list_page(html: str, list_url: str, logger: Optional[logging.Logger] = None):
+    # 빠른 경로 우선, 0건이면 soup 로 다시 파싱 (마크업 변경 등에도 결과 보장)
+    path = "fast"
+    anchors = fast_list_anchors(html)
+    out = collect_detail_links(anchors, list_url)
+    if not out:
+        path = "soup"
+        anchors = soup_list_anchors(html)
+        out = collect_detail_links(anchors, list_url)
+
+    if logger and logger.isEnabledFor(logging.DEBUG):
+        logger.debug("scoped_anchors=%s in #Category_SearchList (%s path)", len(anchors), path)
+        for i, (name, href, onclick) in enumerate(anchors[:20]):
+            logger.debug("sample_scoped_anchor[%s]: text='%s' href='%s' onclick='%s'", i, name, href, onclick)
 
     if logger:
-        logger.debug(f"scoped_anchors={len(anchors)} in #Category_SearchList")
-        for i, a in enumerate(anchors[:20]):
-            logger.debug(
-                f"sample_scoped_anchor[{i}]: text='{a.get_text(strip=True)}' href='{a.get('href')}' onclick='{a.get('onclick')}'"
-            )
+        logger.info("extracted_links=%s from %s (%s path)", len(out), list_url, path)
+        if logger.isEnabledFor(logging.DEBUG):
+            for i, item in enumerate(out[:10]):
+                logger.debug("extracted[%s] %s", i, item)
+
+    return out
 
+
+def collect_detail_links(anchors: list, list_url: str) -> list:
+    """(name, href, onclick) 앵커 목록 → 중복 없는 [{"name", "detail_url"}] (두 경로 공통 필터)."""
     out, seen = [], set()
 
     def maybe_add(name: str, href_candidate: str):
@@ -143,11 +243,7 @@ def extract_links_from_list_page(html: str, list_url: str, logger: Optional[logg
         out.append({"name": name or "", "detail_url": abs_url})
 
     # 앵커 순회: href / onclick 모두 maybe_add에 태워줌
-    for a in anchors:
-        name = a.get_text(" ", strip=True)
-        href = a.get("href", "") or ""
-        onclick = a.get("onclick", "") or ""
-
+    for name, href, onclick in anchors:
         # 페이지네이션 숫자(1,2,3...)는 스킵(단, 내부에 detailinfo가 숨어 있으면 살림)
         if name.isdigit() and not ("detailinfo.aspx" in href.lower() or "detailinfo.aspx" in onclick.lower()):
             continue
@@ -156,39 +252,38 @@ def extract_links_from_list_page(html: str, list_url: str, logger: Optional[logg
         if onclick:
             maybe_add(name, onclick)  # JS 핸들러 내부 경로
 
-    if logger:
-        logger.info(f"extracted_links={len(out)} from {list_url}")
-        for i, item in enumerate(out[:10]):
-            logger.debug(f"extracted[{i}] {item}")
-
     return out
 
 
 # -------- Crawl loop --------
 
-def crawl_all(max_pages: int = 1000, delay: float = 0.8, hard_cap: int = 10000):
-    session = requests.Session()
+def crawl_all(max_pages: int = 1000, delay: float = 0.8, hard_cap: int = 10000, session: Optional[requests.Session] = None):
+    own_session = session is None
+    session = session or requests.Session()
     all_items = []
     all_seen_urls = set()
 
     start = 1
     pages = 0
     while pages < max_pages:
-        list_url = LIST_TMPL.format(start=start)
+        list_url = LIST_TMPL.format(gyogu=ALL_GYOGU, paged=PAGE_SIZE, start=start)
         try:
             html = fetch(session, list_url)
         except Exception as e:
-            logger.exception(f"Fetch failed at start={start}: {e}")
+            logger.exception("Fetch failed at start=%s: %s", start, e)
+            capture_fetch_error(page_key(start), list_url, e)
             break
 
-        # 덤프 저장(첫 페이지 + 수집 0개일 때 유용)
-        dump_html(start, html)
+        # 최근 페이지는 압축 링버퍼에만 보관 (이상 발생 시에만 디스크에 덤프)
+        debug_capture.record(page_key(start), list_url, html)
 
         page_items = extract_links_from_list_page(html, list_url, logger=logger)
 
         # 수집 0개면 구조 변경/차단 가능성 → 덤프 확인 후 종료
         if not page_items:
-            logger.warning(f"No items extracted at start={start}. Stopping.")
+            logger.warning("No items extracted at start=%s. Stopping.", start)
+            if start == 1:  # 마지막 페이지 다음의 빈 목록은 정상 종료
+                debug_capture.anomaly("no_links", page_key(start), list_url)
             break
 
         # 중복 제외 누적
@@ -199,34 +294,314 @@ def crawl_all(max_pages: int = 1000, delay: float = 0.8, hard_cap: int = 10000):
                 all_seen_urls.add(url)
                 all_items.append(it)
                 new_cnt += 1
-        logger.info(f"page_done start={start} page_items={len(page_items)} new_added={new_cnt} total={len(all_items)}")
+        logger.info("page_done start=%s page_items=%s new_added=%s total=%s",
+                    start, len(page_items), new_cnt, len(all_items))
 
         # 안전 종료 조건
         if len(all_items) >= hard_cap:
-            logger.warning(f"Hard cap reached ({hard_cap}). Stopping.")
+            logger.warning("Hard cap reached (%s). Stopping.", hard_cap)
             break
 
-        # 다음 페이지
-        start += 10
+        # 다음 페이지 (start 는 항목 오프셋: 실제 받은 건수만큼 전진 → 서버가 paged 를 줄여도 누락 없음)
+        start += len(page_items)
         pages += 1
         time.sleep(delay)
 
-    session.close()
+    if own_session:
+        session.close()
+    logger.info("list requests: %s at paged=%s (paged=%s would need ~%s)",
+                pages + 1, PAGE_SIZE, DEFAULT_PAGE_SIZE, list_requests(len(all_items), DEFAULT_PAGE_SIZE) + 1)
     return all_items
 
 
+# -------- Partitioned crawl (gyogu) --------
+
+def crawl_partition(gyogu: str, expected: int, delay: float = 0.8, max_pages: int = 1000,
+                    session: Optional[requests.Session] = None):
+    """
+    한 교구(gyogu)의 목록을 expected 건수에 도달할 때까지 수집.
+    반환: (items, 요청한 페이지 수, complete)  complete = 가져오기 오류 없이 expected 건 이상 수집
+    complete 가 아니면 items 는 일부일 뿐이므로 교구 교체/삭제 판정에 쓰면 안 됨
+    session 을 넘기면 그 연결 풀을 쓰고 닫지 않음 (데몬처럼 주기마다 재사용하는 경우)
+    """
+    own_session = session is None
+    session = session or requests.Session()
+    items, seen = [], set()
+    start = 1
+    pages = 0
+    fetch_failed = False
+    try:
+        while pages < max_pages and len(items) < expected:
+            list_url = LIST_TMPL.format(gyogu=gyogu, paged=PAGE_SIZE, start=start)
+            try:
+                html = fetch(session, list_url)
+            except Exception as e:
+                logger.exception("Fetch failed gyogu=%s start=%s: %s", gyogu, start, e)
+                capture_fetch_error(page_key(start, gyogu), list_url, e)
+                fetch_failed = True
+                break
+            debug_capture.record(page_key(start, gyogu), list_url, html)
+            page_items = extract_links_from_list_page(html, list_url, logger=logger)
+            if not page_items:
+                logger.warning("No items extracted gyogu=%s start=%s. Stopping partition.", gyogu, start)
+                debug_capture.anomaly("no_links", page_key(start, gyogu), list_url)
+                break
+            for it in page_items:
+                if it["detail_url"] not in seen:
+                    seen.add(it["detail_url"])
+                    items.append(it)
+            start += len(page_items)
+            pages += 1
+            if len(items) < expected:
+                time.sleep(delay)
+    finally:
+        if own_session:
+            session.close()
+    return items, pages, not fetch_failed and len(items) >= expected
+
+
+def crawl_partitioned(workers: int = 4, delay: float = 0.8, only_gyogu: Optional[str] = None,
+                      first_html: Optional[str] = None, session: Optional[requests.Session] = None):
+    """
+    1페이지의 교구별 건수([N])를 읽어 건수>0 인 교구만 병렬 수집.
+    각 교구는 광고된 건수만큼 모이면 완료로 판정(추가 페이지 요청 없음).
+    반환: (items, partitions)  partitions = [{gyogu, name, count, collected, complete, pages}]
+    """
+    if first_html is None:
+        first_url = LIST_TMPL.format(gyogu=ALL_GYOGU, paged=PAGE_SIZE, start=1)
+        if session is None:
+            with requests.Session() as own:
+                first_html = fetch(own, first_url)
+        else:
+            first_html = fetch(session, first_url)
+        debug_capture.record(page_key(1), first_url, first_html)
+    counts = parse_diocese_counts(first_html)
+    total = next((c["count"] for c in counts if c["gyogu"] == ALL_GYOGU), None)
+    parts = [c for c in counts if c["gyogu"] != ALL_GYOGU]
+    if only_gyogu:
+        parts = [c for c in parts if c["gyogu"] == only_gyogu]
+        if not parts:
+            raise ValueError(f"gyogu={only_gyogu} not found in category counts")
+    skipped = [c for c in parts if c["count"] == 0]
+    parts = [c for c in parts if c["count"] > 0]
+    logger.info("partitions: total=%s non_empty=%s skipped_empty=%s", total, len(parts), len(skipped))
+
+    results = {}
+    with cf.ThreadPoolExecutor(max_workers=max(1, workers)) as ex:
+        futs = {ex.submit(crawl_partition, c["gyogu"], c["count"], delay, session=session): c for c in parts}
+        for fut in cf.as_completed(futs):
+            c = futs[fut]
+            results[c["gyogu"]], c["pages"], c["complete"] = fut.result()
+            c["collected"] = len(results[c["gyogu"]])
+            log = logger.info if c["complete"] else logger.warning
+            log("partition_done gyogu=%s name=%s collected=%s/%s", c["gyogu"], c["name"], c["collected"], c["count"])
+
+    # 교구 순서(목록 블록 순서)대로 합치고 중복 제거
+    all_items, seen = [], set()
+    for c in parts:
+        for it in results.get(c["gyogu"], []):
+            if it["detail_url"] not in seen:
+                seen.add(it["detail_url"])
+                all_items.append(it)
+    if total is not None and not only_gyogu and len(all_items) != total:
+        logger.warning("partitioned total mismatch: collected=%s advertised=%s", len(all_items), total)
+    logger.info("list requests: %s at paged=%s (paged=%s would need %s)", sum(c.get("pages", 0) for c in parts),
+                PAGE_SIZE, DEFAULT_PAGE_SIZE, sum(list_requests(c["count"], DEFAULT_PAGE_SIZE) for c in parts))
+    return all_items, parts
+
+
+def negotiate_page_size(reprobe: bool = False, session: Optional[requests.Session] = None) -> int:
+    """
+    목록 한 페이지 크기(paged) 결정: 카테고리(호스트+gubn)별 캐시 → 없으면 probe 후 캐시.
+    probe 실패 시 기본값(paged=10)으로 진행하고 캐시하지 않음.
+    """
+    category = f"{urlparse(LIST_TMPL).netloc} gubn=6"
+    if not reprobe:
+        cached = cached_page_size(PAGE_SIZE_CACHE, category)
+        if cached:
+            logger.info("page size: paged=%s (cached for %s in %s)", cached, category, PAGE_SIZE_CACHE)
+            return cached
+
+    own_session = session is None
+    session = session or requests.Session()
+    fetched = {}
+
+    def fetch_links(paged: int, start: int) -> list:
+        if (paged, start) not in fetched:
+            url = LIST_TMPL.format(gyogu=ALL_GYOGU, paged=paged, start=start)
+            fetched[paged, start] = [it["detail_url"] for it in extract_links_from_list_page(fetch(session, url), url)]
+        return fetched[paged, start]
+
+    try:
+        first_url = LIST_TMPL.format(gyogu=ALL_GYOGU, paged=DEFAULT_PAGE_SIZE, start=1)
+        counts = parse_diocese_counts(fetch(session, first_url))
+        total = next((c["count"] for c in counts if c["gyogu"] == ALL_GYOGU), None)
+        probe = probe_page_size(fetch_links, total, logger=logger)
+    except Exception as e:
+        logger.warning("page size probe failed (%s); using paged=%s", e, DEFAULT_PAGE_SIZE)
+        return DEFAULT_PAGE_SIZE
+    finally:
+        if own_session:
+            session.close()
+    store_page_size(PAGE_SIZE_CACHE, category, probe)
+    paged = probe["paged"]
+    logger.info("page size: paged=%s after %s probe requests (tried %s); %s items → ~%s list requests instead of %s",
+                paged, probe["requests"] + 1, probe["tried"], total,
+                list_requests(total or 0, paged), list_requests(total or 0, DEFAULT_PAGE_SIZE))
+    return paged
+
+
+def merge_partition(existing: list, gyogu: str, fresh: list) -> list:
+    """기존 결과에서 해당 교구 항목만 새 결과로 교체"""
+    kept = [it for it in existing if partition_of(it["detail_url"]) != gyogu]
+    return kept + fresh
+
+
+def crawl_incremental(previous: list, workers: int = 4, delay: float = 0.8, session: Optional[requests.Session] = None):
+    """
+    이전 링크 목록 대비 증분 수집.
+    1페이지의 교구별 건수와 1페이지 링크를 이전 결과와 비교:
+    - 변화 없음 → 1페이지 요청만으로 종료
+    - 건수가 달라진 교구만 다시 수집해 교체
+    - 건수는 같지만 1페이지에 모르는 링크가 있으면(위치 불명) 교구 전체 재수집
+    (같은 교구에서 추가 1건 + 삭제 1건이 동시에 일어나면 건수로는 감지되지 않음)
+    끝까지 수집하지 못한 교구(가져오기 오류/건수 미달)는 이전 항목을 그대로 유지하고
+    diff["incomplete_partitions"] 에 기록 → 부분 결과가 삭제(removed)로 잡히지 않음
+    session 을 넘기면 모든 목록 요청이 그 연결 풀을 공유 (닫지 않음)
+    반환: (items, diff)
+    """
+    first_url = LIST_TMPL.format(gyogu=ALL_GYOGU, paged=PAGE_SIZE, start=1)
+    if session is None:
+        with requests.Session() as own:
+            first_html = fetch(own, first_url)
+    else:
+        first_html = fetch(session, first_url)
+    debug_capture.record(page_key(1), first_url, first_html)
+    pages = 1
+
+    advertised = {c["gyogu"]: c["count"] for c in parse_diocese_counts(first_html) if c["gyogu"] != ALL_GYOGU}
+    before = partition_counts(previous)
+    changed = sorted(g for g in set(advertised) | set(before) if advertised.get(g, 0) != before.get(g, 0))
+    known = {it["detail_url"] for it in previous}
+    page1_unknown = [it for it in extract_links_from_list_page(first_html, first_url, logger=logger)
+                     if it["detail_url"] not in known]
+
+    incomplete = []
+    if changed:
+        logger.info("incremental: changed partitions=%s", changed)
+        items = previous
+        with cf.ThreadPoolExecutor(max_workers=max(1, workers)) as ex:
+            futs = {ex.submit(crawl_partition, g, advertised[g], delay, session=session): g
+                    for g in changed if advertised.get(g, 0) > 0}
+            fresh = {g: ([], 0, True) for g in changed}  # 광고 건수 0 → 교구가 비었음(완료)
+            for fut in cf.as_completed(futs):
+                fresh[futs[fut]] = fut.result()
+        for g in changed:
+            part_items, part_pages, complete = fresh[g]
+            pages += part_pages
+            if not complete:
+                incomplete.append(g)
+                continue
+            items = merge_partition(items, g, part_items)
+    elif page1_unknown:
+        logger.warning("incremental: counts unchanged but %s unknown links on page 1; full partitioned crawl",
+                       len(page1_unknown))
+        items, parts = crawl_partitioned(workers=workers, delay=delay, first_html=first_html, session=session)
+        pages += sum(c.get("pages", 0) for c in parts)
+        for c in parts:
+            if not c["complete"]:
+                incomplete.append(c["gyogu"])
+                kept = [it for it in previous if partition_of(it["detail_url"]) == c["gyogu"]]
+                items = merge_partition(items, c["gyogu"], kept)
+    else:
+        logger.info("incremental: no change detected on page 1")
+        items = previous
+
+    diff = link_diff(previous, items)
+    diff.update({"pages_fetched": pages, "changed_partitions": changed,
+                 "incomplete_partitions": sorted(incomplete), "complete": not incomplete})
+    if incomplete:
+        logger.error("incremental: partitions %s not fully collected; their previous items are kept", sorted(incomplete))
+    logger.info("incremental: pages_fetched=%s added=%s removed=%s unchanged=%s",
+                pages, len(diff['added']), len(diff['removed']), diff['unchanged'])
+    return items, diff
+
+
 # -------- Entrypoint (남자 전용 산출물 파일명) --------
 
 def main():
+    global LIST_TMPL, PAGE_SIZE, MAX_RETRIES, BASE_DELAY, debug_capture
+    ap = argparse.ArgumentParser(description="CBCK male consecrated-life list crawler")
+    ap.add_argument("--output", default="cbck_male_links_all.json", help="Output JSON path")
+    ap.add_argument("--partitioned", action="store_true", help="Crawl each diocese (gyogu) in parallel")
+    ap.add_argument("--gyogu", default=None, help="Refresh only this diocese and merge into --output")
+    ap.add_argument("--incremental", action="store_true",
+                    help="Compare with the previous --output, re-crawl only changed dioceses and write a link diff")
+    ap.add_argument("--diff-output", default=None, help="Link diff JSON path (default: <output>.diff.json)")
+    ap.add_argument("--workers", type=int, default=4, help="Parallel partitions")
+    ap.add_argument("--delay", type=float, default=0.8, help="Sleep between list pages (per partition)")
+    ap.add_argument("--max-retries", type=int, default=MAX_RETRIES,
+                    help="Retries per list page on 408/429/5xx and connection errors (Retry-After is honoured)")
+    ap.add_argument("--base-delay", type=float, default=BASE_DELAY, help="Base delay for exponential backoff")
+    ap.add_argument("--base-url", default=None,
+                    help="Crawl another host with the same URL layout (e.g. mock_cbck_server.py at http://127.0.0.1:8800)")
+    ap.add_argument("--log-level", choices=LOG_LEVELS, default="INFO", help="Lowest level recorded (console shows INFO+)")
+    ap.add_argument("--log-json", action="store_true", help="Write the log file as JSON lines")
+    ap.add_argument("--dump-all", action="store_true",
+                    help=f"Write every list page to {DUMP_DIR}/ (default: only the last --debug-keep pages on anomalies)")
+    ap.add_argument("--page-size", type=int, default=0,
+                    help=f"List page size (paged=); 0 = negotiate with the server and cache it in {PAGE_SIZE_CACHE}")
+    ap.add_argument("--reprobe", action="store_true", help="Ignore the cached page size and probe again")
+    ap.add_argument("--debug-keep", type=int, default=8, help="List pages kept (compressed, in memory) for anomaly dumps")
+    ap.add_argument("--metrics-dir", default=None,
+                    help="Write metrics.json / metrics.prom (list request p50/p95/p99, status counts, retries) here")
+    args = ap.parse_args()
+    debug_capture = DebugCapture(DUMP_DIR, keep=args.debug_keep, dump_all=args.dump_all, logger=logger)
+    MAX_RETRIES, BASE_DELAY = args.max_retries, args.base_delay
+    if args.base_url:
+        LIST_TMPL = LIST_TMPL.replace(BASE, args.base_url.rstrip("/"))
+        HEADERS["Referer"] = HEADERS["Referer"].replace(BASE, args.base_url.rstrip("/"))
+    logger.setLevel(args.log_level)
+    if args.log_json:
+        use_json_file_logs(log_listener)
     try:
-        items = crawl_all()
-        out_path = pathlib.Path("cbck_male_links_all.json")
+        PAGE_SIZE = args.page_size or negotiate_page_size(reprobe=args.reprobe)
+        status = 0
+        out_path = pathlib.Path(args.output)
+        if args.gyogu:
+            fresh, parts = crawl_partitioned(workers=1, delay=args.delay, only_gyogu=args.gyogu)
+            expected = sum(c["count"] for c in parts)
+            if len(fresh) < expected or not all(c["complete"] for c in parts):
+                logger.error("gyogu=%s collected %s of %s items; %s left unchanged", args.gyogu, len(fresh),
+                             expected, out_path)
+                return 1
+            existing = json.loads(out_path.read_text(encoding="utf-8")) if out_path.exists() else []
+            items = merge_partition(existing, args.gyogu, fresh)
+            logger.info("gyogu=%s refreshed: %s items (total %s)", args.gyogu, len(fresh), len(items))
+        elif args.incremental:
+            previous = json.loads(out_path.read_text(encoding="utf-8")) if out_path.exists() else []
+            items, diff = crawl_incremental(previous, workers=args.workers, delay=args.delay)
+            status = 0 if diff["complete"] else 1
+            diff_path = pathlib.Path(args.diff_output or out_path.with_suffix(".diff.json"))
+            diff_path.write_text(json.dumps(diff, ensure_ascii=False, indent=2), encoding="utf-8")
+            logger.info("Link diff -> %s", diff_path.resolve())
+        elif args.partitioned:
+            items, parts = crawl_partitioned(workers=args.workers, delay=args.delay)
+            status = 0 if all(c["complete"] for c in parts) else 1
+        else:
+            items = crawl_all(delay=args.delay)
         out_path.write_text(json.dumps(items, ensure_ascii=False, indent=2), encoding="utf-8")
-        logger.info(f"Saved {len(items)} items -> {out_path.resolve()}")
-        logger.info(f"Logs -> {pathlib.Path(log_file).resolve()}")
+        logger.info("Saved %s items -> %s", len(items), out_path.resolve())
+        logger.info("Logs -> %s", pathlib.Path(log_file).resolve())
     except Exception as e:
-        logger.exception(f"Fatal error: {e}")
+        logger.exception("Fatal error: %s", e)
+        return 1
+    finally:
+        if args.metrics_dir:
+            os.makedirs(args.metrics_dir, exist_ok=True)
+            logger.info("Metrics -> %s", metrics.write(args.metrics_dir)[0])
+    return status
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
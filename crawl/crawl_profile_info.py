@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+CBCK clergy/member profile pages → JSON (deduplicated profile crawl)
+
+Role entries parsed by the info parsers (head, sacrament_officer, residents, ...) carry a
+`profile_path`. The same priest shows up in many institutions, so this stage collects every
+profile_path from one or more runs, resolves and deduplicates them, fetches each profile once
+(same cache + pacing as the info parsers) and joins the results back onto the institution records.
+
+Usage:
+  python crawl_profile_info.py --input data/success.jsonl data/convent_success.jsonl --output-dir out_p --cache-dir data/cache
+  python crawl_profile_info.py --input out_m/success.jsonl --output-dir out_p --workers 4 --offline
+
+Outputs (in --output-dir):
+- profiles.jsonl               : one parsed profile per unique profile URL
+- failed.jsonl                 : profile fetch/parse failures
+- institutions_joined.jsonl    : input records with a `profile` object attached to each role entry
+- logs/run.log                 : detailed logs
+"""
+from __future__ import annotations
+import argparse
+import concurrent.futures as cf
+import json
+import logging
+import os
+import sys
+import traceback
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from urllib.parse import urljoin
+
+import requests
+from bs4 import BeautifulSoup
+
+from crawl_common import (
+    LOG_LEVELS, JsonLogFormatter, JsonlWriter, atomic_write, attach_queue_logging, bounded_results, clean_text,
+    dumps_record, extract_ids_from_url, fetch_with_retries, iter_jsonl, normalize_url_key,
+)
+
+# ---------------------- Logging ----------------------
+
+def setup_logging(out_dir: str, level: str = "INFO", json_lines: bool = False) -> logging.Logger:
+    os.makedirs(os.path.join(out_dir, "logs"), exist_ok=True)
+    logger = logging.getLogger("cbck_profile")
+
+    ch = logging.StreamHandler(sys.stdout)
+    ch.setLevel(logging.INFO)
+    ch.setFormatter(logging.Formatter("[%(levelname)s] %(message)s"))
+
+    fh = logging.FileHandler(os.path.join(out_dir, "logs", "run.log"), encoding="utf-8")
+    fh.setLevel(logging.DEBUG)
+    fh.setFormatter(JsonLogFormatter() if json_lines else
+                    logging.Formatter("%(asctime)s %(levelname)s %(name)s %(message)s"))
+
+    attach_queue_logging(logger, [ch, fh], level)
+    return logger
+
+# ---------------------- Frontier (collect + dedupe) ----------------------
+
+def load_records(paths: List[str]) -> List[Dict[str, Any]]:
+    records: List[Dict[str, Any]] = []
+    for path in paths:
+        if path.endswith(".json"):
+            with open(path, "r", encoding="utf-8") as f:
+                records.extend(json.load(f))
+        else:
+            records.extend(iter_jsonl(path))
+    return records
+
+def iter_role_entries(record: Dict[str, Any]) -> Iterable[Dict[str, Any]]:
+    """Every role dict in a record that links to a profile (single roles and repeated ones like residents)."""
+    for value in record.values():
+        entries = value if isinstance(value, list) else [value]
+        for entry in entries:
+            if isinstance(entry, dict) and entry.get("profile_path"):
+                yield entry
+
+def profile_url(record: Dict[str, Any], entry: Dict[str, Any]) -> str:
+    return urljoin(record.get("source_url", ""), entry["profile_path"])
+
+def build_profile_frontier(records: List[Dict[str, Any]]) -> Tuple[List[Dict[str, str]], int]:
+    """Return (unique profiles in first-seen order, number of role occurrences)."""
+    frontier: Dict[str, Dict[str, str]] = {}
+    occurrences = 0
+    for rec in records:
+        for entry in iter_role_entries(rec):
+            occurrences += 1
+            url = profile_url(rec, entry)
+            frontier.setdefault(normalize_url_key(url), {"name": entry.get("name_ko", ""), "url": url})
+    return list(frontier.values()), occurrences
+
+# ---------------------- Parsing ----------------------
+
+def parse_cbck_profile(html: str, url: str) -> Dict[str, Any]:
+    soup = BeautifulSoup(html, "html.parser")
+    item: Dict[str, Any] = {"source_url": url}
+    item.update(extract_ids_from_url(url))
+
+    t = soup.select_one(".today1")
+    if t:
+        item["title"] = clean_text(t.get_text()).strip('"“”')
+
+    for tr in soup.select("table.small_table tr"):
+        tds = tr.find_all("td")
+        if len(tds) < 2:
+            continue
+        label = clean_text(tds[0].get_text())
+        if label:
+            item[label] = clean_text(tds[1].get_text(" ", strip=True))
+    return item
+
+# ---------------------- Worker ----------------------
+
+def worker(idx: int, prof: Dict[str, str], session: requests.Session, args, logger: logging.Logger) -> Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]:
+    res = fetch_with_retries(
+        prof["url"],
+        session=session,
+        max_retries=args.max_retries,
+        base_delay=args.base_delay,
+        timeout=(args.connect_timeout, args.read_timeout),
+        cache_dir=args.cache_dir,
+        logger=logger,
+        negative_ttl=args.negative_ttl,
+        offline=args.offline,
+    )
+    if not res.ok or not res.body:
+        fail = {
+            "index": idx, "name": prof["name"], "url": prof["url"],
+            "status": res.status, "error": res.error or "fetch_failed",
+            "negative_cached": res.negative_cached,
+        }
+        logger.error("[FAIL FETCH] #%s %s : %s (status=%s)", idx, prof['url'], fail['error'], res.status)
+        return None, fail
+    try:
+        parsed = parse_cbck_profile(res.text, prof["url"])
+        parsed["cached"] = res.cached
+        logger.info("[OK] #%s %s", idx, prof['name'])
+        return parsed, None
+    except Exception as e:
+        fail = {
+            "index": idx, "name": prof["name"], "url": prof["url"],
+            "status": res.status, "error": f"parse_error: {e}",
+            "traceback": traceback.format_exc(limit=2),
+        }
+        logger.error("[FAIL PARSE] #%s %s : %s", idx, prof['url'], e)
+        return None, fail
+
+# ---------------------- Join ----------------------
+
+def join_profiles(records: List[Dict[str, Any]], profiles: Dict[str, Dict[str, Any]]) -> int:
+    """Attach `profile` to each role entry in place. Returns the number of entries joined."""
+    joined = 0
+    for rec in records:
+        for entry in iter_role_entries(rec):
+            prof = profiles.get(normalize_url_key(profile_url(rec, entry)))
+            if prof:
+                entry["profile"] = {k: v for k, v in prof.items() if k != "cached"}
+                joined += 1
+    return joined
+
+# ---------------------- Main ----------------------
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="CBCK profile pages (deduplicated) crawler")
+    ap.add_argument("--input", nargs="+", required=True, help="success.jsonl / success.json files of info runs")
+    ap.add_argument("--output-dir", default="out_p", help="Directory to write outputs")
+    ap.add_argument("--cache-dir", default=None, help="HTML cache shared with the info parsers (default: <output-dir>/cache)")
+    ap.add_argument("--workers", type=int, default=6, help="Number of worker threads")
+    ap.add_argument("--max-retries", type=int, default=3, help="Max HTTP retries per URL")
+    ap.add_argument("--base-delay", type=float, default=1.0, help="Base delay for exponential backoff")
+    ap.add_argument("--connect-timeout", type=float, default=5.0, help="TCP connect timeout (seconds)")
+    ap.add_argument("--read-timeout", "--timeout", type=float, default=20.0,
+                    help="Max seconds between bytes of a response (--timeout: old name)")
+    ap.add_argument("--negative-ttl", type=float, default=7 * 24 * 3600,
+                    help="Seconds to remember permanent fetch/parse failures (0 disables)")
+    ap.add_argument("--offline", action="store_true", help="Never hit the network; cache misses become failures")
+    ap.add_argument("--max-inflight", type=int, default=None,
+                    help="Max profiles submitted but not yet collected (default: 2 x workers)")
+    ap.add_argument("--log-level", choices=LOG_LEVELS, default="INFO", help="Lowest level recorded (console shows INFO+)")
+    ap.add_argument("--log-json", action="store_true", help="Write logs/run.log as JSON lines")
+    args = ap.parse_args()
+    args.cache_dir = args.cache_dir or os.path.join(args.output_dir, "cache")
+    args.max_inflight = args.max_inflight or args.workers * 2
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    logger = setup_logging(args.output_dir, args.log_level, args.log_json)
+
+    try:
+        records = load_records(args.input)
+    except Exception as e:
+        print(f"Failed to read input: {e}", file=sys.stderr)
+        return 2
+
+    frontier, occurrences = build_profile_frontier(records)
+    logger.info("Loaded %s institution records: role_occurrences=%s unique_profiles=%s",
+                len(records), occurrences, len(frontier))
+    if not frontier:
+        logger.error("No profile_path found in input.")
+        return 3
+
+    profiles: Dict[str, Dict[str, Any]] = {}
+    ok_cnt = fail_cnt = fetched = 0
+    # profiles.jsonl holds this run only: written next to it, renamed over it when complete
+    profiles_path = os.path.join(args.output_dir, "profiles.jsonl")
+    open(f"{profiles_path}.tmp", "wb").close()  # leftovers of an interrupted run
+    with JsonlWriter(f"{profiles_path}.tmp") as pf, \
+         JsonlWriter(os.path.join(args.output_dir, "failed.jsonl")) as ff:
+        session = requests.Session()
+        with cf.ThreadPoolExecutor(max_workers=args.workers) as ex:
+            results = bounded_results(ex, lambda ip: worker(ip[0], ip[1], session, args, logger),
+                                      enumerate(frontier, start=1), args.max_inflight)
+            for succ, fail in results:
+                if succ:
+                    profiles[normalize_url_key(succ["source_url"])] = succ
+                    pf.write(succ)
+                    ok_cnt += 1
+                    fetched += 0 if succ["cached"] else 1
+                if fail:
+                    ff.write(fail)
+                    fail_cnt += 1
+    os.replace(f"{profiles_path}.tmp", profiles_path)
+
+    joined = join_profiles(records, profiles)
+    joined_path = os.path.join(args.output_dir, "institutions_joined.jsonl")
+    with atomic_write(joined_path, binary=True) as f:
+        for rec in records:
+            f.write(dumps_record(rec))
+
+    logger.info("Done. profiles OK=%s FAIL=%s network_fetches=%s (saved %s duplicate fetches) joined_roles=%s/%s",
+                ok_cnt, fail_cnt, fetched, occurrences - len(frontier), joined, occurrences)
+    logger.info("Outputs:\n  %s\n  %s", profiles_path, joined_path)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,386 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Long-running refresh daemon: incremental crawls on a schedule + targeted Next.js revalidation
+
+Every --interval seconds, for each category (convent gubn=7, monastery gubn=6):
+1. link refresh    : crawl_*_links.crawl_incremental() against the previous links.json
+                     (1 list request when nothing moved, changed dioceses otherwise)
+2. detail refresh  : new links first, then the stalest / most change-prone detail pages
+                     (RefreshHistory priority), at most --budget pages, no submissions past the category's
+                     share of the cycle (the time left is split evenly over the categories still to run)
+3. delta output    : new / changed records and removed links appended to <category>/delta.jsonl;
+                     a link missing from the list is only a removal candidate (removals_pending.json) and
+                     becomes a delete when it is still missing the next cycle, from a fully collected diocese
+                     (a list page that failed mid-diocese never deletes anything)
+4. revalidation    : POST {"path": "/institutions/<slug>"} to --revalidate-url
+                     (src/app/api/revalidate/route.ts) for changed, new and removed institutions only;
+                     failed calls are kept in revalidate_pending.json and retried next cycle
+
+State kept warm across cycles: one HTTP session per category (keep-alive pool shared by the list and detail
+requests; the one-shot scripts' "Connection: close" is dropped for daemon runs), the on-disk cache and
+negative cache, the negotiated list page size, the hedging latency window and the refresh history connection.
+The first cycle without a links.json is a bootstrap: it collects links and records but revalidates nothing.
+
+Usage:
+  python crawl_refresh_daemon.py --output-dir out_daemon --revalidate-url http://localhost:3000/api/revalidate
+  python crawl_refresh_daemon.py --interval 900 --budget 150 --hedge --only monastery
+  python crawl_refresh_daemon.py --base-url http://127.0.0.1:8800 --revalidate-url http://127.0.0.1:8800/api/revalidate \\
+      --interval 60 --cycles 3 --delay 0 --base-delay 0.1   # mock_cbck_server.py stand-in
+
+Outputs (under --output-dir):
+- <category>/links.json            : current detail links (crawl_*_links.py format)
+- <category>/delta.jsonl           : {"op": "upsert", "slug", "cycle", "record"} / {"op": "delete", "slug", "cycle", "source_url"}
+- <category>/failed.jsonl          : fetch/parse failures
+- <category>/removals_pending.json : links gone from the list once, awaiting confirmation next cycle
+- <category>/cache/                : detail page cache (crawl_*_info.py format)
+- <category>/refresh_history.sqlite
+- <category>/metrics.json / .prom  : cumulative since the daemon started
+- <category>/logs/, debug_pages/, list_page_size.json : the link crawler's log, anomaly dumps and page-size cache
+- revalidate_pending.json          : slugs whose revalidation has not succeeded yet
+- logs/daemon.log
+"""
+from __future__ import annotations
+import argparse
+import concurrent.futures as cf
+import json
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Set
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import crawl_common
+import crawl_convent_info as convent_info
+import crawl_convent_links as convent_links
+import crawl_monastery_info as monastery_info
+import crawl_monastery_links as monastery_links
+from crawl_common import (
+    LOG_LEVELS, ByteBudget, HedgePolicy, JsonlWriter, Metrics, RefreshHistory, atomic_write, attach_queue_logging,
+    bounded_results, institution_slug, normalize_url_key, partition_of, until_deadline,
+)
+
+PIPELINES = {
+    "convent": (convent_links, convent_info),
+    "monastery": (monastery_links, monastery_info),
+}
+PENDING_FILE = "revalidate_pending.json"
+
+# ---------------------- Logging ----------------------
+
+def setup_logging(out_dir: str, level: str = "INFO") -> logging.Logger:
+    os.makedirs(os.path.join(out_dir, "logs"), exist_ok=True)
+    logger = logging.getLogger("cbck_daemon")
+
+    ch = logging.StreamHandler(sys.stdout)
+    ch.setLevel(logging.INFO)
+    ch.setFormatter(logging.Formatter("[%(levelname)s] %(message)s"))
+
+    fh = logging.FileHandler(os.path.join(out_dir, "logs", "daemon.log"), encoding="utf-8")
+    fh.setLevel(logging.DEBUG)
+    fh.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s %(message)s"))
+
+    attach_queue_logging(logger, [ch, fh], level)
+    return logger
+
+# ---------------------- Revalidation ----------------------
+
+class Revalidator:
+    """
+    Calls the site's revalidate endpoint once per slug. Slugs that fail stay pending (also on disk,
+    so a restart does not lose them) and are retried on the next flush.
+    """
+
+    def __init__(self, url: Optional[str], pending_path: str, logger: logging.Logger, timeout: float = 10.0):
+        self.url = url
+        self.pending_path = pending_path
+        self.logger = logger
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.pending: Set[str] = set()
+        if os.path.exists(pending_path):
+            with open(pending_path, "r", encoding="utf-8") as f:
+                self.pending = set(json.load(f))
+
+    def add(self, slugs: Set[str]) -> None:
+        self.pending |= slugs
+
+    def flush(self) -> Dict[str, int]:
+        done = failed = 0
+        if self.url:
+            for slug in sorted(self.pending):
+                path = f"/institutions/{slug}"
+                try:
+                    r = self.session.post(self.url, json={"path": path}, timeout=self.timeout)
+                    ok = r.status_code == 200 and r.json().get("revalidated") is True
+                except (requests.RequestException, ValueError) as e:
+                    ok, r = False, e
+                if ok:
+                    self.pending.discard(slug)
+                    done += 1
+                    self.logger.debug("[REVALIDATE] %s", path)
+                else:
+                    failed += 1
+                    self.logger.warning("[REVALIDATE FAIL] %s : %s", path, getattr(r, "status_code", r))
+        elif self.pending:
+            self.logger.info("[REVALIDATE] no --revalidate-url; %s slugs stay pending", len(self.pending))
+        with atomic_write(self.pending_path) as f:
+            json.dump(sorted(self.pending), f, ensure_ascii=False)
+        return {"revalidated": done, "failed": failed, "pending": len(self.pending)}
+
+    def close(self) -> None:
+        self.session.close()
+
+# ---------------------- Pipelines ----------------------
+
+@dataclass
+class Pipeline:
+    """One category (links module + info parser) and the state it keeps warm between cycles."""
+    name: str
+    links: Any
+    info: Any
+    args: argparse.Namespace            # what crawl_*_info.worker() reads (output_dir, cache, timeouts, …)
+    session: requests.Session
+    history: RefreshHistory
+    metrics: Metrics
+    hedge: Optional[HedgePolicy]
+    fresh: Set[str] = field(default_factory=set)  # links added since the bootstrap, not yet fetched
+    removals: Dict[str, Dict[str, Any]] = field(default_factory=dict)  # url key → link item missing once
+
+    @property
+    def links_path(self) -> str:
+        return os.path.join(self.args.output_dir, "links.json")
+
+    @property
+    def removals_path(self) -> str:
+        return os.path.join(self.args.output_dir, "removals_pending.json")
+
+    def close(self) -> None:
+        if self.hedge:
+            self.hedge.shutdown()
+        self.history.close()
+        self.session.close()
+
+def keep_alive_session(pool_size: int) -> requests.Session:
+    """Session whose connection pool holds `pool_size` keep-alive connections per host."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+def configure_links_module(mod, out_dir: str, base_url: Optional[str], page_size: int, reprobe: bool,
+                           session: requests.Session, log_level: str) -> None:
+    """
+    Module-level settings that crawl_*_links.main() would set from its own flags. Its log file, anomaly
+    dumps and page-size cache go under the category's output directory instead of the working directory.
+    """
+    mod.configure_logging(os.path.join(out_dir, "logs"), log_level, os.path.join(out_dir, "debug_pages"))
+    mod.PAGE_SIZE_CACHE = os.path.join(out_dir, "list_page_size.json")
+    if base_url:
+        mod.LIST_TMPL = mod.LIST_TMPL.replace(mod.BASE, base_url.rstrip("/"))
+        mod.HEADERS["Referer"] = mod.HEADERS["Referer"].replace(mod.BASE, base_url.rstrip("/"))
+    mod.HEADERS.pop("Connection", None)  # keep list connections open between cycles
+    mod.PAGE_SIZE = page_size or mod.negotiate_page_size(reprobe=reprobe, session=session)
+
+def make_pipeline(name: str, args, logger: logging.Logger) -> Pipeline:
+    links, info = PIPELINES[name]
+    out_dir = os.path.join(args.output_dir, name)
+    os.makedirs(out_dir, exist_ok=True)
+    session = keep_alive_session(max(args.workers, args.link_workers))
+    configure_links_module(links, out_dir, args.base_url, args.page_size, args.reprobe, session, args.log_level)
+    worker_args = argparse.Namespace(
+        output_dir=out_dir, cache=True, offline=False, refresh=True, negative_ttl=args.negative_ttl,
+        max_retries=args.max_retries, base_delay=args.base_delay,
+        connect_timeout=args.connect_timeout, read_timeout=args.read_timeout,
+    )
+    metrics = Metrics()
+    hedge = HedgePolicy(args.hedge_budget, args.hedge_quantile, max_workers=2 * args.workers,
+                        metrics=metrics) if args.hedge else None
+    logger.info("[%s] page size paged=%s, output %s", name, links.PAGE_SIZE, out_dir)
+    p = Pipeline(name, links, info, worker_args, session,
+                 RefreshHistory(os.path.join(out_dir, "refresh_history.sqlite")), metrics, hedge)
+    if os.path.exists(p.removals_path):
+        with open(p.removals_path, "r", encoding="utf-8") as f:
+            p.removals = json.load(f)
+    return p
+
+def refresh_links(p: Pipeline, args, logger: logging.Logger) -> Dict[str, Any]:
+    previous = []
+    if os.path.exists(p.links_path):
+        with open(p.links_path, "r", encoding="utf-8") as f:
+            previous = json.load(f)
+    items, diff = p.links.crawl_incremental(previous, workers=args.link_workers, delay=args.delay, session=p.session)
+    if items is not previous:
+        with atomic_write(p.links_path) as f:
+            json.dump(items, f, ensure_ascii=False, indent=2)
+    diff["bootstrap"] = not previous
+    diff["items"] = items
+    if not diff.get("complete", True):
+        logger.warning("[%s] partitions %s not fully listed; kept their previous links",
+                       p.name, diff["incomplete_partitions"])
+    return diff
+
+def confirm_removals(p: Pipeline, diff: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Link items to delete this cycle: candidates from the previous cycle that are still missing from the
+    list, unless their diocese was not fully collected this time. This cycle's removals become the new
+    candidates (links that came back are dropped). Candidates are kept on disk across restarts.
+    """
+    current = {normalize_url_key(it["detail_url"]) for it in diff["items"]}
+    incomplete = set(diff.get("incomplete_partitions", []))
+    confirmed, candidates = [], {}
+    for key, it in p.removals.items():
+        if key in current:
+            continue
+        if partition_of(it["detail_url"]) in incomplete:
+            candidates[key] = it
+        else:
+            confirmed.append(it)
+    if not diff["bootstrap"]:
+        for it in diff["removed"]:
+            candidates.setdefault(normalize_url_key(it["detail_url"]), it)
+    p.removals = candidates
+    with atomic_write(p.removals_path) as f:
+        json.dump(p.removals, f, ensure_ascii=False)
+    return confirmed
+
+def run_cycle(p: Pipeline, cycle: int, cycle_end: float, args, logger: logging.Logger) -> Dict[str, Any]:
+    """One incremental crawl of a category; returns counters and the slugs to revalidate."""
+    diff = refresh_links(p, args, logger)
+    slugs: Set[str] = set()
+    delta_path = os.path.join(p.args.output_dir, "delta.jsonl")
+    failed_path = os.path.join(p.args.output_dir, "failed.jsonl")
+    removed = confirm_removals(p, diff)
+    stats = {"links": len(diff["items"]), "added": len(diff["added"]), "removed": len(removed),
+             "removal_pending": len(p.removals), "fetched": 0, "new": 0, "changed": 0, "failed": 0}
+
+    with JsonlWriter(delta_path, metrics=p.metrics) as df, JsonlWriter(failed_path, metrics=p.metrics) as ff:
+        if not diff["bootstrap"]:
+            p.fresh |= {it["detail_url"] for it in diff["added"]}
+            p.fresh -= {it["detail_url"] for it in diff["removed"]}
+        for it in removed:
+            slug = institution_slug(it["detail_url"])
+            slugs.add(slug)
+            df.write({"op": "delete", "slug": slug, "cycle": cycle, "source_url": it["detail_url"]})
+
+        tasks = [p.info.Task(idx=i, name=it.get("name", f"item_{i}"), url=it["detail_url"])
+                 for i, it in enumerate(diff["items"], start=1) if it.get("detail_url", "").startswith("http")]
+        tasks = [t for t, _ in p.history.order(tasks)][:args.budget]
+        budget = ByteBudget(int(args.max_inflight_mb * 1024 * 1024))
+
+        def run_task(t):
+            return p.info.worker(t, p.session, p.args, logger, budget, p.metrics, None, p.hedge)
+
+        with cf.ThreadPoolExecutor(max_workers=args.workers) as ex:
+            for succ, fail in bounded_results(ex, run_task, until_deadline(tasks, cycle_end), 2 * args.workers,
+                                              p.metrics):
+                if fail:
+                    stats["failed"] += 1
+                    ff.write(fail)
+                    if not fail.get("negative_cached"):
+                        p.history.record_failure(fail["url"], fail.get("status", -1), fail.get("error", ""))
+                    continue
+                succ.pop("_provenance", None)  # field statistics are a full-run report (crawl_*_info)
+                url = succ["source_url"]
+                stats["fetched"] += 1
+                known = p.history.known(url)
+                changed = p.history.record_success(url, succ)
+                if known and not changed:
+                    continue
+                slug = institution_slug(url)
+                stats["changed" if known else "new"] += 1
+                if changed or url in p.fresh:
+                    slugs.add(slug)
+                p.fresh.discard(url)
+                df.write({"op": "upsert", "slug": slug, "cycle": cycle, "record": succ})
+
+    p.metrics.write(p.args.output_dir)
+    stats["not_reached"] = len(tasks) - stats["fetched"] - stats["failed"]
+    stats["slugs"] = slugs
+    return stats
+
+# ---------------------- Main ----------------------
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Scheduled incremental CBCK crawls with targeted Next.js revalidation")
+    ap.add_argument("--output-dir", default="out_daemon", help="Per-category state and outputs")
+    ap.add_argument("--only", nargs="+", choices=sorted(PIPELINES), default=None, help="Refresh only these categories")
+    ap.add_argument("--interval", type=float, default=3600.0,
+                    help="Seconds between cycle starts; detail fetches are not submitted past a cycle's end")
+    ap.add_argument("--cycles", type=int, default=0, help="Stop after N cycles (0 = run until SIGINT/SIGTERM)")
+    ap.add_argument("--budget", type=int, default=200, help="Detail pages fetched per category per cycle")
+    ap.add_argument("--revalidate-url", default=None,
+                    help="Next.js revalidate endpoint (POST {path}); without it changed slugs are only kept pending")
+    ap.add_argument("--revalidate-timeout", type=float, default=10.0)
+    ap.add_argument("--base-url", default=None, help="Crawl another host with the same URL layout (mock server)")
+    ap.add_argument("--page-size", type=int, default=0, help="List page size (0 = negotiated/cached)")
+    ap.add_argument("--reprobe", action="store_true", help="Probe the list page size again at startup")
+    ap.add_argument("--delay", type=float, default=0.8, help="Sleep between list pages (per partition)")
+    ap.add_argument("--link-workers", type=int, default=4, help="Parallel partitions for changed dioceses")
+    ap.add_argument("--workers", type=int, default=6, help="Detail fetch threads")
+    ap.add_argument("--max-retries", type=int, default=3)
+    ap.add_argument("--base-delay", type=float, default=1.0, help="Base delay for exponential backoff")
+    ap.add_argument("--connect-timeout", type=float, default=5.0)
+    ap.add_argument("--read-timeout", type=float, default=20.0)
+    ap.add_argument("--negative-ttl", type=float, default=7 * 24 * 3600,
+                    help="Seconds to remember permanent fetch/parse failures (0 disables)")
+    ap.add_argument("--max-inflight-mb", type=float, default=64.0)
+    ap.add_argument("--hedge", action="store_true", help="Hedge slow detail requests (see crawl_*_info.py --hedge)")
+    ap.add_argument("--hedge-budget", type=float, default=0.05)
+    ap.add_argument("--hedge-quantile", type=float, default=0.95)
+    ap.add_argument("--log-level", choices=LOG_LEVELS, default="INFO",
+                    help="Lowest level recorded by the daemon and the link crawlers (console shows INFO+)")
+    args = ap.parse_args()
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    logger = setup_logging(args.output_dir, args.log_level)
+    crawl_common.FETCH_HEADERS.pop("Connection", None)  # detail requests reuse the pipeline's pooled connections
+    stop = threading.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, lambda *_: stop.set())
+
+    pipelines: List[Pipeline] = []
+    revalidator = Revalidator(args.revalidate_url, os.path.join(args.output_dir, PENDING_FILE), logger,
+                              args.revalidate_timeout)
+    try:
+        for name in args.only or list(PIPELINES):
+            pipelines.append(make_pipeline(name, args, logger))
+        cycle = 0
+        while not stop.is_set():
+            cycle += 1
+            started = time.time()
+            cycle_end = started + args.interval
+            for i, p in enumerate(pipelines):
+                if stop.is_set():
+                    break
+                # 남은 시간을 남은 카테고리에 균등 배분 (앞 카테고리가 주기를 다 쓰지 않도록)
+                share_end = time.time() + max(0.0, cycle_end - time.time()) / (len(pipelines) - i)
+                try:
+                    st = run_cycle(p, cycle, share_end, args, logger)
+                except Exception as e:  # 한 주기 실패로 데몬이 죽지 않도록: 다음 주기에 재시도
+                    logger.exception("[CYCLE %s] %s failed: %s", cycle, p.name, e)
+                    continue
+                revalidator.add(st.pop("slugs"))
+                logger.info("[CYCLE %s] %s %s", cycle, p.name, " ".join(f"{k}={v}" for k, v in st.items()))
+            rv = revalidator.flush()
+            logger.info("[CYCLE %s] done in %.1fs revalidated=%s failed=%s pending=%s",
+                        cycle, time.time() - started, rv["revalidated"], rv["failed"], rv["pending"])
+            if args.cycles and cycle >= args.cycles:
+                break
+            stop.wait(max(0.0, cycle_end - time.time()))
+    finally:
+        for p in pipelines:
+            p.close()
+        revalidator.close()
+    logger.info("Stopped.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Static per-institution JSON shards + manifest, so detail pages can be served from files
+
+One document per slug, in the shape of the site's Institution (id, name, slug, description, type, lat, lng,
+address, phone, email, website_url, donation) plus what the crawl knows beyond it (category, diocese, fax,
+roles, source_url). Each is written as canonical JSON and precompressed:
+
+  <output-dir>/<slug>.json, <slug>.json.gz, <slug>.json.br (brotli only when the module is installed)
+  <output-dir>/manifest.json   {"version", "generated_at", "count", "encodings", "shards": {slug: [hash, bytes]}}
+
+hash is the first 16 hex digits of the SHA-256 of the uncompressed document (usable as an ETag or a
+cache-busting query); bytes is its uncompressed size. A shard is rewritten only when its hash changes,
+so unchanged files keep their mtime and CDN copies. Shards of slugs no longer in the inputs are removed
+after the new manifest is in place; a reader that misses a shard falls back to the database.
+
+Inputs (jsonl or JSON array, later lines win per slug): crawl_*_info success.jsonl, crawl_refresh_daemon
+delta.jsonl (delete ops drop the shard) or institution rows already in the site's shape.
+
+Usage:
+  python export_shards.py data/success.jsonl data/convent_success.jsonl --output-dir out_shards
+  python export_shards.py data/*success.jsonl out_daemon/*/delta.jsonl --geocodes geocodes.json --output-dir ../public/institutions
+  python export_shards.py institutions.json --encodings json gz
+"""
+from __future__ import annotations
+import argparse
+import gzip
+import hashlib
+import json
+import logging
+import os
+import sys
+import time
+from typing import Any, Dict, Iterable, List, Tuple
+
+from crawl_common import atomic_write, institution_category, institution_label, record_change, record_roles
+from map_tiles import iter_input, load_geocodes
+
+try:  # optional: .json.br shards
+    import brotli
+except ImportError:
+    brotli = None
+
+ENCODINGS = ("json", "gz", "br")
+HASH_LEN = 16
+
+logger = logging.getLogger("cbck_shards")
+
+# ---------------------- Documents ----------------------
+
+def institution_document(slug: str, rec: Dict[str, Any], geo: Dict[str, Tuple[float, float]]) -> Dict[str, Any]:
+    """Site-shaped document of a crawl record; institution rows (no source_url) pass through."""
+    if "source_url" not in rec:
+        return rec
+    lat, lng = rec.get("lat"), rec.get("lng")
+    if (lat is None or lng is None) and slug in geo:
+        lat, lng = geo[slug]
+    website = rec.get("website")
+    code = rec.get("code") or ""
+    return {
+        "id": int(code) if code.isdigit() else None,
+        "name": institution_label(rec),
+        "slug": slug,
+        "description": None,
+        "type": institution_category(rec),
+        "lat": lat,
+        "lng": lng,
+        "address": rec.get("address"),
+        "phone": rec.get("phone"),
+        "email": rec.get("email"),
+        "website_url": (website.get("href") or website.get("text")) if isinstance(website, dict) else website,
+        "donation": {},
+        "category": institution_category(rec),
+        "diocese": rec.get("diocese") or rec.get("affiliation"),
+        "fax": rec.get("fax"),
+        "roles": record_roles(rec),
+        "source_url": rec.get("source_url"),
+    }
+
+def canonical_bytes(doc: Dict[str, Any]) -> bytes:
+    return json.dumps(doc, ensure_ascii=False, sort_keys=True, separators=(",", ":")).encode("utf-8")
+
+def encode(body: bytes, encoding: str) -> bytes:
+    if encoding == "gz":
+        return gzip.compress(body, compresslevel=9, mtime=0)  # mtime=0: same input, same bytes
+    if encoding == "br":
+        return brotli.compress(body, quality=11)
+    return body
+
+def shard_path(out_dir: str, slug: str, encoding: str) -> str:
+    return os.path.join(out_dir, f"{slug}.json" if encoding == "json" else f"{slug}.json.{encoding}")
+
+def collect(paths: Iterable[str], geo: Dict[str, Tuple[float, float]]) -> Tuple[Dict[str, Dict[str, Any]], int]:
+    docs: Dict[str, Dict[str, Any]] = {}
+    lines = 0
+    for path in paths:
+        for line in iter_input(path):
+            lines += 1
+            if "slug" in line and "op" not in line and "source_url" not in line:
+                op, slug, rec = "upsert", line["slug"], line  # institutions row
+            else:
+                op, slug, rec = record_change(line)
+            if op == "delete":
+                docs.pop(slug, None)
+            elif slug:
+                docs[slug] = institution_document(slug, rec, geo)
+    return docs, lines
+
+# ---------------------- Export ----------------------
+
+def export(docs: Dict[str, Dict[str, Any]], out_dir: str, encodings: List[str]) -> Dict[str, int]:
+    os.makedirs(out_dir, exist_ok=True)
+    manifest_path = os.path.join(out_dir, "manifest.json")
+    previous: Dict[str, List[Any]] = {}
+    prev_encodings: List[str] = []
+    if os.path.exists(manifest_path):
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            old = json.load(f)
+        previous, prev_encodings = old.get("shards", {}), old.get("encodings", [])
+
+    stats = {"shards": len(docs), "written": 0, "unchanged": 0, "removed": 0, "bytes": 0, "bytes_gz": 0}
+    shards: Dict[str, List[Any]] = {}
+    for slug in sorted(docs):
+        body = canonical_bytes(docs[slug])
+        digest = hashlib.sha256(body).hexdigest()[:HASH_LEN]
+        shards[slug] = [digest, len(body)]
+        stats["bytes"] += len(body)
+        fresh = (previous.get(slug, [None])[0] == digest and prev_encodings == encodings
+                 and all(os.path.exists(shard_path(out_dir, slug, e)) for e in encodings))
+        if fresh:
+            stats["unchanged"] += 1
+            continue
+        for enc in encodings:
+            data = encode(body, enc)
+            if enc == "gz":
+                stats["bytes_gz"] += len(data)
+            with atomic_write(shard_path(out_dir, slug, enc), binary=True) as f:
+                f.write(data)
+        stats["written"] += 1
+
+    manifest = {
+        "version": 1,
+        "generated_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "count": len(shards),
+        "encodings": encodings,
+        "shards": shards,
+    }
+    with atomic_write(manifest_path) as f:
+        json.dump(manifest, f, ensure_ascii=False, separators=(",", ":"))
+
+    stale = [(slug, enc) for slug in set(previous) - set(shards) for enc in ENCODINGS]
+    stale += [(slug, enc) for slug in shards for enc in set(prev_encodings) - set(encodings)]
+    for slug, enc in stale:
+        path = shard_path(out_dir, slug, enc)
+        if os.path.exists(path):
+            os.remove(path)
+            stats["removed"] += 1
+    return stats
+
+# ---------------------- Main ----------------------
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Per-slug precompressed JSON shards of the crawled institutions")
+    ap.add_argument("inputs", nargs="+", help="success.jsonl / delta.jsonl / institutions JSON")
+    ap.add_argument("--output-dir", default="out_shards", help="Shard directory (e.g. ../public/institutions)")
+    ap.add_argument("--geocodes", default=None, help="JSON {slug: {lat, lng}} or [{slug, lat, lng}] to join")
+    ap.add_argument("--encodings", nargs="+", choices=ENCODINGS, default=None,
+                    help="Files written per shard (default: json gz, plus br when brotli is installed)")
+    args = ap.parse_args()
+    logging.basicConfig(level=logging.INFO, format="[%(levelname)s] %(message)s")
+
+    encodings = args.encodings or [e for e in ENCODINGS if e != "br" or brotli is not None]
+    if "br" in encodings and brotli is None:
+        ap.error("--encodings br needs the brotli module (pip install brotli)")
+    t0 = time.perf_counter()
+    docs, lines = collect(args.inputs, load_geocodes(args.geocodes))
+    stats = export(docs, args.output_dir, encodings)
+    logger.info("[SHARDS] %s lines → %s shards (%s): written=%s unchanged=%s removed=%s files, "
+                "%.1f KB json%s in %.2fs -> %s", lines, stats["shards"], "/".join(encodings), stats["written"],
+                stats["unchanged"], stats["removed"], stats["bytes"] / 1024,
+                f", {stats['bytes_gz'] / 1024:.1f} KB gz written" if stats["bytes_gz"] else "",
+                time.perf_counter() - t0, os.path.join(args.output_dir, "manifest.json"))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
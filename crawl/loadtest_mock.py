@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+End-to-end throughput / tail-latency harness against mock_cbck_server.py
+
+Starts the mock server (own process, so it does not compete for the crawlers' GIL), then runs
+- crawl_convent_links.py / crawl_monastery_links.py  with --base-url pointed at the mock
+- crawl_convent_info.py  / crawl_monastery_info.py   on the cached link lists rewritten to the mock host
+each in its own work directory, and reports wall time, pages/sec, failures, retries, server-side status
+counts and fetch p50/p95/p99 from each run's metrics.json (list requests for the link crawlers, detail
+pages for the info parsers).
+A link crawl that collects fewer items than the mock's advertised total ('전체 [N]') counts as failed
+even when it exits 0.
+
+Usage:
+  python loadtest_mock.py
+  python loadtest_mock.py --latency lognormal:0.08,0.6 --p429 0.02 --p503 0.01 --drop 0.005 --workers 8 --limit 200
+  python loadtest_mock.py --only convent_info --workers 4 16 --max-retries 5   # sweep worker counts
+"""
+from __future__ import annotations
+import argparse
+import json
+import pathlib
+import shutil
+import socket
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from typing import Any, Dict, List, Optional
+
+from crawl_common import ALL_GYOGU, atomic_write, parse_diocese_counts
+from mock_cbck_server import LIST_PATH
+
+HERE = pathlib.Path(__file__).resolve().parent
+SITE_ROOT = "https://directory.cbck.or.kr"
+
+RUNS = {
+    "convent_links": {"script": "crawl_convent_links.py", "kind": "links", "gubn": "7"},
+    "monastery_links": {"script": "crawl_monastery_links.py", "kind": "links", "gubn": "6"},
+    "convent_info": {"script": "crawl_convent_info.py", "kind": "info", "links": "cbck_convent_links_all.json"},
+    "monastery_info": {"script": "crawl_monastery_info.py", "kind": "info", "links": "cbck_monastery_links_all.json"},
+}
+
+# ---------------------- Mock server ----------------------
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def start_mock(args, port: int) -> subprocess.Popen:
+    cmd = [sys.executable, str(HERE / "mock_cbck_server.py"), "--port", str(port),
+           "--latency", args.latency, "--p429", str(args.p429), "--p503", str(args.p503),
+           "--retry-after", str(args.retry_after), "--drop", str(args.drop)]
+    if args.gzip:
+        cmd.append("--gzip")
+    if args.seed is not None:
+        cmd += ["--seed", str(args.seed)]
+    proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            mock_stats(port)
+            return proc
+        except OSError:
+            time.sleep(0.2)
+    proc.kill()
+    raise RuntimeError("mock server did not come up")
+
+def mock_stats(port: int, reset: bool = False) -> Dict[str, Any]:
+    if reset:
+        req = urllib.request.Request(f"http://127.0.0.1:{port}/__stats/reset", data=b"", method="POST")
+    else:
+        req = urllib.request.Request(f"http://127.0.0.1:{port}/__stats")
+    with urllib.request.urlopen(req, timeout=5) as r:
+        return json.loads(r.read())
+
+def advertised_total(port: int, gubn: str, attempts: int = 20) -> Optional[int]:
+    """'전체 [N]' of the mock's first list page for a category; retried through injected faults."""
+    url = f"http://127.0.0.1:{port}{LIST_PATH}?cgubn=g&gubn={gubn}&gyogu={ALL_GYOGU}&paged=10&start=1"
+    for _ in range(attempts):
+        try:
+            with urllib.request.urlopen(url, timeout=30) as r:
+                html = r.read().decode("utf-8", errors="replace")
+        except (urllib.error.URLError, OSError):
+            time.sleep(0.2)
+            continue
+        return next((c["count"] for c in parse_diocese_counts(html) if c["gyogu"] == ALL_GYOGU), None)
+    return None
+
+# ---------------------- Runs ----------------------
+
+def rewrite_links(src: pathlib.Path, dst: pathlib.Path, base_url: str, limit: Optional[int]) -> int:
+    with open(src, "r", encoding="utf-8") as f:
+        items = json.load(f)
+    if limit:
+        items = items[:limit]
+    for it in items:
+        it["detail_url"] = it["detail_url"].replace(SITE_ROOT, base_url)
+    with open(dst, "w", encoding="utf-8") as f:
+        json.dump(items, f, ensure_ascii=False)
+    return len(items)
+
+def run_one(name: str, spec: Dict[str, str], args, port: int, workers: int, work_root: pathlib.Path) -> Dict[str, Any]:
+    base_url = f"http://127.0.0.1:{port}"
+    work = work_root / f"{name}-w{workers}"
+    if work.exists():
+        shutil.rmtree(work)
+    work.mkdir(parents=True)
+    script = str(HERE / spec["script"])
+
+    pages = advertised = None
+    if spec["kind"] == "links":
+        advertised = advertised_total(port, spec["gubn"])
+        out = work / "links.json"
+        cmd = [sys.executable, script, "--base-url", base_url, "--output", str(out), "--delay", str(args.link_delay),
+               "--max-retries", str(args.max_retries), "--base-delay", str(args.base_delay), "--metrics-dir", str(work)]
+        if args.partitioned:
+            cmd += ["--partitioned", "--workers", str(workers)]
+    else:
+        inp = work / "input.json"
+        pages = rewrite_links(HERE / "data" / spec["links"], inp, base_url, args.limit)
+        cmd = [sys.executable, script, "--input", str(inp), "--mode", "full", "--output-dir", str(work / "out"),
+               "--workers", str(workers), "--max-retries", str(args.max_retries), "--base-delay", str(args.base_delay)]
+
+    mock_stats(port, reset=True)
+    t0 = time.perf_counter()
+    proc = subprocess.run(cmd, cwd=work, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    wall = time.perf_counter() - t0
+    server = mock_stats(port)["counters"]
+
+    result: Dict[str, Any] = {"run": name, "workers": workers, "exit_code": proc.returncode,
+                              "wall_seconds": round(wall, 3), "server": server}
+    metrics_path = work / "metrics.json" if spec["kind"] == "links" else work / "out" / "metrics.json"
+    metrics = json.loads(metrics_path.read_text(encoding="utf-8")) if metrics_path.exists() else {}
+    counters = metrics.get("counters", {})
+    fetch = metrics.get("stages", {}).get("fetch", {})
+    result.update({
+        "retries": counters.get("retries", 0),
+        "fetch_p50_ms": round(fetch.get("p50", 0) * 1000, 1),
+        "fetch_p95_ms": round(fetch.get("p95", 0) * 1000, 1),
+        "fetch_p99_ms": round(fetch.get("p99", 0) * 1000, 1),
+    })
+    if spec["kind"] == "links":
+        items = json.loads(out.read_text(encoding="utf-8")) if out.exists() else []
+        result.update({"items": len(items), "advertised": advertised, "list_pages": server.get("list", 0)})
+        # a crawl that gave up early can still exit 0: anything short of the advertised total fails the run
+        result["shortfall"] = max(0, advertised - len(items)) if advertised is not None else None
+        result["pages_per_sec"] = round(server.get("list", 0) / wall, 2) if wall else 0.0
+    else:
+        result.update({
+            "pages": pages,
+            "ok": counters.get("pages_ok", 0),
+            "failed": counters.get("pages_failed", 0),
+            "pages_per_sec": round(counters.get("pages_ok", 0) / wall, 2) if wall else 0.0,
+        })
+    if proc.returncode:
+        result["stderr_tail"] = proc.stderr[-2000:]
+    return result
+
+def print_row(r: Dict[str, Any]) -> None:
+    s = r["server"]
+    faults = f"429={s.get('status_429', 0)} 503={s.get('status_503', 0)} drop={s.get('dropped', 0)}"
+    latency = f"fetch p50={r['fetch_p50_ms']}ms p95={r['fetch_p95_ms']}ms p99={r['fetch_p99_ms']}ms"
+    if "items" in r:
+        print(f"[LOAD] {r['run']:<16} w={r['workers']:<3} wall={r['wall_seconds']:>7.2f}s "
+              f"list_pages={r['list_pages']} items={r['items']}/{r['advertised']} retries={r['retries']} "
+              f"{r['pages_per_sec']:.1f} pages/s {latency}  {faults}")
+    else:
+        print(f"[LOAD] {r['run']:<16} w={r['workers']:<3} wall={r['wall_seconds']:>7.2f}s "
+              f"ok={r['ok']}/{r['pages']} failed={r['failed']} retries={r['retries']} {r['pages_per_sec']:.1f} pages/s "
+              f"{latency}  {faults}")
+    if r["exit_code"]:
+        print(f"       exit={r['exit_code']}: {r.get('stderr_tail', '').strip().splitlines()[-1:]}")
+    if run_failed(r) and not r["exit_code"]:
+        print(f"       FAILED: {r['shortfall']} of {r['advertised']} advertised items not collected"
+              if r.get("shortfall") else "       FAILED: advertised total unavailable")
+
+def run_failed(r: Dict[str, Any]) -> bool:
+    """Non-zero exit, or a link crawl short of (or unable to check against) the advertised total."""
+    return bool(r["exit_code"]) or ("items" in r and r["shortfall"] != 0)
+
+# ---------------------- Main ----------------------
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Throughput / tail latency of the crawlers against the local mock server")
+    ap.add_argument("--only", nargs="+", choices=sorted(RUNS), default=None, help="Run only these crawlers")
+    ap.add_argument("--workers", type=int, nargs="+", default=[6], help="Worker counts to sweep")
+    ap.add_argument("--limit", type=int, default=None, help="Only the first N detail pages per info parser")
+    ap.add_argument("--max-retries", type=int, default=3)
+    ap.add_argument("--base-delay", type=float, default=0.2, help="Backoff base passed to the crawlers")
+    ap.add_argument("--link-delay", type=float, default=0.0, help="--delay passed to the link crawlers")
+    ap.add_argument("--partitioned", action="store_true", help="Run the link crawlers with --partitioned")
+    ap.add_argument("--latency", default="lognormal:0.05,0.5", help="Mock latency distribution")
+    ap.add_argument("--p429", type=float, default=0.0)
+    ap.add_argument("--p503", type=float, default=0.0)
+    ap.add_argument("--retry-after", type=int, default=1)
+    ap.add_argument("--drop", type=float, default=0.0)
+    ap.add_argument("--gzip", action="store_true")
+    ap.add_argument("--seed", type=int, default=None)
+    ap.add_argument("--work-dir", default="out_loadtest", help="Per-run work directories and report.json")
+    args = ap.parse_args()
+
+    work_root = pathlib.Path(args.work_dir).resolve()
+    work_root.mkdir(parents=True, exist_ok=True)
+    port = free_port()
+    mock = start_mock(args, port)
+    results: List[Dict[str, Any]] = []
+    try:
+        for name in args.only or list(RUNS):
+            for workers in args.workers:
+                r = run_one(name, RUNS[name], args, port, workers, work_root)
+                print_row(r)
+                results.append(r)
+    finally:
+        mock.terminate()
+        mock.wait(timeout=10)
+
+    report_path = work_root / "report.json"
+    with atomic_write(str(report_path)) as f:
+        json.dump({"config": vars(args), "results": results}, f, ensure_ascii=False, indent=2)
+    print(f"Report -> {report_path}")
+    return 1 if any(run_failed(r) for r in results) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
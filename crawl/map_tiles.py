@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Precomputed map tile bundles: bounding-box lookups as static-file reads
+
+Buckets geocoded institutions into Web Mercator XYZ tiles (the grid the map SDKs use) at each --zoom
+and writes one compact JSON bundle per non-empty tile with the fields the map needs:
+
+  <output-dir>/<z>/<x>/<y>.json   {"z", "x", "y", "fields": [id, name, slug, lat, lng, type, address], "rows": [[…], …]}
+  <output-dir>/index.json         {"fields", "zooms", "tiles": {"<z>": {"<x>/<y>": count}}, "bounds", "count", …}
+
+A client turns its bbox (minLng,minLat,maxLng,maxLat, as /api/institutions takes it) into the tile
+range at the nearest zoom, fetches the tiles listed in index.json and filters the rows by the bbox.
+Tiles are rewritten only when their bytes change; index.json is written after the tiles and tiles that
+dropped out are removed after it, so a reader never finds a listed tile missing.
+
+Inputs (jsonl or JSON array, later lines win per slug):
+- crawl_*_info success.jsonl / crawl_refresh_daemon delta.jsonl with lat/lng on the record, or joined
+  from --geocodes ({slug: {lat, lng}} or [{slug, lat, lng}, …])
+- institution rows (id, name, slug, lat, lng, type, address), e.g. an export of public.institutions
+Records without coordinates are skipped and counted.
+
+Usage:
+  python map_tiles.py build data/success.jsonl data/convent_success.jsonl --geocodes geocodes.json
+  python map_tiles.py build institutions.json --output-dir ../public/map-tiles --zooms 7 9 11
+  python map_tiles.py query --bbox 126.8,37.4,127.2,37.7 --zoom 11
+"""
+from __future__ import annotations
+import argparse
+import json
+import logging
+import math
+import os
+import sys
+import time
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from crawl_common import atomic_write, institution_category, institution_label, record_change, tail_jsonl
+
+FIELDS = ["id", "name", "slug", "lat", "lng", "type", "address"]
+DEFAULT_ZOOMS = (7, 9, 11)
+MAX_LAT = 85.05112878  # Web Mercator limit
+
+logger = logging.getLogger("cbck_tiles")
+
+# ---------------------- Tile math ----------------------
+
+def tile_of(lat: float, lng: float, z: int) -> Tuple[int, int]:
+    n = 2 ** z
+    lat = max(-MAX_LAT, min(MAX_LAT, lat))
+    x = int((lng + 180.0) / 360.0 * n)
+    y = int((1.0 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2.0 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+def tiles_for_bbox(bbox: Tuple[float, float, float, float], z: int) -> Iterator[Tuple[int, int]]:
+    """(x, y) of every tile at zoom z that intersects bbox = (minLng, minLat, maxLng, maxLat)."""
+    min_lng, min_lat, max_lng, max_lat = bbox
+    x0, y0 = tile_of(max_lat, min_lng, z)
+    x1, y1 = tile_of(min_lat, max_lng, z)
+    for x in range(x0, x1 + 1):
+        for y in range(y0, y1 + 1):
+            yield x, y
+
+def parse_bbox(spec: str) -> Tuple[float, float, float, float]:
+    try:
+        min_lng, min_lat, max_lng, max_lat = (float(v) for v in spec.split(","))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected minLng,minLat,maxLng,maxLat, got {spec!r}")
+    return min_lng, min_lat, max_lng, max_lat
+
+def in_bbox(lat: float, lng: float, bbox: Tuple[float, float, float, float]) -> bool:
+    return bbox[1] <= lat <= bbox[3] and bbox[0] <= lng <= bbox[2]
+
+# ---------------------- Inputs ----------------------
+
+def iter_input(path: str) -> Iterator[Dict[str, Any]]:
+    with open(path, "rb") as f:
+        head = f.read(64).lstrip()
+    if head.startswith(b"["):
+        with open(path, "r", encoding="utf-8") as f:
+            yield from json.load(f)
+    else:
+        for line, _ in tail_jsonl(path):
+            yield line
+
+def load_geocodes(path: Optional[str]) -> Dict[str, Tuple[float, float]]:
+    if not path:
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    items = data.items() if isinstance(data, dict) else ((d.get("slug"), d) for d in data)
+    return {slug: (float(g["lat"]), float(g["lng"])) for slug, g in items
+            if slug and g.get("lat") is not None and g.get("lng") is not None}
+
+def map_row(slug: str, rec: Dict[str, Any], geo: Dict[str, Tuple[float, float]]) -> Optional[List[Any]]:
+    """[id, name, slug, lat, lng, type, address] of a crawl record or an institutions row; None without coordinates."""
+    lat, lng = rec.get("lat"), rec.get("lng")
+    if (lat is None or lng is None) and slug in geo:
+        lat, lng = geo[slug]
+    if lat is None or lng is None:
+        return None
+    if "source_url" in rec:  # crawl record: id from the CBCK code, type = its category (monastery/convent)
+        code = rec.get("code") or ""
+        return [int(code) if code.isdigit() else None, institution_label(rec), slug, round(float(lat), 6),
+                round(float(lng), 6), institution_category(rec), rec.get("address")]
+    return [rec.get("id"), rec.get("name"), slug, round(float(lat), 6), round(float(lng), 6),
+            rec.get("type"), rec.get("address")]
+
+def collect(paths: Iterable[str], geo: Dict[str, Tuple[float, float]]) -> Tuple[Dict[str, List[Any]], Dict[str, int]]:
+    rows: Dict[str, List[Any]] = {}
+    counts = {"records": 0, "no_coordinates": 0, "deleted": 0}
+    for path in paths:
+        for line in iter_input(path):
+            if "slug" in line and "op" not in line and "source_url" not in line:
+                op, slug, rec = "upsert", line["slug"], line  # institutions row
+            else:
+                op, slug, rec = record_change(line)
+            counts["records"] += 1
+            if op == "delete":
+                counts["deleted"] += rows.pop(slug, None) is not None
+                continue
+            row = map_row(slug, rec, geo)
+            if row is None:
+                counts["no_coordinates"] += 1
+                rows.pop(slug, None)
+            else:
+                rows[slug] = row
+    return rows, counts
+
+# ---------------------- Bundles ----------------------
+
+def tile_path(out_dir: str, z: int, x: int, y: int) -> str:
+    return os.path.join(out_dir, str(z), str(x), f"{y}.json")
+
+def dumps_compact(obj: Any) -> bytes:
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+def write_tiles(rows: Dict[str, List[Any]], out_dir: str, zooms: List[int]) -> Dict[str, Any]:
+    buckets: Dict[Tuple[int, int, int], List[List[Any]]] = {}
+    for slug in sorted(rows):
+        row = rows[slug]
+        for z in zooms:
+            x, y = tile_of(row[3], row[4], z)
+            buckets.setdefault((z, x, y), []).append(row)
+
+    index_path = os.path.join(out_dir, "index.json")
+    previous = set()
+    if os.path.exists(index_path):
+        with open(index_path, "r", encoding="utf-8") as f:
+            for z, tiles in json.load(f).get("tiles", {}).items():
+                previous |= {(int(z),) + tuple(int(v) for v in xy.split("/")) for xy in tiles}
+
+    stats = {"tiles": len(buckets), "written": 0, "unchanged": 0, "removed": 0, "bytes": 0}
+    for (z, x, y), tile_rows in buckets.items():
+        body = dumps_compact({"z": z, "x": x, "y": y, "fields": FIELDS, "rows": tile_rows})
+        stats["bytes"] += len(body)
+        path = tile_path(out_dir, z, x, y)
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                if f.read() == body:
+                    stats["unchanged"] += 1
+                    continue
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with atomic_write(path, binary=True) as f:
+            f.write(body)
+        stats["written"] += 1
+
+    lats, lngs = [r[3] for r in rows.values()], [r[4] for r in rows.values()]
+    index = {
+        "fields": FIELDS,
+        "zooms": zooms,
+        "count": len(rows),
+        "bounds": [min(lngs), min(lats), max(lngs), max(lats)] if rows else None,
+        "tiles": {str(z): {f"{x}/{y}": len(buckets[z, x, y]) for (zz, x, y) in sorted(buckets) if zz == z}
+                  for z in zooms},
+        "generated_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+    os.makedirs(out_dir, exist_ok=True)
+    with atomic_write(index_path) as f:
+        json.dump(index, f, ensure_ascii=False, separators=(",", ":"))
+
+    for z, x, y in previous - set(buckets):
+        path = tile_path(out_dir, z, x, y)
+        if os.path.exists(path):
+            os.remove(path)
+            stats["removed"] += 1
+    return stats
+
+# ---------------------- Lookup ----------------------
+
+def lookup(out_dir: str, bbox: Tuple[float, float, float, float], zoom: Optional[int] = None) -> Tuple[List[Dict[str, Any]], int]:
+    """Rows inside bbox read from the bundles (zoom: nearest available, default the finest); (rows, tiles read)."""
+    with open(os.path.join(out_dir, "index.json"), "r", encoding="utf-8") as f:
+        index = json.load(f)
+    zooms = index["zooms"]
+    z = min(zooms, key=lambda v: abs(v - zoom)) if zoom is not None else max(zooms)
+    present = index["tiles"].get(str(z), {})
+    hits, read = [], 0
+    for x, y in tiles_for_bbox(bbox, z):
+        if f"{x}/{y}" not in present:
+            continue
+        with open(tile_path(out_dir, z, x, y), "r", encoding="utf-8") as f:
+            tile = json.load(f)
+        read += 1
+        hits.extend(dict(zip(tile["fields"], r)) for r in tile["rows"] if in_bbox(r[3], r[4], bbox))
+    return hits, read
+
+# ---------------------- Main ----------------------
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Static XYZ tile bundles of geocoded institutions for bbox lookups")
+    ap.add_argument("--output-dir", default="out_tiles", help="Tile bundle directory (e.g. ../public/map-tiles)")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    bp = sub.add_parser("build", help="Bucket the inputs into tiles and write the changed bundles")
+    bp.add_argument("inputs", nargs="+", help="success.jsonl / delta.jsonl / institutions JSON")
+    bp.add_argument("--geocodes", default=None, help="JSON {slug: {lat, lng}} or [{slug, lat, lng}] to join")
+    bp.add_argument("--zooms", type=int, nargs="+", default=list(DEFAULT_ZOOMS), help="Zoom levels to bundle")
+    qp = sub.add_parser("query", help="Look up a bbox in the written bundles")
+    qp.add_argument("--bbox", type=parse_bbox, required=True, help="minLng,minLat,maxLng,maxLat")
+    qp.add_argument("--zoom", type=int, default=None, help="Map zoom (nearest bundled zoom is used)")
+    qp.add_argument("--json", action="store_true", help="Print the rows as JSON")
+    args = ap.parse_args()
+    logging.basicConfig(level=logging.INFO, format="[%(levelname)s] %(message)s")
+
+    if args.cmd == "build":
+        t0 = time.perf_counter()
+        rows, counts = collect(args.inputs, load_geocodes(args.geocodes))
+        if counts["no_coordinates"]:
+            logger.warning("%s records without coordinates skipped (geocode them or pass --geocodes)",
+                           counts["no_coordinates"])
+        stats = write_tiles(rows, args.output_dir, sorted(set(args.zooms)))
+        logger.info("[TILES] %s institutions → %s tiles at z=%s: written=%s unchanged=%s removed=%s (%.1f KB) in %.2fs",
+                    len(rows), stats["tiles"], sorted(set(args.zooms)), stats["written"], stats["unchanged"],
+                    stats["removed"], stats["bytes"] / 1024, time.perf_counter() - t0)
+        return 0
+
+    if not os.path.exists(os.path.join(args.output_dir, "index.json")):
+        print(f"No tiles in {args.output_dir}; run: map_tiles.py build <inputs>", file=sys.stderr)
+        return 2
+    t0 = time.perf_counter()
+    hits, read = lookup(args.output_dir, args.bbox, args.zoom)
+    elapsed_ms = (time.perf_counter() - t0) * 1000
+    if args.json:
+        print(json.dumps(hits, ensure_ascii=False, indent=2))
+    else:
+        for h in hits:
+            print(f"{h['slug']:<16} {h['lat']:>10.5f} {h['lng']:>11.5f}  {h['name']}")
+    print(f"{len(hits)} institutions from {read} tiles in {elapsed_ms:.1f} ms", file=sys.stderr if args.json else sys.stdout)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,323 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Local mock of directory.cbck.or.kr for offline end-to-end / load testing
+
+Serves the cached corpus under the real URL shapes:
+- /onlineAddress/SearchList.aspx?cgubn=g&gubn=6|7&gyogu=…&paged=…&start=…
+    gyogu=all pages come from the list dumps (debug_pages / debug_pages_male) when present,
+    every other page (dioceses, other page sizes, missing dumps) is rendered from the links JSON
+- /onlineAddress/Catholic/DetailInfo.aspx?…  → cached page of https://directory.cbck.or.kr<same path+query>
+- GET /__stats, POST /__stats/reset          → request/status counters (used by loadtest_mock.py)
+- POST /api/revalidate {path?, tag?}         → stand-in for src/app/api/revalidate/route.ts;
+    paths/tags received are listed under "revalidated" in /__stats (crawl_refresh_daemon.py testing)
+
+Fault injection (per request, independent):
+- --latency fixed:S | uniform:A,B | lognormal:MEDIAN,SIGMA | none
+- --p429 / --p503 : status injection, with a Retry-After header (--retry-after seconds, 0 = omit)
+- --drop          : connection drops (half before the headers, half mid-body)
+- --max-paged     : clamp SearchList paged= (page-size negotiation testing)
+
+Usage:
+  python mock_cbck_server.py --port 8800
+  python mock_cbck_server.py --port 8800 --latency lognormal:0.08,0.6 --p429 0.02 --p503 0.01 --drop 0.005 --gzip
+  python crawl_convent_links.py --base-url http://127.0.0.1:8800 --delay 0
+"""
+from __future__ import annotations
+import argparse
+import gzip
+import html as html_lib
+import json
+import logging
+import math
+import os
+import pathlib
+import random
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+from crawl_common import ALL_GYOGU, decompress_body, md5, partition_of, read_cache_meta
+
+HERE = pathlib.Path(__file__).resolve().parent
+SITE_ROOT = "https://directory.cbck.or.kr"
+LIST_PATH = "/onlineAddress/SearchList.aspx"
+DETAIL_PATH = "/onlineAddress/Catholic/DetailInfo.aspx"
+LIST_START_RE = re.compile(r"^list_start_(\d+)\.html(\.gz)?$")  # .gz: DebugCapture dumps
+SEARCH_LIST_RE = re.compile(r'(<div id="Category_SearchList">)(.*?)(</div>\s*</td>)', re.S)
+
+ITEM_TMPL = """<div>
+<table border="0" cellpadding="0" cellspacing="0" width="710">
+<tr>
+<td style="padding:0px 0px 0px 15px;">
+
+{n}. <strong><a class="today1" href="./Catholic/DetailInfo.aspx?{query}">{name}</a></strong>
+</td>
+</tr>
+</table>
+</div>
+<br/>
+"""
+
+logger = logging.getLogger("cbck_mock")
+
+# ---------------------- Latency / faults ----------------------
+
+def parse_latency(spec: str) -> Callable[[random.Random], float]:
+    """'fixed:0.05' | 'uniform:0.02,0.2' | 'lognormal:0.08,0.6' (median, sigma) | 'none' → sampler (seconds)."""
+    kind, _, params = spec.partition(":")
+    vals = [float(v) for v in params.split(",") if v]
+    if kind == "none":
+        return lambda rng: 0.0
+    if kind == "fixed" and len(vals) == 1:
+        return lambda rng: vals[0]
+    if kind == "uniform" and len(vals) == 2:
+        return lambda rng: rng.uniform(vals[0], vals[1])
+    if kind == "lognormal" and len(vals) == 2:
+        mu = math.log(vals[0])
+        return lambda rng: rng.lognormvariate(mu, vals[1])
+    raise argparse.ArgumentTypeError(f"bad latency spec {spec!r} (fixed:S | uniform:A,B | lognormal:MEDIAN,SIGMA | none)")
+
+# ---------------------- Corpus ----------------------
+
+class Corpus:
+    """Links per gubn (6 = male, 7 = female), list dumps and the detail-page cache."""
+
+    def __init__(self, cache_dir: str, links: Dict[str, str], dump_dirs: Dict[str, str]):
+        self.cache_dir = cache_dir
+        self.links: Dict[str, List[Dict[str, str]]] = {}
+        for gubn, path in links.items():
+            with open(path, "r", encoding="utf-8") as f:
+                self.links[gubn] = json.load(f)
+        self.dumps: Dict[str, Dict[int, bytes]] = {}
+        self.templates: Dict[str, str] = {}
+        for gubn, d in dump_dirs.items():
+            pages = {}
+            for p in pathlib.Path(d).glob("list_start_*.html*"):
+                m = LIST_START_RE.match(p.name)
+                if m:
+                    pages[int(m.group(1))] = gzip.decompress(p.read_bytes()) if m.group(2) else p.read_bytes()
+            self.dumps[gubn] = pages
+            if 1 in pages:
+                self.templates[gubn] = pages[1].decode("utf-8")
+
+    def list_page(self, gubn: str, gyogu: str, start: int, paged: int) -> Optional[bytes]:
+        if gubn not in self.links:
+            return None
+        if gyogu == ALL_GYOGU and paged == 10 and start in self.dumps.get(gubn, {}):
+            return self.dumps[gubn][start]
+        items = self.links[gubn]
+        if gyogu != ALL_GYOGU:
+            items = [it for it in items if partition_of(it["detail_url"]) == gyogu]
+        page = items[max(0, start - 1): max(0, start - 1) + paged]
+        blocks = "".join(
+            ITEM_TMPL.format(n=start + i, query=html_lib.escape(urlparse(it["detail_url"]).query),
+                             name=html_lib.escape(it.get("name", "")))
+            for i, it in enumerate(page)
+        )
+        template = self.templates.get(gubn)
+        if not template:
+            return f'<html><body><div id="Category_SearchList">{blocks}</div></body></html>'.encode("utf-8")
+        return SEARCH_LIST_RE.sub(lambda m: m.group(1) + blocks + m.group(3), template, count=1).encode("utf-8")
+
+    def detail_page(self, path_qs: str) -> Optional[Tuple[bytes, Optional[str], Optional[str]]]:
+        """(body, content-encoding, charset) of the cached page for this path+query."""
+        url = SITE_ROOT + path_qs
+        key = md5(url)
+        body_path = os.path.join(self.cache_dir, f"{key}.body")
+        legacy_path = os.path.join(self.cache_dir, f"{key}.html")
+        if os.path.exists(body_path):
+            meta = read_cache_meta(self.cache_dir, url)
+            with open(body_path, "rb") as f:
+                return f.read(), meta.get("content_encoding"), meta.get("charset")
+        if os.path.exists(legacy_path):
+            with open(legacy_path, "rb") as f:
+                return f.read(), None, "utf-8"
+        return None
+
+# ---------------------- Server ----------------------
+
+class MockState:
+    def __init__(self, corpus: Corpus, args):
+        self.corpus = corpus
+        self.latency = parse_latency(args.latency)
+        self.p429, self.p503, self.drop = args.p429, args.p503, args.drop
+        self.retry_after = args.retry_after
+        self.gzip = args.gzip
+        self.max_paged = args.max_paged
+        self.rng = random.Random(args.seed)
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self.lock:
+            self.started = time.time()
+            self.counters: Dict[str, int] = {}
+            self.revalidated: List[str] = []
+
+    def count(self, key: str) -> None:
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + 1
+
+    def roll(self) -> Tuple[float, float, float]:
+        with self.lock:  # random.Random is not thread-safe
+            return self.latency(self.rng), self.rng.random(), self.rng.random()
+
+    def revalidate(self, targets: List[str]) -> None:
+        with self.lock:
+            self.revalidated.extend(targets)
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            return {"since": self.started, "uptime": round(time.time() - self.started, 3), "counters": dict(self.counters),
+                    "revalidated": list(self.revalidated)}
+
+class Handler(BaseHTTPRequestHandler):
+    server_version = "CBCKMock/1.0"
+    protocol_version = "HTTP/1.1"
+
+    @property
+    def state(self) -> MockState:
+        return self.server.state
+
+    def log_message(self, fmt: str, *args) -> None:
+        logger.debug("%s " + fmt, self.address_string(), *args)
+
+    def _send(self, status: int, body: bytes, content_type: str = "text/html; charset=utf-8",
+              encoding: Optional[str] = None, extra: Optional[Dict[str, str]] = None, cut: bool = False) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        if encoding:
+            self.send_header("Content-Encoding", encoding)
+        for k, v in (extra or {}).items():
+            self.send_header(k, v)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if cut:  # connection drop mid-body
+            self.wfile.write(body[: len(body) // 2])
+            self.wfile.flush()
+            self.close_connection = True
+            return
+        self.wfile.write(body)
+        self.state.count(f"status_{status}")
+
+    def do_POST(self) -> None:
+        if urlparse(self.path).path == "/__stats/reset":
+            self.state.reset()
+            return self._send(200, b'{"ok":true}', "application/json")
+        if urlparse(self.path).path == "/api/revalidate":
+            return self._revalidate()
+        self._send(404, b"not found", "text/plain")
+
+    def _revalidate(self) -> None:
+        """Same contract as the Next.js route: 400 without path/tag, else {"revalidated": true}."""
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            payload = json.loads(self.rfile.read(length) or b"null")
+        except ValueError:
+            payload = None
+        targets = [payload[k] for k in ("path", "tag") if isinstance(payload, dict) and payload.get(k)]
+        self.state.count("revalidate")
+        if not targets:
+            body = {"revalidated": False, "message": "path 또는 tag가 필요합니다."}
+            return self._send(400, json.dumps(body, ensure_ascii=False).encode("utf-8"), "application/json")
+        self.state.revalidate(targets)
+        self._send(200, b'{"revalidated":true}', "application/json")
+
+    def do_GET(self) -> None:
+        st = self.state
+        parsed = urlparse(self.path)
+        if parsed.path == "/__stats":
+            return self._send(200, json.dumps(st.stats()).encode("utf-8"), "application/json")
+
+        delay, fault, drop = st.roll()
+        st.count("requests")
+        if delay > 0:
+            time.sleep(delay)
+        drop_before, drop_mid = drop < st.drop / 2, st.drop / 2 <= drop < st.drop
+        if drop_before:  # close before any byte of the response
+            st.count("dropped")
+            self.close_connection = True
+            return
+        if fault < st.p429 or st.p429 <= fault < st.p429 + st.p503:
+            status = 429 if fault < st.p429 else 503
+            extra = {"Retry-After": str(st.retry_after)} if st.retry_after > 0 else {}
+            return self._send(status, b"busy", "text/plain", extra=extra)
+
+        q = {k: v[0] for k, v in parse_qs(parsed.query, keep_blank_values=True).items()}
+        if parsed.path.lower() == LIST_PATH.lower():
+            st.count("list")
+            paged = int(q.get("paged", "10") or 10)
+            if st.max_paged:
+                paged = min(paged, st.max_paged)
+            body = st.corpus.list_page(q.get("gubn", ""), q.get("gyogu", ALL_GYOGU) or ALL_GYOGU,
+                                       int(q.get("start", "1") or 1), paged)
+            enc, charset = None, "utf-8"
+        elif parsed.path.lower() == DETAIL_PATH.lower():
+            st.count("detail")
+            hit = st.corpus.detail_page(self.path)
+            body, enc, charset = hit if hit else (None, None, None)
+        else:
+            body = None
+        if body is None:
+            return self._send(404, b"not found", "text/plain")
+
+        if enc is None and st.gzip and "gzip" in (self.headers.get("Accept-Encoding") or ""):
+            body, enc = gzip.compress(body), "gzip"
+        elif enc and enc not in (self.headers.get("Accept-Encoding") or ""):
+            body, enc = decompress_body(body, enc), None
+        if drop_mid:
+            st.count("dropped")
+        self._send(200, body, f"text/html; charset={charset or 'utf-8'}", encoding=enc, cut=drop_mid)
+
+def make_server(host: str, port: int, args) -> ThreadingHTTPServer:
+    corpus = Corpus(
+        args.cache_dir,
+        {"7": args.convent_links, "6": args.monastery_links},
+        {"7": args.convent_list_dir, "6": args.monastery_list_dir},
+    )
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    server.state = MockState(corpus, args)
+    return server
+
+def build_arg_parser() -> argparse.ArgumentParser:
+    ap = argparse.ArgumentParser(description="Local mock CBCK server (cached corpus + latency/fault injection)")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8800)
+    ap.add_argument("--cache-dir", default=str(HERE / "data" / "cache"), help="Detail page cache to serve")
+    ap.add_argument("--convent-links", default=str(HERE / "data" / "cbck_convent_links_all.json"))
+    ap.add_argument("--monastery-links", default=str(HERE / "data" / "cbck_monastery_links_all.json"))
+    ap.add_argument("--convent-list-dir", default=str(HERE / "debug_pages"))
+    ap.add_argument("--monastery-list-dir", default=str(HERE / "debug_pages_male"))
+    ap.add_argument("--latency", default="none", help="fixed:S | uniform:A,B | lognormal:MEDIAN,SIGMA | none")
+    ap.add_argument("--p429", type=float, default=0.0, help="Probability of a 429 response")
+    ap.add_argument("--p503", type=float, default=0.0, help="Probability of a 503 response")
+    ap.add_argument("--retry-after", type=int, default=1, help="Retry-After seconds on 429/503 (0 = omit header)")
+    ap.add_argument("--drop", type=float, default=0.0, help="Probability of dropping the connection")
+    ap.add_argument("--gzip", action="store_true", help="gzip responses when the client accepts it")
+    ap.add_argument("--max-paged", type=int, default=0, help="Largest page size honoured (0 = any); larger paged= is clamped")
+    ap.add_argument("--seed", type=int, default=None, help="RNG seed for reproducible fault patterns")
+    return ap
+
+def main() -> int:
+    args = build_arg_parser().parse_args()
+    parse_latency(args.latency)  # validate early
+    logging.basicConfig(level=logging.INFO, format="[%(levelname)s] %(message)s")
+    server = make_server(args.host, args.port, args)
+    logger.info("Mock CBCK on http://%s:%s (latency=%s p429=%s p503=%s drop=%s gzip=%s)",
+                args.host, server.server_address[1], args.latency, args.p429, args.p503, args.drop, args.gzip)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
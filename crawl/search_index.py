@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Local full-text search over the crawl output (SQLite FTS5)
+
+One index row per institution (name_ko, name_en, subunit, address) and one per person named in a role
+(name_ko, name_en, role label), so a lookup finds institutions and residents alike.
+
+Tokenization:
+- unicode61 tokens with prefix queries for Latin/digit terms ("carm" → Carmel, "Rev. Li" → …)
+- Korean: every Hangul run is also stored as overlapping syllable bigrams in a `grams` column, and a
+  Korean term becomes the phrase of its bigrams, so it matches anywhere inside a word
+  ("르멜" → 가르멜, "수녀원" → 서울 수녀원, "베드로" → 김선복 베드로 신부); a single syllable
+  matches as a bigram prefix (surnames: "김")
+
+Incremental: inputs are crawl_*_info success.jsonl and crawl_refresh_daemon delta.jsonl files. Each
+run reads only the bytes appended since the last run (offsets kept in the index), skips records whose
+fingerprint did not change and applies delete ops; a file that shrank is read again from the start.
+
+Usage:
+  python search_index.py index data/success.jsonl data/convent_success.jsonl
+  python search_index.py index out_daemon/*/delta.jsonl            # after each daemon cycle
+  python search_index.py query 가르멜
+  python search_index.py query "베드로 신부" --kind person --limit 5
+  python search_index.py query carmel --json
+  python search_index.py index --rebuild data/*success.jsonl
+"""
+from __future__ import annotations
+import argparse
+import json
+import logging
+import os
+import re
+import sqlite3
+import sys
+import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from crawl_common import (
+    atomic_write, institution_category, institution_label, record_change, record_fingerprint, record_roles, tail_jsonl,
+)
+
+DEFAULT_INDEX = "search_index.sqlite"
+PERSONS_PER_DOC = 4096  # search rowid = doc id * PERSONS_PER_DOC + n (n = 0 institution, 1.. persons)
+
+INDEX_SCHEMA = """
+CREATE TABLE IF NOT EXISTS docs (
+    id          INTEGER PRIMARY KEY,
+    slug        TEXT NOT NULL UNIQUE,
+    category    TEXT,
+    fingerprint TEXT NOT NULL,
+    updated     REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sources (
+    path    TEXT PRIMARY KEY,
+    offset  INTEGER NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS search USING fts5(
+    slug UNINDEXED, kind UNINDEXED, label UNINDEXED,
+    name, name_en, subunit, address, role, grams,
+    tokenize = 'unicode61 remove_diacritics 2'
+);
+"""
+# bm25 weights in column order (slug, kind, label, name, name_en, subunit, address, role, grams)
+BM25_WEIGHTS = (0.0, 0.0, 0.0, 10.0, 5.0, 4.0, 1.0, 2.0, 1.0)
+
+logger = logging.getLogger("cbck_search")
+
+# ---------------------- Tokenization ----------------------
+
+HANGUL_RUN_RE = re.compile(r"[가-힣]+")
+WORD_RE = re.compile(r"[^\W_]+")
+GRAM_BREAK = "0"  # token between runs, so a phrase cannot join the end of one word to the next
+
+def hangul_bigrams(run: str) -> List[str]:
+    return [run] if len(run) < 2 else [run[i:i + 2] for i in range(len(run) - 1)]
+
+def grams_text(*texts: str) -> str:
+    runs = [run for t in texts if t for run in HANGUL_RUN_RE.findall(t)]
+    return f" {GRAM_BREAK} ".join(" ".join(hangul_bigrams(run)) for run in runs)
+
+def match_expression(query: str) -> Optional[str]:
+    """FTS5 MATCH expression: every term must match; Korean by bigram phrase, the rest by token prefix."""
+    clauses = []
+    for term in query.split():
+        for run in HANGUL_RUN_RE.findall(term):
+            if len(run) == 1:
+                clauses.append(f"grams : {run}*")
+            else:
+                clauses.append('grams : "{}"'.format(" ".join(hangul_bigrams(run))))
+        for word in WORD_RE.findall(HANGUL_RUN_RE.sub(" ", term)):
+            clauses.append(f'"{word}"*')
+    return " AND ".join(clauses) or None
+
+# ---------------------- Index ----------------------
+
+def index_rows(slug: str, rec: Dict[str, Any]) -> Iterator[Tuple[Any, ...]]:
+    """(n, slug, kind, label, name, name_en, subunit, address, role, grams) rows of one record."""
+    label = institution_label(rec)
+    name, name_en, sub, addr = (rec.get(k) or "" for k in ("name_ko", "name_en", "subunit", "address"))
+    yield 0, slug, "institution", label, name, name_en, sub, addr, "", grams_text(name, sub, addr)
+    for n, role in enumerate(record_roles(rec)[:PERSONS_PER_DOC - 1], start=1):
+        yield (n, slug, "person", label, role["name_ko"], role.get("name_en", ""), "", "", role["role"],
+               grams_text(role["name_ko"], role["role"]))
+
+class SearchIndex:
+    def __init__(self, path: str):
+        self.conn = sqlite3.connect(path, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(INDEX_SCHEMA)
+
+    def _drop(self, doc_id: int) -> None:
+        self.conn.execute("DELETE FROM search WHERE rowid BETWEEN ? AND ?",
+                          (doc_id * PERSONS_PER_DOC, (doc_id + 1) * PERSONS_PER_DOC - 1))
+
+    def upsert(self, slug: str, rec: Dict[str, Any]) -> bool:
+        """Index rec under slug; False when the stored fingerprint is the same (nothing written)."""
+        fp = record_fingerprint(rec)
+        row = self.conn.execute("SELECT id, fingerprint FROM docs WHERE slug = ?", (slug,)).fetchone()
+        if row and row["fingerprint"] == fp:
+            return False
+        if row:
+            doc_id = row["id"]
+            self._drop(doc_id)
+            self.conn.execute("UPDATE docs SET fingerprint = ?, updated = ? WHERE id = ?", (fp, time.time(), doc_id))
+        else:
+            doc_id = self.conn.execute("INSERT INTO docs (slug, category, fingerprint, updated) VALUES (?, ?, ?, ?)",
+                                       (slug, institution_category(rec), fp, time.time())).lastrowid
+        self.conn.executemany(
+            "INSERT INTO search (rowid, slug, kind, label, name, name_en, subunit, address, role, grams) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [(doc_id * PERSONS_PER_DOC + r[0],) + r[1:] for r in index_rows(slug, rec)],
+        )
+        return True
+
+    def delete(self, slug: str) -> bool:
+        row = self.conn.execute("SELECT id FROM docs WHERE slug = ?", (slug,)).fetchone()
+        if not row:
+            return False
+        self._drop(row["id"])
+        self.conn.execute("DELETE FROM docs WHERE id = ?", (row["id"],))
+        return True
+
+    def ingest(self, path: str) -> Dict[str, int]:
+        """Apply the lines appended to path since the last ingest (one transaction per file)."""
+        counts = {"lines": 0, "indexed": 0, "unchanged": 0, "deleted": 0}
+        key = os.path.abspath(path)
+        row = self.conn.execute("SELECT offset FROM sources WHERE path = ?", (key,)).fetchone()
+        offset = row["offset"] if row else 0
+        if offset > os.path.getsize(path):
+            logger.warning("%s shrank below the stored offset (rewritten?); reading it again", path)
+            offset = 0
+        self.conn.execute("BEGIN")
+        try:
+            for line, offset in tail_jsonl(path, offset):
+                counts["lines"] += 1
+                op, slug, rec = record_change(line)
+                if op == "delete":
+                    counts["deleted"] += self.delete(slug)
+                elif self.upsert(slug, rec):
+                    counts["indexed"] += 1
+                else:
+                    counts["unchanged"] += 1
+            self.conn.execute("INSERT INTO sources (path, offset, updated) VALUES (?, ?, ?) "
+                              "ON CONFLICT(path) DO UPDATE SET offset = excluded.offset, updated = excluded.updated",
+                              (key, offset, time.time()))
+            self.conn.execute("COMMIT")
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        return counts
+
+    def query(self, text: str, limit: int = 20, kind: Optional[str] = None) -> List[Dict[str, Any]]:
+        expr = match_expression(text)
+        if not expr:
+            return []
+        sql = ("SELECT slug, kind, label, name, name_en, address, role, bm25(search, {}) AS score "
+               "FROM search WHERE search MATCH ?").format(", ".join(map(str, BM25_WEIGHTS)))
+        params: List[Any] = [expr]
+        if kind:
+            sql += " AND kind = ?"
+            params.append(kind)
+        sql += " ORDER BY score LIMIT ?"
+        params.append(limit)
+        return [dict(r) for r in self.conn.execute(sql, params)]
+
+    def counts(self) -> Dict[str, int]:
+        rows = self.conn.execute("SELECT kind, count(*) AS n FROM search GROUP BY kind").fetchall()
+        return {r["kind"]: r["n"] for r in rows}
+
+    def optimize(self) -> None:
+        self.conn.execute("INSERT INTO search (search) VALUES ('optimize')")
+
+    def close(self) -> None:
+        self.conn.close()
+
+# ---------------------- Main ----------------------
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="SQLite FTS5 index of the crawled institutions and residents")
+    ap.add_argument("--index", default=DEFAULT_INDEX, help="Index file")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    ip = sub.add_parser("index", help="Add what was appended to the inputs since the last run")
+    ip.add_argument("inputs", nargs="+", help="success.jsonl / delta.jsonl files")
+    ip.add_argument("--rebuild", action="store_true", help="Start from an empty index")
+    ip.add_argument("--optimize", action="store_true", help="Merge the FTS5 segments afterwards")
+    ip.add_argument("--report", default=None, help="Also write the counts as JSON here")
+    qp = sub.add_parser("query", help="Search the index")
+    qp.add_argument("text", help="Words to match (all of them); Korean matches inside words")
+    qp.add_argument("--kind", choices=["institution", "person"], default=None)
+    qp.add_argument("--limit", type=int, default=20)
+    qp.add_argument("--json", action="store_true", help="Print the hits as JSON")
+    args = ap.parse_args()
+    logging.basicConfig(level=logging.INFO, format="[%(levelname)s] %(message)s")
+
+    if args.cmd == "index" and args.rebuild and os.path.exists(args.index):
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(args.index + suffix):
+                os.remove(args.index + suffix)
+    elif args.cmd == "query" and not os.path.exists(args.index):
+        print(f"No index at {args.index}; build it with: search_index.py index <success.jsonl …>", file=sys.stderr)
+        return 2
+    idx = SearchIndex(args.index)
+    try:
+        if args.cmd == "index":
+            report = {}
+            t0 = time.perf_counter()
+            for path in args.inputs:
+                if not os.path.exists(path):
+                    logger.warning("missing input %s", path)
+                    continue
+                report[path] = c = idx.ingest(path)
+                logger.info("[INDEX] %s lines=%s indexed=%s unchanged=%s deleted=%s",
+                            path, c["lines"], c["indexed"], c["unchanged"], c["deleted"])
+            if args.optimize:
+                idx.optimize()
+            logger.info("[INDEX] %s rows=%s in %.2fs", args.index, idx.counts(), time.perf_counter() - t0)
+            if args.report:
+                with atomic_write(args.report) as f:
+                    json.dump({"index": args.index, "inputs": report, "rows": idx.counts()}, f, ensure_ascii=False,
+                              indent=2)
+            return 0
+
+        t0 = time.perf_counter()
+        hits = idx.query(args.text, args.limit, args.kind)
+        elapsed_ms = (time.perf_counter() - t0) * 1000
+        if args.json:
+            print(json.dumps({"query": args.text, "ms": round(elapsed_ms, 2), "hits": hits}, ensure_ascii=False,
+                             indent=2))
+        else:
+            for h in hits:
+                who = f"{h['role']}: {h['name']}" + (f" ({h['name_en']})" if h["name_en"] else "") \
+                    if h["kind"] == "person" else h["address"]
+                print(f"{h['slug']:<16} {h['kind']:<11} {h['label']}  | {who}")
+            print(f"{len(hits)} hits in {elapsed_ms:.1f} ms")
+        return 0
+    finally:
+        idx.close()
+
+if __name__ == "__main__":
+    sys.exit(main())